@@ -1,18 +1,29 @@
 import os
-from flask import Flask, render_template
+import atexit
+
+# 起動時間の計測は他の import より先に始める
+from utils.startup_profile import startup_profile
+from flask import Flask, jsonify, request, stream_template, url_for
 from dotenv import load_dotenv
 
+from bot_instance import line_dispatcher
 from services.history import HistoryService
 from services.economy import EconomyService
-from services.gsheet import GSheetService
 from services.shop import ShopService
 from services.job import JobService
-from handlers import study
+from services.session_timeouts import session_timeouts
+from services.transaction_index import transaction_index
+from services.sync import SheetSyncService
+from services.warmup import WarmupService
+from utils.lazy_module import LazyModule
+from utils.template_loader import preload_templates
 
 # Import Blueprints
-from blueprints.bot import bot_bp
+from blueprints.bot import bot_bp, load_handlers
 from blueprints.web import web_bp
 
+study = LazyModule("handlers.study")
+
 load_dotenv()
 
 app = Flask(__name__, template_folder="templates/html")
@@ -21,43 +32,106 @@ app = Flask(__name__, template_folder="templates/html")
 app.register_blueprint(bot_bp)
 app.register_blueprint(web_bp)
 
+# 終了時に送信待ちの通知を送り切る
+atexit.register(line_dispatcher.stop)
+
+# Flex テンプレートは起動時にまとめてコンパイルしておく
+preload_templates()
+
+# ローカルストア(SQLite)の変更をバックグラウンドでシートへ書き戻す
+if os.environ.get("STORAGE_BACKEND", "gsheet").lower() == "sqlite":
+    SheetSyncService.start()
+    atexit.register(SheetSyncService.stop)
+
+# 学習セッションの90分タイムアウトを期限ちょうどに処理する
+# （handlers.study は実際にタイムアウトを処理するときに読み込む）
+if os.environ.get("SESSION_TIMEOUT_SCHEDULER", "1") != "0":
+    session_timeouts.start(lambda sessions: study.process_timeout_sessions(sessions))
+    atexit.register(session_timeouts.stop)
+
+# 最初のリクエストと並行して、シートへの接続とよく読むデータの読み込みを済ませておく
+if os.environ.get("STARTUP_WARMUP", "0") == "1":
+    WarmupService.start(load_handlers)
+
+startup_profile.mark("app ready")
+print(f"Startup: app ready in {startup_profile.elapsed():.2f}s")
+
+
+@app.before_request
+def mark_first_request():
+    startup_profile.mark("first request")
+
 
 @app.route("/")
 def wake_up():
     return "I am awake! Saga Guardian Active", 200
 
 
+@app.route("/debug/startup")
+def debug_startup():
+    # 起動からの経過（import・シート接続・最初のリクエストなど）。
+    # STARTUP_PROFILE=1 で起動した場合はモジュールごとの import 時間も含む
+    return jsonify(startup_profile.report())
+
+
 @app.route("/cron/check_timeout")
 def cron_check_timeout():
-    # タイムアウトしたセッションを確認
-    expired_sessions = GSheetService.check_timeout_sessions(timeout_minutes=90)
-
+    # 通常は session_timeouts のスレッドが期限ちょうどに処理するので、ここは取りこぼし対策
+    # （処理済みのセッションは対象にならないので何度呼んでもよい）
+    expired_sessions = session_timeouts.run_once(
+        study.process_timeout_sessions, timeout_minutes=90
+    )
     if expired_sessions:
-        # 通知と状態更新
-        study.process_timeout_sessions(expired_sessions)
         return f"Processed {len(expired_sessions)} sessions.", 200
 
     return "No expired sessions.", 200
 
 
-@app.route("/admin/dashboard")
-def admin_dashboard():
-    # 本来は認証が必要だが、簡易的にURLを知っている人のみアクセス可能とする
-    # もしくはクエリパラメータで ?key=secret_key のように簡易認証を入れても良い
+@app.route("/cron/verify_ledger")
+def cron_verify_ledger():
+    # 台帳から全員の残高を計算し直し、チェックポイントとの食い違いを報告する
+    result = EconomyService.verify_balances()
+    for m in result["mismatches"]:
+        print(f"Ledger Mismatch: {m}")
+    return (
+        f"Verified {len(result['balances'])} users, "
+        f"{len(result['mismatches'])} mismatches.",
+        200,
+    )
+
+
+@app.route("/cron/sync_sheets")
+def cron_sync_sheets():
+    # バックグラウンド同期の取りこぼし対策（外部cronからも叩けるようにする）
+    sent = SheetSyncService.flush()
+    return f"Synced {sent} changes.", 200
+
+
+# 管理画面の1ページの件数
+DASHBOARD_PAGE_SIZE = int(os.environ.get("DASHBOARD_PAGE_SIZE", "50"))
 
-    transactions = HistoryService.get_all_transactions()
 
-    # ユーザーIDを名前に変換
-    users = EconomyService.get_all_users()
-    user_map = {str(u["user_id"]): u["display_name"] for u in users}
+def _describe_transactions(transactions):
+    """表示するページの取引だけ、ユーザー名と内容を解決しながら1件ずつ返す"""
+    related = [str(tx.get("related_id", "")) for tx in transactions]
 
-    # 詳細情報解決用のマップ
-    job_map = JobService.get_all_jobs_map()
-    shop_items = ShopService.get_items()
+    # 詳細情報解決用のマップ（そのページで必要なものだけ取得）
+    job_map = (
+        JobService.get_all_jobs_map()
+        if any(r.startswith("JOB_") for r in related)
+        else {}
+    )
+    shop_items = (
+        ShopService.get_items() if any(r.startswith("BUY_") for r in related) else {}
+    )
+    user_names = {}
 
     for tx in transactions:
         uid = str(tx.get("user_id"))
-        tx["user_name"] = user_map.get(uid, uid[:4])
+        if uid not in user_names:
+            user = EconomyService.get_user_info(uid)
+            user_names[uid] = user["display_name"] if user else uid[:4]
+        tx["user_name"] = user_names[uid]
 
         # 取引内容の解決
         rtype = tx.get("tx_type")
@@ -80,8 +154,46 @@ def admin_dashboard():
             desc = "↩️ 返金"
 
         tx["description"] = desc
+        yield tx
+
+
+@app.route("/admin/dashboard")
+def admin_dashboard():
+    # 本来は認証が必要だが、簡易的にURLを知っている人のみアクセス可能とする
+    # もしくはクエリパラメータで ?key=secret_key のように簡易認証を入れても良い
 
-    return render_template("admin_dashboard.html", transactions=transactions)
+    # 絞り込み条件 (?user=&type=&from=YYYY-MM-DD&to=YYYY-MM-DD) と次ページのカーソル
+    filters = {
+        key: request.args.get(key, "").strip() for key in ("user", "type", "from", "to")
+    }
+    transactions, next_cursor = HistoryService.get_transactions_page(
+        cursor=request.args.get("cursor"),
+        limit=DASHBOARD_PAGE_SIZE,
+        user_id=filters["user"] or None,
+        tx_type=filters["type"] or None,
+        date_from=filters["from"] or None,
+        date_to=filters["to"] or None,
+    )
+
+    next_url = None
+    if next_cursor:
+        next_url = url_for(
+            "admin_dashboard",
+            cursor=next_cursor,
+            **{k: v for k, v in filters.items() if v},
+        )
+
+    # 行を描画しながら送り出す
+    return app.response_class(
+        stream_template(
+            "admin_dashboard.html",
+            transactions=_describe_transactions(transactions),
+            filters=filters,
+            tx_types=transaction_index.types(),
+            next_url=next_url,
+            first_page=not request.args.get("cursor"),
+        )
+    )
 
 
 if __name__ == "__main__":
@@ -1,33 +1,139 @@
+import os
 from flask import Blueprint, request, abort
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, PostbackEvent
-from bot_instance import handler
+from bot_instance import parser
 from utils.debouncer import Debouncer
-
-# Handlers imply logic registration on import
-from handlers import study, shop, job, admin, status, common, help, gacha, mission
+from utils.keyed_executor import KeyedExecutor
+from utils.request_context import RequestContext
+from services.gsheet import GSheetService
+from services.state_store import StateMap
+from utils.lazy_module import LazyModule
+from utils.startup_profile import startup_profile
+
+# ハンドラのモジュールは最初のイベントを振り分けるときに読み込む（起動を速くするため）
+common = LazyModule("handlers.common")
+help = LazyModule("handlers.help")
+study = LazyModule("handlers.study")
+shop = LazyModule("handlers.shop")
+job = LazyModule("handlers.job")
+mission = LazyModule("handlers.mission")
+admin = LazyModule("handlers.admin")
+status = LazyModule("handlers.status")
+gacha = LazyModule("handlers.gacha")
 
 bot_bp = Blueprint("bot", __name__)
 
+# {(イベントの型, メッセージの型 or None): 関数}。on() で登録する
+_event_handlers = {}
+
+# Webhook イベントの処理スレッド（同じユーザーのイベントは届いた順に1つずつ処理する）
+# WEBHOOK_WORKERS=0 ならリクエストの中で同期的に処理する
+webhook_executor = KeyedExecutor(
+    max_workers=int(os.environ.get("WEBHOOK_WORKERS", "4")),
+    max_pending=int(os.environ.get("WEBHOOK_MAX_PENDING", "1000")),
+    name="webhook",
+)
+
+# 受け取った webhookEventId（LINE の再送を処理済みのイベントとして捨てるため）
+# 再送は再起動やワーカーをまたいで届くので、既定で SQLite に置いて共有する
+received_events = StateMap(
+    "webhook_events",
+    ttl=int(os.environ.get("WEBHOOK_DEDUPE_TTL", "86400")),
+    backend=os.environ.get("WEBHOOK_DEDUPE_BACKEND", "sqlite"),
+)
+
 
 @bot_bp.route("/callback", methods=["POST"])
 def callback():
+    startup_profile.mark("first webhook")
     signature = request.headers["X-Line-Signature"]
     body = request.get_data(as_text=True)
     try:
-        handler.handle(body, signature)
+        payload = parser.parse(body, signature, as_payload=True)
     except InvalidSignatureError:
         abort(400)
+
+    # 署名を確認したらキューに積んですぐ 200 を返す（LINE の再送を防ぐ）
+    for event in payload.events:
+        if _is_duplicate(event):
+            continue
+        key = _event_key(event)
+        if not webhook_executor.submit(key, process_event, event):
+            # キューが一杯（または同期モード）のときはその場で処理する
+            process_event(event)
     return "OK"
 
 
-@handler.add(PostbackEvent)
+def load_handlers():
+    """ハンドラのモジュールをまとめて読み込む（起動時のウォームアップ用）"""
+    for module in (common, help, study, shop, job, mission, admin, status, gacha):
+        module.load()
+
+
+def _is_duplicate(event):
+    """既に受け取ったイベントの再送なら True（webhookEventId で判定）"""
+    event_id = getattr(event, "webhook_event_id", None)
+    if not event_id:
+        return False
+    if received_events.claim(event_id):
+        return False
+    context = getattr(event, "delivery_context", None)
+    redelivery = getattr(context, "is_redelivery", None)
+    print(f"Duplicate Event Skipped: {event_id} (redelivery={redelivery})")
+    return True
+
+
+def _event_key(event):
+    source = getattr(event, "source", None)
+    for attr in ("user_id", "group_id", "room_id"):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return "_"
+
+
+def on(event_type, message=None):
+    """イベント（MessageEvent はメッセージの型も）に対応するハンドラを登録する"""
+
+    def decorator(func):
+        _event_handlers[(event_type, message)] = func
+        return func
+
+    return decorator
+
+
+def process_event(event):
+    """
+    1イベントを登録済みのハンドラに渡す。
+    MessageEvent はメッセージの型まで一致するものを優先し、なければイベントの型だけで探す
+    （WebhookHandler.handle と同じ振り分け）。
+    """
+    func = None
+    if isinstance(event, MessageEvent):
+        func = _event_handlers.get((type(event), type(event.message)))
+    if func is None:
+        func = _event_handlers.get((type(event), None))
+    if func is None:
+        return
+
+    try:
+        # 1イベントの間はシートやユーザー情報の読み込み結果を共有し、
+        # セル更新はイベント処理の最後にまとめて1回で書き込む
+        with RequestContext.scope(), GSheetService.write_buffer():
+            func(event)
+    except Exception as e:
+        print(f"Event Handling Error: {e}")
+    startup_profile.mark("first event handled")
+
+
+@on(PostbackEvent)
 def handle_postback(event):
     user_id = event.source.user_id
     data_str = event.postback.data
 
-    # 連打防止 (5秒間)
-    if Debouncer.is_locked(user_id, data_str):
+    # 連打防止 (5秒間)。LINE の再送は callback で webhookEventId により除外済み
+    if Debouncer.is_locked(user_id, data_str, kind="postback"):
         return
 
     # data="action=buy&item=game_30" のような文字列が来るので分解
@@ -61,13 +167,13 @@ def handle_postback(event):
     print(f"Unhandled Postback: {action}")
 
 
-@handler.add(MessageEvent, message=TextMessage)
+@on(MessageEvent, message=TextMessage)
 def handle_message(event):
     msg = event.message.text
     user_id = event.source.user_id
 
     # 連打防止 (メッセージも3秒間ロック)
-    if Debouncer.is_locked(user_id, msg):
+    if Debouncer.is_locked(user_id, msg, kind="message"):
         return
 
     # グループ判定
@@ -8,10 +8,13 @@ from services.economy import EconomyService
 from services.history import HistoryService
 from services.status_service import StatusService
 from services.stats import SagaStats
-from bot_instance import line_bot_api
+from bot_instance import line_bot_api, line_dispatcher
 from utils.template_loader import load_template
 from linebot.models import FlexSendMessage
-from handlers import study
+from utils.lazy_module import LazyModule
+
+# 科目の色だけ使うので、最初に参照したときに読み込む
+study = LazyModule("handlers.study")
 
 web_bp = Blueprint("web", __name__)
 
@@ -238,7 +241,7 @@ def api_start_study():
                     start_time=current_time,
                     color=color,
                 )
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     user_id,
                     FlexSendMessage(alt_text="勉強中...", contents=bubble),
                 )
@@ -281,13 +284,9 @@ def api_finish_study():
         # メモを保存
         try:
             # study_logの該当行にmemoカラムがあれば書き込む
-            sheet = GSheetService.get_worksheet("study_log")
-            if sheet:
-                headers = sheet.row_values(1)
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-                idx_memo = col_map.get("memo")
-                if idx_memo is not None:
-                    sheet.update_cell(result["row_index"], idx_memo + 1, memo)
+            GSheetService.update_fields(
+                "study_log", result["row_index"], {"memo": memo}
+            )
         except Exception as e:
             print(f"Memo保存エラー: {e}")
 
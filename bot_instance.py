@@ -1,11 +1,22 @@
 import os
-from linebot import LineBotApi, WebhookHandler
+from linebot import LineBotApi, WebhookParser
 from dotenv import load_dotenv
+from utils.line_dispatcher import LineDispatcher
 
 load_dotenv()
 
 LINE_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_SECRET = os.environ.get("LINE_CHANNEL_SECRET")
 
-line_bot_api = LineBotApi(LINE_ACCESS_TOKEN)
-handler = WebhookHandler(LINE_SECRET)
+# LINE_API_ENDPOINT でローカルのスタブ (utils/line_api_stub.py) に向けられる
+LINE_API_ENDPOINT = os.environ.get("LINE_API_ENDPOINT", "https://api.line.me")
+
+line_bot_api = LineBotApi(LINE_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT)
+# 署名の確認とイベントの解析だけに使う（振り分けは blueprints/bot.py で行う）
+parser = WebhookParser(LINE_SECRET)
+
+# 通知 (push / multicast) は裏のスレッドでまとめて送る。
+# 再送用の X-Line-Retry-Key を api のヘッダーに載せるので、送信専用の LineBotApi を使う
+line_dispatcher = LineDispatcher(
+    LineBotApi(LINE_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT)
+)
@@ -7,19 +7,20 @@ from linebot.models import (
     QuickReplyButton,
     PostbackAction,
 )
-from bot_instance import line_bot_api
+from bot_instance import line_bot_api, line_dispatcher
 from services.economy import EconomyService
 from services.approval import ApprovalService
 from services.shop import ShopService
 from services.job import JobService
 from services.mission import MissionService
+from services.state_store import StateMap
 from utils.template_loader import load_template
 from handlers import common
 
 
 # 管理者の操作状態を保持する辞書
 # Key: admin_user_id, Value: {"state": "WAITING_...", "data": {...}}
-admin_states = {}
+admin_states = StateMap("admin")
 
 
 def handle_postback(event, action, data):
@@ -82,7 +83,7 @@ def handle_postback(event, action, data):
 
             # 対象者へ通知
             try:
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     target_user_id,
                     TextSendMessage(
                         text=f"🎖 特別な勲章を授与されました！\nステータス画面を確認してみよう！"
@@ -185,7 +186,7 @@ def handle_postback(event, action, data):
 
             # Notify User
             try:
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     target_id,
                     TextSendMessage(
                         text=f"🎉 ミッション「{title}」が承認されました！\n報酬 {reward} pt と勲章を獲得しました！"
@@ -212,7 +213,7 @@ def handle_postback(event, action, data):
             )
             # Notify User
             try:
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     target_id,
                     TextSendMessage(
                         text="⚠️ ミッションの完了報告が却下されました。\n内容を確認して再挑戦してください。"
@@ -306,7 +307,7 @@ def handle_message(event, text):
                         ]
                         if target_ids:
                             try:
-                                line_bot_api.multicast(
+                                line_dispatcher.multicast(
                                     target_ids,
                                     TextSendMessage(
                                         text=f"🆕 新しいお手伝いが追加されました！\n\n「{title}」\n報酬: {reward} pt\n\n早い者勝ちだよ！"
@@ -384,7 +385,7 @@ def handle_message(event, text):
                     )
                     # ユーザーへ通知
                     try:
-                        line_bot_api.push_message(
+                        line_dispatcher.push_message(
                             target_id,
                             TextSendMessage(
                                 text=f"📜 新しいミッションが届きました！\n\n「{title}」\n報酬: {reward} pt\n\n達成条件:\n{description}\n\n「ミッション」と入力して確認しよう！"
@@ -642,7 +643,7 @@ def handle_message(event, text):
 
                 if target_ids:
                     try:
-                        line_bot_api.multicast(
+                        line_dispatcher.multicast(
                             target_ids,
                             TextSendMessage(
                                 text=f"🆕 新しいお手伝いが追加されました！\n\n「{title}」\n報酬: {reward} pt\n\n早い者勝ちだよ！"
@@ -860,6 +861,48 @@ def handle_message(event, text):
                 )
             return True
 
+        if text == "一括承認":
+            if not EconomyService.is_admin(user_id):
+                line_bot_api.reply_message(
+                    event.reply_token, TextSendMessage(text="権限がありません。")
+                )
+                return True
+
+            pending_items = ApprovalService.get_all_pending()
+            if not pending_items:
+                line_bot_api.reply_message(
+                    event.reply_token,
+                    TextSendMessage(text="現在、承認待ちの項目はありません。"),
+                )
+                return True
+
+            results = ApprovalService.approve_many(pending_items)
+            approved = [r for r in results if r["ok"]]
+            failed = len(results) - len(approved)
+
+            summary = f"✅ {len(approved)}件を一括承認しました。"
+            if failed:
+                summary += f"\n⚠️ {failed}件は承認できませんでした。"
+            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=summary))
+
+            # ユーザーごとに獲得ポイントをまとめて通知
+            rewards = {}
+            for r in approved:
+                target_id = r["data"].get("user_id")
+                if target_id and r.get("reward"):
+                    rewards[target_id] = rewards.get(target_id, 0) + r["reward"]
+            for target_id, total in rewards.items():
+                try:
+                    line_dispatcher.push_message(
+                        target_id,
+                        TextSendMessage(
+                            text=f"🎉 申請が承認されました！\n合計 {total} pt を獲得しました！"
+                        ),
+                    )
+                except:
+                    pass
+            return True
+
         if text in ["承認確認", "承認"]:
             if not EconomyService.is_admin(user_id):
                 line_bot_api.reply_message(
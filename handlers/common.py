@@ -1,15 +1,16 @@
 from linebot.models import TextSendMessage, FlexSendMessage
 from bot_instance import line_bot_api
 from services.economy import EconomyService
+from services.state_store import StateMap
 from utils.template_loader import load_template
 import random
 
 # 簡易的な状態管理
-user_states = {}
+user_states = StateMap("common")
 
 # ユーザーセッション管理 (LINE User ID -> App User ID)
 # { "U_line_id": "U_app_user_id" }
-ACTIVE_SESSIONS = {}
+ACTIVE_SESSIONS = StateMap("active_sessions")
 
 
 def get_current_user_id(line_user_id):
@@ -1,13 +1,14 @@
 from linebot.models import TextSendMessage, FlexSendMessage
-from bot_instance import line_bot_api
+from bot_instance import line_bot_api, line_dispatcher
 from services.job import JobService
 from services.economy import EconomyService
+from services.state_store import StateMap
 from utils.template_loader import load_template
 from handlers import common
 import datetime
 
 # 簡易的な状態管理
-user_states = {}
+user_states = StateMap("job")
 
 
 def send_job_list(reply_token, user_id):
@@ -127,7 +128,7 @@ def handle_postback(event, action, data):
                 admin_ids = [u["user_id"] for u in admins if u.get("user_id")]
 
                 if admin_ids:
-                    line_bot_api.multicast(
+                    line_dispatcher.multicast(
                         admin_ids,
                         TextSendMessage(
                             text=f"🔔 {user_name} が「{result}」を受注しました！"
@@ -181,7 +182,7 @@ def handle_postback(event, action, data):
             target_id = data.get("target")
             if target_id:
                 try:
-                    line_bot_api.push_message(
+                    line_dispatcher.push_message(
                         target_id,
                         TextSendMessage(
                             text=f"😢 お手伝い「{result}」が却下されちゃった…\n担当：{approver_name}\n内容を確認して、もう一回報告してみて！"
@@ -235,7 +236,7 @@ def handle_postback(event, action, data):
                     if u.get("user_id") and str(u["user_id"]) != str(user_id)
                 ]
                 if other_admin_ids:
-                    line_bot_api.multicast(
+                    line_dispatcher.multicast(
                         other_admin_ids,
                         TextSendMessage(
                             text=f"🔔 {approver_name}さんが{worker_name}のお手伝い「{result['title']}」を承認しました。"
@@ -250,7 +251,7 @@ def handle_postback(event, action, data):
                 if request_time:
                     msg_text += f"\n申請時刻：{request_time}"
 
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     worker_id,
                     TextSendMessage(text=msg_text),
                 )
@@ -320,7 +321,7 @@ def handle_message(event, text):
                     and not str(u["user_id"]).startswith("U_virtual_")
                 ]
                 if admin_ids:
-                    line_bot_api.multicast(
+                    line_dispatcher.multicast(
                         admin_ids,
                         FlexSendMessage(
                             alt_text="お手伝い完了報告", contents=approve_flex
@@ -1,5 +1,5 @@
 from linebot.models import TextSendMessage, FlexSendMessage, PostbackAction
-from bot_instance import line_bot_api
+from bot_instance import line_bot_api, line_dispatcher
 from services.mission import MissionService
 from services.economy import EconomyService
 from handlers import common
@@ -131,7 +131,7 @@ def handle_postback(event, action, data):
 
             for admin in admins:
                 try:
-                    line_bot_api.push_message(
+                    line_dispatcher.push_message(
                         admin["user_id"],
                         TextSendMessage(
                             text=f"📜 {user_name}さんがミッションを完了しました！\n承認待ちリストを確認してください。"
@@ -1,13 +1,14 @@
 from linebot.models import TextSendMessage, FlexSendMessage
-from bot_instance import line_bot_api
+from bot_instance import line_bot_api, line_dispatcher
 from services.shop import ShopService
 from services.economy import EconomyService
+from services.state_store import StateMap
 from utils.template_loader import load_template
 from handlers import common
 import datetime
 
 # 簡易的な状態管理
-user_states = {}
+user_states = StateMap("shop")
 
 
 def handle_postback(event, action, data):
@@ -155,7 +156,7 @@ def handle_postback(event, action, data):
 
             # ユーザーへ通知
             try:
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     target_id,
                     TextSendMessage(
                         text=f"🙅‍♀️ 交換リクエストが却下されちゃった…\n申請アイテム：{item_name}\n担当：{approver_name}\n{cost} pt は返金しておいたよ。ドンマイ！"
@@ -219,7 +220,7 @@ def handle_postback(event, action, data):
                 if request_time:
                     msg_text += f"\n申請時刻：{request_time}"
 
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     target_id,
                     TextSendMessage(text=msg_text),
                 )
@@ -287,7 +288,7 @@ def handle_message(event, text):
             admin_uid = str(admin.get("user_id"))
             if not admin_uid.startswith("U_virtual_"):
                 try:
-                    line_bot_api.push_message(
+                    line_dispatcher.push_message(
                         admin_uid,
                         FlexSendMessage(
                             alt_text="承認リクエスト", contents=approval_flex
@@ -1,3 +1,4 @@
+from functools import partial
 from linebot.models import (
     TextSendMessage,
     FlexSendMessage,
@@ -9,14 +10,41 @@ from bot_instance import line_bot_api
 from services.economy import EconomyService
 from services.history import HistoryService
 from services.status_service import StatusService
+from utils.fanout import load_parallel
 from utils.template_loader import load_template
 from handlers import common
 
 
 def send_user_status_view(reply_token, user_id, is_detailed=False):
     """ユーザーのステータス画面を送信する共通関数"""
-    # A. Personal Stats
-    user_info = EconomyService.get_user_info(user_id)
+    # A. Personal Stats（互いに依存しない読み込みなので並列に行う）
+    loaders = {
+        "user_info": partial(EconomyService.get_user_info, user_id),
+        "study_stats": partial(HistoryService.get_user_study_stats, user_id),
+        "job_count": partial(HistoryService.get_user_job_count, user_id),
+        "inventory": partial(EconomyService.get_user_inventory, user_id),
+        "weekly_ranking": HistoryService.get_weekly_exp_ranking,
+    }
+    if is_detailed:
+        loaders["weekly_history"] = partial(
+            HistoryService.get_user_weekly_daily_stats, user_id
+        )
+        loaders["monthly_history"] = partial(
+            HistoryService.get_user_monthly_weekly_stats, user_id
+        )
+    loaded, _ = load_parallel(
+        loaders,
+        defaults={
+            "study_stats": {"total": 0, "weekly": 0, "monthly": 0},
+            "job_count": 0,
+            "inventory": [],
+            "weekly_ranking": [],
+            "weekly_history": [],
+            "monthly_history": [],
+        },
+    )
+
+    user_info = loaded["user_info"]
     if not user_info:
         line_bot_api.reply_message(
             reply_token,
@@ -26,10 +54,10 @@ def send_user_status_view(reply_token, user_id, is_detailed=False):
         )
         return
 
-    study_stats = HistoryService.get_user_study_stats(user_id)
-    job_count = HistoryService.get_user_job_count(user_id)
-    inventory = EconomyService.get_user_inventory(user_id)
-    weekly_ranking = HistoryService.get_weekly_exp_ranking()
+    study_stats = loaded["study_stats"]
+    job_count = loaded["job_count"]
+    inventory = loaded["inventory"]
+    weekly_ranking = loaded["weekly_ranking"]
 
     # Prepare data for StatusService
     user_data = user_info.copy()
@@ -40,8 +68,8 @@ def send_user_status_view(reply_token, user_id, is_detailed=False):
 
     if is_detailed:
         # 週間・月間学習グラフ表示
-        weekly_history = HistoryService.get_user_weekly_daily_stats(user_id)
-        monthly_history = HistoryService.get_user_monthly_weekly_stats(user_id)
+        weekly_history = loaded["weekly_history"]
+        monthly_history = loaded["monthly_history"]
 
         carousel = StatusService.create_report_carousel(
             user_data, weekly_history, monthly_history, inventory
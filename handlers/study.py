@@ -6,18 +6,19 @@ from linebot.models import (
     QuickReplyButton,
     MessageAction,
 )
-from bot_instance import line_bot_api
+from bot_instance import line_bot_api, line_dispatcher
 from services.gsheet import GSheetService
 from services.economy import EconomyService
 from services.stats import SagaStats
 from services.history import HistoryService
 from services.status_service import StatusService
+from services.state_store import StateMap
 from utils.template_loader import load_template
 from handlers import common
 from utils.achievements import AchievementManager, ACHIEVEMENT_MASTER
 
 # 簡易的な状態管理 (メモリ上)
-user_states = {}
+user_states = StateMap("study")
 
 SUBJECT_COLORS = {
     "国語": "#FF6B6B",
@@ -297,7 +298,7 @@ def handle_postback(event, action, data):
 
             # ユーザーへ通知
             try:
-                line_bot_api.push_message(
+                line_dispatcher.push_message(
                     target_id,
                     TextSendMessage(
                         text=f"😢 ごめんね、勉強記録が却下されちゃったみたい。\n担当：{approver_name}\n内容を確認して、もう一回申請してみて！"
@@ -374,7 +375,7 @@ def handle_postback(event, action, data):
                     if u.get("user_id") and str(u["user_id"]) != str(user_id)
                 ]
                 if other_admin_ids:
-                    line_bot_api.multicast(
+                    line_dispatcher.multicast(
                         other_admin_ids,
                         TextSendMessage(
                             text=f"🔔 {approver_name}さんが{target_name}の勉強記録を承認しました。"
@@ -415,7 +416,7 @@ def handle_postback(event, action, data):
                         )
                     )
 
-                line_bot_api.push_message(target_id, messages)
+                line_dispatcher.push_message(target_id, messages)
             except Exception as e:
                 print(f"Pushエラー: {e}")
                 # 仮想ユーザーIDの場合、Pushは失敗するが、それは仕様として許容する
@@ -481,8 +482,9 @@ def handle_message(event, text):
                 return True
 
             # コメントを受け取り、集中度を聞く
-            user_states[user_id]["comment"] = text
-            user_states[user_id]["state"] = "WAITING_CONCENTRATION"
+            state_data["comment"] = text
+            state_data["state"] = "WAITING_CONCENTRATION"
+            user_states[user_id] = state_data
 
             # クイックリプライ作成
             items = [
@@ -561,19 +563,17 @@ def finalize_study(event, user_id, state_data, concentration):
     subject = state_data.get("subject", "")
     comment = state_data.get("comment", "なし")
 
-    # 詳細情報を保存
-    GSheetService.update_study_details(row_index, comment, concentration)
-
     hours, mins = divmod(minutes, 60)
-    earned_exp = minutes
 
     # デイリーボーナス判定
     bonus_msg = ""
     is_first_today = HistoryService.is_first_study_today(user_id)
-    if minutes >= 5 and is_first_today:
-        bonus = 30
-        earned_exp += bonus
-        bonus_msg = f"\n🎁 初回ボーナス: +{bonus}pt"
+    earned_exp = HistoryService.study_exp(minutes, is_first_today)
+    if earned_exp > minutes:
+        bonus_msg = f"\n🎁 初回ボーナス: +{earned_exp - minutes}pt"
+
+    # 詳細情報を保存（承認時に払うEXPも残しておき、一括承認でも同じ額を払う）
+    GSheetService.update_study_details(row_index, comment, concentration, earned_exp)
 
     # --- 実績判定 (Achievement) ---
     achievement_msg = ""
@@ -659,7 +659,7 @@ def finalize_study(event, user_id, state_data, concentration):
                 timestamp=timestamp,
                 row_index=row_index,
             )
-            line_bot_api.multicast(
+            line_dispatcher.multicast(
                 admin_ids,
                 FlexSendMessage(alt_text="勉強完了報告", contents=approve_flex),
             )
@@ -669,15 +669,16 @@ def finalize_study(event, user_id, state_data, concentration):
 
 def process_timeout_sessions(sessions):
     """タイムアウトしたセッションの事後処理（通知＆状態更新）"""
-    for session in sessions:
+    # ランク計算は全セッション分をまとめて行う
+    all_stats = SagaStats.calculate_batch([s["minutes"] for s in sessions])
+    for session, stats in zip(sessions, all_stats):
         user_id = session["user_id"]
         minutes = session["minutes"]
         row_index = session["row_index"]
         subject = session["subject"]
         start_time = session["start_time"]
 
-        # ランク計算と保存
-        stats = SagaStats.calculate(minutes)
+        # ランク計算結果の保存
         if stats:
             GSheetService.update_study_stats(row_index, minutes, stats["rank"])
 
@@ -692,7 +693,7 @@ def process_timeout_sessions(sessions):
 
         # 通知送信
         try:
-            line_bot_api.push_message(
+            line_dispatcher.push_message(
                 user_id,
                 TextSendMessage(
                     text=f"⏰ 1時間半経ったよ！根詰めすぎは良くないから、一旦休憩しよ？\n自動で終了にしておくね。\n\n今日の成果、教えてくれる？"
@@ -1,8 +1,14 @@
+import datetime
 from services.gsheet import GSheetService
 from services.job import JobService
 from services.shop import ShopService
 from services.economy import EconomyService
 from services.mission import MissionService
+from services.history import HistoryService
+from services.status_service import StatusService
+from utils.cache import job_list_cache
+from utils.fanout import load_parallel
+from utils.request_context import RequestContext
 
 
 class ApprovalService:
@@ -11,12 +17,31 @@ class ApprovalService:
         """全ての承認待ち項目をフラットなリストで取得"""
         results = []
 
+        # 各シートの読み込みは互いに依存しないので並列に行う
+        # （読めなかった種類は空として扱い、他の種類は表示する）
+        loaded, _ = load_parallel(
+            {
+                "users": EconomyService.get_all_users,
+                "studies": GSheetService.get_pending_studies,
+                "jobs": JobService.get_pending_reviews,
+                "shops": ShopService.get_pending_requests,
+                "missions": MissionService.get_pending_reviews,
+            },
+            defaults={
+                "users": [],
+                "studies": [],
+                "jobs": [],
+                "shops": [],
+                "missions": [],
+            },
+        )
+
         # ユーザー名解決用のマッピング作成
-        users = EconomyService.get_all_users()
+        users = loaded["users"]
         user_map = {str(u.get("user_id")): u.get("display_name") for u in users}
 
         # 1. 勉強記録
-        studies = GSheetService.get_pending_studies()
+        studies = loaded["studies"]
         for s in studies:
             # s keys: row_index, user_id, user_name, date, start_time, end_time
             # 勉強記録は既にuser_nameが入っている場合が多いが、念のため補完も可能
@@ -25,7 +50,7 @@ class ApprovalService:
             results.append({"type": "study", "data": s})
 
         # 2. ジョブ完了報告
-        jobs = JobService.get_pending_reviews()
+        jobs = loaded["jobs"]
         for j in jobs:
             worker_id = str(j.get("worker_id"))
             worker_name = user_map.get(worker_id, worker_id)
@@ -42,7 +67,7 @@ class ApprovalService:
             results.append({"type": "job", "data": data})
 
         # 3. ショップ購入リクエスト
-        shops = ShopService.get_pending_requests()
+        shops = loaded["shops"]
         for s in shops:
             uid = str(s.get("user_id"))
             # スプレッドシートに保存された名前があれば優先、なければMapから解決
@@ -64,7 +89,7 @@ class ApprovalService:
             results.append({"type": "shop", "data": data})
 
         # 4. ミッション完了報告
-        missions = MissionService.get_pending_reviews()
+        missions = loaded["missions"]
         for m in missions:
             uid = str(m.get("user_id"))
             uname = user_map.get(uid, uid)
@@ -82,3 +107,158 @@ class ApprovalService:
             results.append({"type": "mission", "data": data})
 
         return results
+
+    @staticmethod
+    def approve_many(items):
+        """
+        承認待ち項目（get_all_pending の要素）をまとめて承認する。
+        各シートを1回だけ読んだ内容で状態を確認し、ステータス更新はシートごとに
+        まとめて1回、報酬の取引履歴は append_rows の1回で書き込む。
+        項目ごとの結果 [{"type", "data", "ok", "reason", "reward", "balance"}] を返す。
+        """
+        now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        results = []
+        grants = []  # [(結果のindex, user_id, 額, related_id)]
+        badges = []  # [(user_id, item_key)]
+        studied_users = set()
+        job_changed = False
+
+        with RequestContext.scope(), GSheetService.write_buffer():
+            # 1. 各シートを1回ずつ読み、キーから行を引けるようにする
+            study_rows = {
+                r["_row"]: r
+                for r in GSheetService.get_rows("study_log", status="PENDING")
+            }
+            job_rows = {str(r.get("job_id")): r for r in GSheetService.get_rows("jobs")}
+            col_req = GSheetService.resolve_column("shop_requests", "request_id", "id")
+            shop_rows = {
+                str(r.get(col_req)): r for r in GSheetService.get_rows("shop_requests")
+            }
+            mission_rows = {
+                str(r.get("mission_id")): r for r in GSheetService.get_rows("missions")
+            }
+
+            # 2. 状態を確認してステータスを更新（書き込みはバッファに溜まる）
+            #    更新できなかった項目は報酬もバッジも付けずに失敗として返す
+            for item in items:
+                p_type = item.get("type")
+                data = item.get("data", {})
+                result = {"type": p_type, "data": data, "ok": False, "reason": ""}
+                results.append(result)
+
+                if p_type == "study":
+                    row = study_rows.pop(int(data.get("row_index") or 0), None)
+                    if not row:
+                        result["reason"] = "承認待ちではありません"
+                        continue
+                    if not GSheetService.update_fields(
+                        "study_log", row["_row"], {"status": "APPROVED"}
+                    ):
+                        result["reason"] = "ステータスの更新に失敗しました"
+                        continue
+                    # 1件ずつの承認と同じく初回ボーナス込みの額を払う
+                    reward = HistoryService.study_exp_of(row)
+                    user_id = str(row.get("user_id", ""))
+                    grants.append((len(results) - 1, user_id, reward, "STUDY_REWARD"))
+                    studied_users.add(user_id)
+
+                elif p_type == "job":
+                    job_id = str(data.get("job_id"))
+                    row = job_rows.get(job_id)
+                    if not row or row.get("status") != "REVIEW":
+                        result["reason"] = "承認待ちではありません"
+                        continue
+                    if not GSheetService.update_fields(
+                        "jobs", row["_row"], {"status": "CLOSED"}
+                    ):
+                        result["reason"] = "ステータスの更新に失敗しました"
+                        continue
+                    row["status"] = "CLOSED"
+                    job_changed = True
+                    reward_val = str(row.get("reward", "0"))
+                    reward = int(reward_val) if reward_val.isdigit() else 0
+                    grants.append(
+                        (
+                            len(results) - 1,
+                            row.get("worker_id", ""),
+                            reward,
+                            f"JOB_{job_id}",
+                        )
+                    )
+
+                elif p_type == "shop":
+                    row = shop_rows.get(str(data.get("request_id")))
+                    if not row or row.get("status") != "PENDING":
+                        result["reason"] = "承認待ちではありません"
+                        continue
+                    # 購入時にEXPは引かれているので、ステータス更新のみ
+                    if not GSheetService.update_fields(
+                        "shop_requests", row["_row"], {"status": "APPROVED"}
+                    ):
+                        result["reason"] = "ステータスの更新に失敗しました"
+                        continue
+                    row["status"] = "APPROVED"
+                    result["ok"] = True
+                    result["item_key"] = row.get("item_key")
+
+                elif p_type == "mission":
+                    mission_id = str(data.get("mission_id"))
+                    row = mission_rows.get(mission_id)
+                    if not row or row.get("status") != "PENDING":
+                        result["reason"] = "承認待ちではありません"
+                        continue
+                    if not GSheetService.update_fields(
+                        "missions",
+                        row["_row"],
+                        {"status": "COMPLETED", "completed_at": now_str},
+                    ):
+                        result["reason"] = "ステータスの更新に失敗しました"
+                        continue
+                    row["status"] = "COMPLETED"
+                    reward_val = str(row.get("reward", "0"))
+                    reward = int(reward_val) if reward_val.isdigit() else 0
+                    user_id = row["user_id"]
+                    grants.append(
+                        (len(results) - 1, user_id, reward, f"MISSION_{mission_id}")
+                    )
+                    badges.append((user_id, f"mission_{mission_id}"))
+
+                else:
+                    result["reason"] = "不明な種類です"
+
+            # 3. 払う前にステータスの書き込みを確定させる（失敗したら誰にも払わない）
+            try:
+                GSheetService.flush_writes()
+            except Exception:
+                for result in results:
+                    if not result["reason"]:
+                        result["ok"] = False
+                        result["reason"] = "ステータスの更新に失敗しました"
+                return results
+
+            # 4. 報酬（取引履歴は1回の append_rows）
+            balances = EconomyService.add_exp_many(
+                [(uid, amount, rid) for _, uid, amount, rid in grants]
+            )
+            for (i, _, amount, _), balance in zip(grants, balances):
+                results[i]["ok"] = balance is not False
+                results[i]["reward"] = amount
+                results[i]["balance"] = balance
+                if balance is False:
+                    results[i]["reason"] = "報酬の付与に失敗しました"
+
+            for user_id, badge_key in badges:
+                EconomyService.add_inventory_item(user_id, badge_key, 1)
+
+            # 5. 勉強時間が増えたユーザーのランクを保存
+            for user_id in studied_users:
+                total = HistoryService.get_user_study_stats(user_id)["total"]
+                rank_info = StatusService.get_rank_info(total)
+                rank_letter = (
+                    rank_info["name"].split(":")[0].replace("Rank ", "").strip()
+                )
+                EconomyService.update_user_rank(user_id, rank_letter)
+
+        if job_changed:
+            job_list_cache.clear()
+        return results
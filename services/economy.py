@@ -1,22 +1,47 @@
 from services.gsheet import GSheetService
+from services.ledger import balance_checkpoints, ledger, parse_int
+from services.user_directory import user_directory
+from utils.keyed_mutator import KeyedMutator
 import datetime
 import json
+import os
 
 
 class EconomyService:
+    # 最新のチェックポイント以降の取引がこの件数に達したら新しいチェックポイントを作る
+    CHECKPOINT_INTERVAL = int(os.environ.get("LEDGER_CHECKPOINT_INTERVAL", "20"))
+
     @staticmethod
     def check_balance(user_id, cost):
         """残高が足りているか確認（足りていればTrue）"""
-        user = EconomyService.get_user_info(user_id)
-        if not user:
-            return False
+        balance = EconomyService.get_balance(user_id)
+        return balance is not None and balance >= cost
 
-        # current_expが数値であることを確認しつつ比較
+    @staticmethod
+    def _legacy_balance(row):
+        """チェックポイントを作る前の残高（users シートの current_exp）"""
         try:
-            current = int(user.get("current_exp", 0))
-            return current >= cost
+            return int(row.get("current_exp"))
         except:
-            return False
+            return 0
+
+    @staticmethod
+    def get_balance(user_id, row=None):
+        """
+        残高を取得（最新のチェックポイント + それ以降の台帳の合計）。
+        チェックポイントがないユーザーは台帳への追記がまだないので current_exp を使う。
+        """
+        try:
+            checkpoint = balance_checkpoints.latest(user_id)
+            if checkpoint is None:
+                row = row or user_directory.get(user_id)
+                return EconomyService._legacy_balance(row) if row else None
+            ledger_row, balance = checkpoint
+            total, _, _ = ledger.tail(user_id, ledger_row)
+            return balance + total
+        except Exception as e:
+            print(f"Balance Error: {e}")
+            return None
 
     @staticmethod
     def is_admin(user_id):
@@ -27,207 +52,114 @@ class EconomyService:
         return user.get("role") == "ADMIN"
 
     @staticmethod
-    def get_user_info(user_id):
-        """ユーザー情報を取得（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
+    def _public(row):
+        """内部用の行番号を除いたユーザー辞書を返す（current_exp は台帳の残高）"""
+        if row is None:
             return None
+        user = {k: v for k, v in row.items() if k != "_row"}
+        if "current_exp" in user:
+            balance = EconomyService.get_balance(row.get("user_id"), row)
+            if balance is not None:
+                user["current_exp"] = balance
+        return user
 
-        # get_all_records is safe enough for reading dicts, but to be consistent with "check headers":
+    @staticmethod
+    def get_user_info(user_id):
+        """ユーザー情報を取得（ユーザーディレクトリから O(1) で引く）"""
         try:
-            rows = sheet.get_all_values()
-            if len(rows) > 1:
-                headers = rows[0]
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-                idx_uid = col_map.get("user_id")
-
-                if idx_uid is None:
-                    return None
-
-                for r in rows[1:]:
-                    if len(r) > idx_uid and str(r[idx_uid]) == str(user_id):
-                        # Construct dict
-                        return {
-                            k: (r[v] if v < len(r) else "") for k, v in col_map.items()
-                        }
+            return EconomyService._public(user_directory.get(user_id))
         except:
-            pass
-        return None
+            return None
 
     @staticmethod
     def get_all_users():
         """全ユーザー情報を取得（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return []
-
         try:
-            rows = sheet.get_all_values()
-            users = []
-            if len(rows) > 1:
-                headers = rows[0]
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-                for r in rows[1:]:
-                    u = {k: (r[v] if v < len(r) else "") for k, v in col_map.items()}
-                    users.append(u)
-            return users
+            return [EconomyService._public(r) for r in user_directory.all()]
         except:
             return []
 
     @staticmethod
     def get_admin_users():
         """Admin権限を持つユーザーのリストを取得"""
-        users = EconomyService.get_all_users()
-        admins = [u for u in users if u.get("role") == "ADMIN"]
-        return admins
+        try:
+            return [
+                EconomyService._public(r) for r in user_directory.with_role("ADMIN")
+            ]
+        except:
+            return []
 
     @staticmethod
     def register_user(user_id, display_name):
         """新規ユーザー登録（口座開設・動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return False
-
         # すでにいるか確認
         if EconomyService.get_user_info(user_id):
             return True  # 登録済み
 
+        row_index = GSheetService.append(
+            "users",
+            {
+                "user_id": user_id,
+                "display_name": display_name,
+                "current_exp": 0,
+                "total_study_time": 0,
+                "role": "USER",
+                "inventory_json": "{}",
+                "rank": "E",
+            },
+        )
+        return bool(row_index)
+
+    @staticmethod
+    def _update_user(user_id, fields, label):
+        """user_id の行の指定カラムを更新"""
         try:
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            row_data = [""] * len(headers)
-
-            def set_val(key, val):
-                idx = col_map.get(key)
-                if idx is not None:
-                    row_data[idx] = val
-
-            set_val("user_id", user_id)
-            set_val("display_name", display_name)
-            set_val("current_exp", 0)
-            set_val("total_study_time", 0)
-            set_val("role", "USER")
-            set_val("inventory_json", "{}")
-            set_val("rank", "E")
-
-            sheet.append_row(row_data)
-            return True
-        except:
+            row_index = user_directory.row_of(user_id)
+            if not row_index:
+                return False
+            return GSheetService.update_fields("users", row_index, fields)
+        except Exception as e:
+            print(f"Update {label} Error: {e}")
             return False
 
     @staticmethod
     def update_user_profile(user_id, display_name, avatar_url):
         """ユーザーの表示名とアイコンURLを更新（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return False
-
-        try:
-            cell = sheet.find(user_id)
-            if cell:
-                headers = sheet.row_values(1)
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-                idx_name = col_map.get("display_name")
-                # スプレッドシート側で avatar_url カラムがなくても name が変われば更新したい
-                if idx_name is not None:
-                    sheet.update_cell(cell.row, idx_name + 1, display_name)
-
-                idx_avatar = col_map.get("avatar_url")
-                if idx_avatar is not None and avatar_url:
-                    sheet.update_cell(cell.row, idx_avatar + 1, avatar_url)
-
-                return True
-            return False
-        except Exception as e:
-            print(f"Update Profile Error: {e}")
-            return False
+        # スプレッドシート側で avatar_url カラムがなくても name が変われば更新したい
+        fields = {"display_name": display_name}
+        if avatar_url:
+            fields["avatar_url"] = avatar_url
+        return EconomyService._update_user(user_id, fields, "Profile")
 
     @staticmethod
     def update_user_rank(user_id, rank):
         """ユーザーのランクを更新（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return False
-
-        try:
-            cell = sheet.find(user_id)
-            if cell:
-                headers = sheet.row_values(1)
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-                idx_rank = col_map.get("rank")
-                if idx_rank is not None:
-                    sheet.update_cell(cell.row, idx_rank + 1, rank)
-                    return True
-            return False
-        except Exception as e:
-            print(f"Update Rank Error: {e}")
-            return False
+        return EconomyService._update_user(user_id, {"rank": rank}, "Rank")
 
     @staticmethod
     def update_user_achievements(user_id, achievements_str):
         """ユーザーの実績リストを更新（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return False
-
-        try:
-            cell = sheet.find(user_id)
-            if cell:
-                headers = sheet.row_values(1)
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-                # Looking for 'achievements', usually not present in initial schema but added here
-                idx_ach = col_map.get("achievements")
-                if idx_ach is None:
-                    # Fallback check for column 8 (H) or just print error?
-                    # Ideally we should not fallback to hardcoded if we want to be strict.
-                    # But if the column doesn't exist, we can't update it unless we find empty col?
-                    # Assuming 'achievements' header must exist.
-                    return False
-
-                sheet.update_cell(cell.row, idx_ach + 1, achievements_str)
-                return True
-            return False
-        except Exception as e:
-            print(f"Update Achievements Error: {e}")
-            return False
+        # 'achievements' カラムがシートに存在しない場合は更新できない
+        return EconomyService._update_user(
+            user_id, {"achievements": achievements_str}, "Achievements"
+        )
 
     @staticmethod
     def update_user_role(user_id, role):
         """ユーザーの権限(Role)を更新（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return False
-
-        try:
-            cell = sheet.find(user_id)
-            if cell:
-                headers = sheet.row_values(1)
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-                idx_role = col_map.get("role")
-                if idx_role is not None:
-                    sheet.update_cell(cell.row, idx_role + 1, role)
-                    return True
-            return False
-        except Exception as e:
-            print(f"Update Role Error: {e}")
-            return False
+        return EconomyService._update_user(user_id, {"role": role}, "Role")
 
     @staticmethod
     def reset_user(user_id):
         """ユーザー情報をリセット（削除）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return False
-
         try:
-            cell = sheet.find(user_id)
-            if cell:
-                sheet.delete_rows(cell.row)
-                return True
-            return False
+            row_index = user_directory.row_of(user_id)
+            if not row_index:
+                return False
+            # 再登録したときに以前の残高が残らないよう 0 のチェックポイントを置く
+            if balance_checkpoints.latest(user_id) is not None:
+                EconomyService._write_checkpoint(user_id, 0, ledger.last_row(), "RESET")
+            return GSheetService.delete_row("users", row_index)
         except Exception as e:
             print(f"Reset User Error: {e}")
             return False
@@ -289,114 +221,226 @@ class EconomyService:
     @staticmethod
     def add_inventory_item(user_id, item_key, count=1):
         """インベントリにアイテムを追加（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("users")
-        if not sheet:
-            return False
-
         try:
-            cell = sheet.find(user_id)
-            if not cell:
-                return False
-
-            row_num = cell.row
-
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-            idx_inv = col_map.get("inventory_json")
-            if idx_inv is None:
-                return False
-
-            inv_cell = sheet.cell(row_num, idx_inv + 1)
-            inv_json = inv_cell.value
-
-            try:
-                inv_dict = json.loads(inv_json) if inv_json else {}
-            except:
-                inv_dict = {}
-
-            current_count = inv_dict.get(item_key, 0)
-            inv_dict[item_key] = current_count + count
-
-            sheet.update_cell(row_num, idx_inv + 1, json.dumps(inv_dict))
-            return True
+            return bool(user_mutator.submit(user_id, ("item", item_key, count)))
         except:
             return False
 
     @staticmethod
     def add_exp(user_id, amount, related_id="STUDY"):
         """EXPを加算（減算ならマイナス）し、履歴に残す（動的カラムマッピング）"""
-        users_sheet = GSheetService.get_worksheet("users")
-        tx_sheet = GSheetService.get_worksheet("transactions")
-
-        if not users_sheet or not tx_sheet:
-            return False
+        result = EconomyService.add_exp_many([(user_id, amount, related_id)])
+        return result[0] if result else False
 
+    @staticmethod
+    def add_exp_many(grants):
+        """
+        複数の EXP 付与 [(user_id, amount, related_id), ...] をまとめて行う。
+        台帳 (transactions) への append_rows の1回だけで記録し、残高のセルは書き換えない。
+        付与ごとの新しい残高（失敗時は False）を同じ順で返す。
+        """
         try:
-            # 1. ユーザーを探して残高更新
-            cell = users_sheet.find(user_id)
-            if not cell:
-                return False
+            entries = []
+            tx_rows = []
+            col_time = GSheetService.resolve_column("transactions", "timestamp", "time")
+            now = datetime.datetime.now()
+            for user_id, amount, related_id in grants:
+                row = user_directory.get(user_id)
+                if not row or "display_name" not in row:
+                    entries.append(None)
+                    continue
+                # 初めて台帳に書くユーザーは、今の current_exp をチェックポイントにしておく
+                if balance_checkpoints.latest(
+                    user_id
+                ) is None and not user_mutator.submit(user_id, ("seed",)):
+                    entries.append(None)
+                    continue
+                entries.append((user_id, amount))
+                tx_rows.append(
+                    EconomyService._transaction_fields(
+                        user_id,
+                        row.get("display_name"),
+                        amount,
+                        related_id,
+                        now,
+                        col_time,
+                    )
+                )
 
-            headers_u = users_sheet.row_values(1)
-            col_map_u = {str(h).strip(): i for i, h in enumerate(headers_u)}
-            idx_name = col_map_u.get("display_name")
-            idx_exp = col_map_u.get("current_exp")
+            # 付与前の残高から、付与ごとの残高を順に計算する
+            balances = {}
+            for e in entries:
+                if e and e[0] not in balances:
+                    balances[e[0]] = EconomyService.get_balance(e[0])
+
+            if tx_rows and not GSheetService.append_rows("transactions", tx_rows):
+                print("Transaction Log Error: append failed")
+                return [False] * len(grants)
+
+            results = []
+            for e in entries:
+                if e is None:
+                    results.append(False)
+                    continue
+                balances[e[0]] += e[1]
+                results.append(balances[e[0]])
+
+            for user_id in balances:
+                EconomyService._maybe_checkpoint(user_id)
+            return results
+        except Exception as e:
+            print(f"Add Exp Error: {e}")
+            return [False] * len(grants)
 
-            if idx_name is None or idx_exp is None:
-                return False
+    @staticmethod
+    def _write_checkpoint(user_id, balance, ledger_row, reason):
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return GSheetService.append(
+            "balance_checkpoints",
+            {
+                "user_id": user_id,
+                "balance": balance,
+                "ledger_row": ledger_row,
+                "reason": reason,
+                "created_at": now,
+            },
+        )
 
-            row_num = cell.row
-            user_name = users_sheet.cell(row_num, idx_name + 1).value
-            current_exp_cell = users_sheet.cell(row_num, idx_exp + 1)
-
-            try:
-                current_val = int(current_exp_cell.value)
-            except:
-                current_val = 0
-            new_exp = current_val + amount
-
-            # 2. 取引履歴(Transaction)を記録
-            tx_id = f"tx_{int(datetime.datetime.now().timestamp())}"
-            tx_type = "REWARD" if amount > 0 else "SPEND"
-            now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            headers_tx = tx_sheet.row_values(1)
-            col_map_tx = {str(h).strip(): i for i, h in enumerate(headers_tx)}
-
-            row_data_tx = [""] * len(headers_tx)
-
-            def set_val_tx(key, val, alt_keys=None):
-                idx = col_map_tx.get(key)
-                if idx is None and alt_keys:
-                    for ak in alt_keys:
-                        idx = col_map_tx.get(ak)
-                        if idx is not None:
-                            break
-                if idx is not None:
-                    row_data_tx[idx] = val
-
-            set_val_tx("tx_id", tx_id)
-            set_val_tx("user_id", user_id)
-            set_val_tx("amount", amount)
-            set_val_tx("tx_type", tx_type)
-            set_val_tx("related_id", related_id)
-            set_val_tx("timestamp", now_str, ["time"])
-            set_val_tx("user_name", user_name)
-
-            try:
-                tx_sheet.append_row(row_data_tx)
-            except Exception as e:
-                print(f"Transaction Log Error: {e}")
-                return False
+    @staticmethod
+    def _maybe_checkpoint(user_id):
+        """最新のチェックポイント以降の取引が溜まっていれば新しいチェックポイントを作る"""
+        checkpoint = balance_checkpoints.latest(user_id)
+        if checkpoint is None:
+            return
+        ledger_row, balance = checkpoint
+        total, count, last_row = ledger.tail(user_id, ledger_row)
+        if count < EconomyService.CHECKPOINT_INTERVAL:
+            return
+        if EconomyService._write_checkpoint(user_id, balance + total, last_row, "AUTO"):
+            # シートを直接見る人向けに current_exp にも写しておく（残高の計算には使わない）
+            EconomyService._update_user(
+                user_id, {"current_exp": balance + total}, "Checkpoint"
+            )
 
-            # 3. 残高更新
-            try:
-                users_sheet.update_cell(row_num, idx_exp + 1, new_exp)
-            except Exception as e:
-                print(f"Balance Update Error: {e}")
-                return False
+    @staticmethod
+    def verify_balances():
+        """
+        台帳を先頭から1回だけ読み、チェックポイントを起点に全ユーザーの残高を計算し直す。
+        途中の AUTO チェックポイントや現在の残高と食い違うものを mismatches に返す。
+        """
+        checkpoints = balance_checkpoints.all()
+        # {user_id: [計算中の残高, 次に見るチェックポイントの位置]}
+        state = {uid: [0, 0] for uid in checkpoints}
+        mismatches = []
+
+        def advance(uid, row_index):
+            # row_index 行目より前までを反映したチェックポイントを処理する
+            cps = checkpoints[uid]
+            balance, i = state[uid]
+            while i < len(cps) and cps[i][0] < row_index:
+                ledger_row, recorded, reason = cps[i]
+                if reason == "AUTO" and recorded != balance:
+                    mismatches.append(
+                        {
+                            "user_id": uid,
+                            "ledger_row": ledger_row,
+                            "expected": balance,
+                            "recorded": recorded,
+                        }
+                    )
+                # 以降は記録された値を起点にする（SEED / RESET はそのまま起点）
+                balance = recorded
+                i += 1
+            state[uid] = [balance, i]
+
+        for row in GSheetService.get_rows("transactions"):
+            uid = str(row.get("user_id", ""))
+            if uid not in state:
+                continue
+            advance(uid, row["_row"])
+            # 最初のチェックポイントより前の取引は current_exp に含まれている
+            if state[uid][1]:
+                state[uid][0] += parse_int(row.get("amount"))
+
+        balances = {}
+        for uid in state:
+            advance(uid, float("inf"))
+            balances[uid] = state[uid][0]
+            current = EconomyService.get_balance(uid)
+            if current is not None and current != balances[uid]:
+                mismatches.append(
+                    {
+                        "user_id": uid,
+                        "ledger_row": None,
+                        "expected": balances[uid],
+                        "recorded": current,
+                    }
+                )
+        return {"balances": balances, "mismatches": mismatches}
 
-            return new_exp
-        except Exception as e:
-            print(f"Add Exp Error: {e}")
-            return False
+    @staticmethod
+    def _apply_mutations(user_id, mutations):
+        """
+        同じユーザーへの変更をまとめて反映する（user_mutator から呼ばれる）。
+        - ("seed",): チェックポイントがなければ current_exp から作る（1回だけ）
+        - ("item", item_key, count): 所持品の追加（users シートの更新は1回にまとめる）
+        """
+        row = user_directory.get(user_id)
+        if not row:
+            return [False] * len(mutations)
+
+        results = []
+        fields = {}
+        inv_dict = None
+
+        for mutation in mutations:
+            if mutation[0] == "seed":
+                if balance_checkpoints.latest(user_id) is None:
+                    results.append(
+                        bool(
+                            EconomyService._write_checkpoint(
+                                user_id,
+                                EconomyService._legacy_balance(row),
+                                ledger.last_row(),
+                                "SEED",
+                            )
+                        )
+                    )
+                else:
+                    results.append(True)
+            else:
+                _, item_key, count = mutation
+                if "inventory_json" not in row:
+                    results.append(False)
+                    continue
+                if inv_dict is None:
+                    inv_json = row.get("inventory_json")
+                    try:
+                        inv_dict = json.loads(inv_json) if inv_json else {}
+                    except:
+                        inv_dict = {}
+                inv_dict[item_key] = inv_dict.get(item_key, 0) + count
+                fields["inventory_json"] = json.dumps(inv_dict)
+                results.append(True)
+
+        if fields and not GSheetService.update_fields("users", row["_row"], fields):
+            print("Inventory Update Error: update failed")
+            return [False] * len(mutations)
+        return results
+
+    @staticmethod
+    def _transaction_fields(user_id, user_name, amount, related_id, now, col_time):
+        return {
+            "tx_id": f"tx_{int(now.timestamp())}",
+            "user_id": user_id,
+            "amount": amount,
+            "tx_type": "REWARD" if amount > 0 else "SPEND",
+            "related_id": related_id,
+            col_time: now.strftime("%Y-%m-%d %H:%M:%S"),
+            "user_name": user_name,
+        }
+
+
+# 同じユーザーの所持品の変更・チェックポイントの作成は1つずつ順番に反映し、
+# 続けて届いた分は1回で書き込む
+user_mutator = KeyedMutator(EconomyService._apply_mutations)
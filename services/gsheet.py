@@ -1,14 +1,24 @@
 import os
 import json
+import contextlib
 import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import threading
+from services.storage import (
+    AUTO_CREATED_TABLES,
+    TABLE_COLUMNS,
+    GSheetStorage,
+    SQLiteStorage,
+)
+from utils.startup_profile import startup_profile
 
 
 class GSheetService:
     _instance = None
     _client = None
     _doc = None
+    _storage = None
+    _storage_lock = threading.Lock()
+    _connect_lock = threading.Lock()
 
     @classmethod
     def _connect(cls):
@@ -16,24 +26,37 @@ class GSheetService:
         if cls._client and cls._doc:
             return
 
-        try:
-            creds_json = os.environ.get("GOOGLE_CREDENTIALS")
-            sheet_id = os.environ.get("SPREADSHEET_ID")
-
-            if not creds_json or not sheet_id:
-                print("【Error】環境変数が不足しています")
+        # 起動直後に複数のスレッドから呼ばれても認証は1回で済ませる
+        with cls._connect_lock:
+            if cls._client and cls._doc:
                 return
+            try:
+                creds_json = os.environ.get("GOOGLE_CREDENTIALS")
+                sheet_id = os.environ.get("SPREADSHEET_ID")
+
+                if not creds_json or not sheet_id:
+                    print("【Error】環境変数が不足しています")
+                    return
+
+                with startup_profile.timed("gsheet connect"):
+                    # gspread / oauth2client は読み込みが重いので、初めて接続するときに読み込む
+                    import gspread
+                    from oauth2client.service_account import (
+                        ServiceAccountCredentials,
+                    )
 
-            creds_dict = json.loads(creds_json)
-            scope = [
-                "https://spreadsheets.google.com/feeds",
-                "https://www.googleapis.com/auth/drive",
-            ]
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-            cls._client = gspread.authorize(creds)
-            cls._doc = cls._client.open_by_key(sheet_id)
-        except Exception as e:
-            print(f"【Error】GSheet接続失敗: {e}")
+                    creds_dict = json.loads(creds_json)
+                    scope = [
+                        "https://spreadsheets.google.com/feeds",
+                        "https://www.googleapis.com/auth/drive",
+                    ]
+                    creds = ServiceAccountCredentials.from_json_keyfile_dict(
+                        creds_dict, scope
+                    )
+                    cls._client = gspread.authorize(creds)
+                    cls._doc = cls._client.open_by_key(sheet_id)
+            except Exception as e:
+                print(f"【Error】GSheet接続失敗: {e}")
 
     @classmethod
     def get_worksheet(cls, sheet_name):
@@ -41,480 +64,428 @@ class GSheetService:
         cls._connect()
         if not cls._doc:
             return None
+        import gspread
+
         try:
             return cls._doc.worksheet(sheet_name)
         except gspread.WorksheetNotFound:
+            if sheet_name in AUTO_CREATED_TABLES:
+                return cls._create_worksheet(sheet_name)
             print(f"【Error】シート '{sheet_name}' が見つかりません")
             return None
 
-    @staticmethod
-    def log_activity(user_id, user_name, today, time, subject=""):
-        """学習記録ログを study_log シートに保存（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            print("【Error】study_log シートが見つかりません。作成してください。")
-            return False
+    @classmethod
+    def _create_worksheet(cls, sheet_name):
+        """既定のヘッダーでシートを作成"""
+        import gspread
 
+        header = TABLE_COLUMNS[sheet_name]
         try:
-            # ヘッダー行を取得してカラム位置を特定
-            headers = sheet.row_values(1)
-            if not headers:
-                print("【Error】ヘッダー情報が取得できません")
-                return False
-
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            # データ用配列初期化
-            row_data = [""] * len(headers)
-
-            def set_val(name, val):
-                if name in col_map:
-                    row_data[col_map[name]] = val
-
-            set_val("user_id", user_id)
-            set_val("display_name", user_name)
-            set_val("date", today)
-            set_val("start_time", time)
-            set_val("status", "STARTED")
-            set_val("subject", subject)
-
-            sheet.append_row(row_data)
-            return True
+            sheet = cls._doc.add_worksheet(
+                title=sheet_name, rows=1000, cols=len(header)
+            )
+            sheet.append_row(header)
+            print(f"シート '{sheet_name}' を作成しました")
+            return sheet
+        except gspread.exceptions.APIError:
+            # 他のプロセスが先に作成した場合
+            return cls._doc.worksheet(sheet_name)
         except Exception as e:
-            print(f"ログ記録エラー: {e}")
-            return False
+            print(f"【Error】シート '{sheet_name}' の作成に失敗: {e}")
+            return None
 
-    @staticmethod
-    def cancel_study(user_id, user_name=None):
-        """学習記録をキャンセル（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return False
+    @classmethod
+    def get_spreadsheet(cls):
+        """スプレッドシート本体を取得（複数シートへの一括書き込み用）"""
+        cls._connect()
+        return cls._doc
 
-        all_records = sheet.get_all_values()
-        if not all_records:
-            return False
+    @classmethod
+    def storage(cls):
+        """設定されたストレージエンジンを取得（STORAGE_BACKEND=gsheet|sqlite）"""
+        if cls._storage is None:
+            with cls._storage_lock:
+                if cls._storage is None:
+                    backend = os.environ.get("STORAGE_BACKEND", "gsheet").lower()
+                    if backend == "sqlite":
+                        path = os.environ.get("SQLITE_PATH", "data/study_guardian.db")
+                        # シートの認証情報があれば変更を記録し、書き戻しの対象にする
+                        cls._storage = SQLiteStorage(
+                            path,
+                            seed=cls._seed_values,
+                            journal=bool(os.environ.get("GOOGLE_CREDENTIALS")),
+                        )
+                    else:
+                        ttl = float(os.environ.get("SHEET_SNAPSHOT_TTL", "30"))
+                        cls._storage = GSheetStorage(
+                            cls.get_worksheet,
+                            ttl=ttl,
+                            spreadsheet_getter=cls.get_spreadsheet,
+                        )
+        return cls._storage
 
-        headers = all_records[0]
-        col_map = {str(h).strip(): i for i, h in enumerate(headers)}
+    @classmethod
+    def _seed_values(cls, table):
+        """ローカルにテーブルがない場合、シートの内容を初期データとして取り込む"""
+        if not os.environ.get("GOOGLE_CREDENTIALS"):
+            return None
+        sheet = cls.get_worksheet(table)
+        return sheet.get_all_values() if sheet else None
 
-        idx_uid = col_map.get("user_id")
-        idx_name = col_map.get("display_name")
-        idx_end = col_map.get("end_time")
-        idx_status = col_map.get("status")
+    # --- テーブル操作API (ストレージエンジンへ委譲) ---
 
-        if idx_status is None:
-            return False
+    @classmethod
+    def get_header(cls, table):
+        return cls.storage().get_header(table)
 
-        target_row = None
+    @classmethod
+    def resolve_column(cls, table, *candidates):
+        """候補のうちヘッダーに存在する最初のカラム名を返す（なければ先頭の候補）"""
+        header = cls.get_header(table)
+        for name in candidates:
+            if name in header:
+                return name
+        return candidates[0]
 
-        # 後ろから検索
-        for i in range(len(all_records), 1, -1):
-            row = all_records[i - 1]
-            if not row:
-                continue
+    @classmethod
+    def get_rows(cls, table, **filters):
+        return cls.storage().get_rows(table, **filters)
 
-            def get_val(idx):
-                return (
-                    str(row[idx]).strip() if idx is not None and idx < len(row) else ""
-                )
+    @classmethod
+    def get_rows_any(cls, table, **filters):
+        return cls.storage().get_rows_any(table, **filters)
 
-            is_match = False
-            if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                is_match = True
-            elif (
-                user_name
-                and idx_name is not None
-                and get_val(idx_name) == str(user_name)
-            ):
-                is_match = True
-
-            if is_match:
-                end_val = get_val(idx_end)
-                status_val = get_val(idx_status)
-
-                # 終了時刻が空 かつ statusがSTARTED (念のため)
-                if end_val == "" and status_val == "STARTED":
-                    target_row = i
-                    break
-
-        if target_row:
-            try:
-                sheet.update_cell(target_row, idx_status + 1, "CANCELLED")
-                return True
-            except Exception as e:
-                print(f"Cancel Study Error: {e}")
-                return False
-        return False
+    @classmethod
+    def get_row(cls, table, row_index):
+        return cls.storage().get_row(table, row_index)
 
-    @staticmethod
-    def update_end_time(user_id, end_time, user_name=None):
-        """終了時刻を study_log シートに更新（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return None
+    @classmethod
+    def get_rows_after(cls, table, row_index):
+        """row_index より後に追記された行を最新の内容で取得（差分の取り込み用）"""
+        return cls.storage().get_rows_after(table, row_index)
 
-        all_records = sheet.get_all_values()
-        if not all_records:
-            return None
+    @classmethod
+    def get_rows_at(cls, table, row_indexes):
+        """指定した行だけを最新の内容で取得（差分の取り込み用）"""
+        return cls.storage().get_rows_at(table, row_indexes)
+
+    @classmethod
+    def find_row(cls, table, column, value):
+        return cls.storage().find_row(table, column, value)
+
+    @classmethod
+    def update_fields(cls, table, row_index, fields):
+        with cls._index_lock(table):
+            before = cls._index_version(table)
+            result = cls.storage().update_fields(table, row_index, fields)
+            if result:
+                cls._notify_indexes(table, "update", row_index, fields, before)
+        return result
+
+    @classmethod
+    def append(cls, table, fields):
+        with cls._index_lock(table):
+            before = cls._index_version(table)
+            row_index = cls.storage().append(table, fields)
+            if row_index:
+                cls._notify_indexes(table, "append", row_index, fields, before)
+        return row_index
+
+    @classmethod
+    def append_rows(cls, table, rows):
+        """複数行をまとめて追加し、追加した行番号のリストを返す"""
+        with cls._index_lock(table):
+            before = cls._index_version(table)
+            indexes = cls.storage().append_rows(table, rows)
+            if indexes:
+                for row_index, fields in zip(indexes, rows):
+                    cls._notify_indexes(table, "append", row_index, fields, before)
+                    # 2行目以降は、直前の通知で進んだ版数から続ける
+                    before = cls._index_version(table)
+        return indexes
+
+    @classmethod
+    def delete_row(cls, table, row_index):
+        with cls._index_lock(table):
+            before = cls._index_version(table)
+            result = cls.storage().delete_row(table, row_index)
+            if result:
+                cls._notify_indexes(table, "delete", row_index, {}, before)
+        return result
 
-        headers = all_records[0]
-        col_map = {str(h).strip(): i for i, h in enumerate(headers)}
+    # --- 派生インデックス (services/table_index.py) への変更通知 ---
 
-        idx_uid = col_map.get("user_id")
-        idx_name = col_map.get("display_name")
-        idx_end = col_map.get("end_time")
-        idx_status = col_map.get("status")
-        idx_start = col_map.get("start_time")
-        idx_subj = col_map.get("subject")
+    _indexes = {}
+    _index_locks = {}
 
-        if idx_status is None or idx_end is None:
+    @classmethod
+    def register_index(cls, index):
+        with cls._storage_lock:
+            cls._indexes.setdefault(index.table, []).append(index)
+            cls._index_locks.setdefault(index.table, threading.RLock())
+
+    @classmethod
+    def _index_lock(cls, table):
+        """インデックスのあるテーブルは、書き込みと通知の間に他の書き込みを挟ませない"""
+        return cls._index_locks.get(table) or contextlib.nullcontext()
+
+    @classmethod
+    def _index_version(cls, table):
+        if not cls._indexes.get(table):
             return None
+        return cls.storage().version(table)
 
-        target_row = None
+    @classmethod
+    def _notify_indexes(cls, table, op, row_index, fields, before):
+        indexes = cls._indexes.get(table)
+        if not indexes:
+            return
+        after = cls.storage().version(table)
+        for index in indexes:
+            index.apply(op, int(row_index), fields, before, after)
 
-        # 後ろから検索
-        for i in range(len(all_records), 1, -1):
-            row = all_records[i - 1]
-            if not row:
-                continue
+    @classmethod
+    def write_buffer(cls):
+        """
+        with GSheetService.write_buffer(): の間の update_fields を溜めて、
+        抜けるときに1回の batch_update（複数シートなら values_batch_update）で書き込む
+        """
+        return cls.storage().buffered()
 
-            def get_val(idx):
-                return (
-                    str(row[idx]).strip() if idx is not None and idx < len(row) else ""
+    @classmethod
+    def flush_writes(cls):
+        """
+        write_buffer の中で溜まっている更新を今すぐ書き込む。
+        ステータスを変えてから報酬を払う処理では、払う前に呼んで書き込みを確定させる
+        （失敗したら例外になるので、その場合は払わない）。
+        """
+        cls.storage().flush()
+
+    @staticmethod
+    def get_user_study_rows(user_id, user_name=None):
+        """ユーザーの学習記録を取得（user_id 一致、または表示名一致）"""
+        from services.study_index import study_log_index
+
+        return study_log_index.user_rows(user_id, user_name)
+
+    @staticmethod
+    def get_user_study_rows_on(user_id, user_name, date):
+        """ユーザーの指定日の学習記録を取得"""
+        from services.study_index import study_log_index
+
+        return study_log_index.rows_on(user_id, user_name, date)
+
+    @staticmethod
+    def _find_latest_session(user_id, user_name, status):
+        """ユーザーの指定ステータスの行を新しい順に取得（ユーザー別インデックスを利用）"""
+        from services.study_index import study_log_index
+
+        return study_log_index.latest(user_id, user_name, status)
+
+    @staticmethod
+    def log_activity(user_id, user_name, today, time, subject=""):
+        """学習記録ログを study_log シートに保存（動的カラムマッピング）"""
+        row_index = GSheetService.append(
+            "study_log",
+            {
+                "user_id": user_id,
+                "display_name": user_name,
+                "date": today,
+                "start_time": time,
+                "status": "STARTED",
+                "subject": subject,
+            },
+        )
+        if not row_index:
+            print("【Error】study_log への記録に失敗しました。")
+            return False
+        return True
+
+    @staticmethod
+    def cancel_study(user_id, user_name=None):
+        """学習記録をキャンセル（動的カラムマッピング）"""
+        for row in GSheetService._find_latest_session(user_id, user_name, "STARTED"):
+            # 終了時刻が空 かつ statusがSTARTED (念のため)
+            if str(row.get("end_time", "")).strip() == "":
+                return GSheetService.update_fields(
+                    "study_log", row["_row"], {"status": "CANCELLED"}
                 )
+        return False
 
-            # Match Logic
-            is_match = False
-            if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                is_match = True
-            elif (
-                user_name
-                and idx_name is not None
-                and get_val(idx_name) == str(user_name)
-            ):
-                is_match = True
-
-            # EndTime, Status
-            if is_match:
-                end_val = get_val(idx_end)
-                status_val = get_val(idx_status)
-
-                if end_val == "" and status_val == "STARTED":
-                    target_row = i
-                    break
-
-        if target_row:
-            sheet.update_cell(target_row, idx_end + 1, end_time)
-            sheet.update_cell(target_row, idx_status + 1, "PENDING")
-
-            subject = ""
-            if idx_subj is not None and idx_subj < len(all_records[target_row - 1]):
-                subject = all_records[target_row - 1][idx_subj]
-
-            start_time = ""
-            if idx_start is not None and idx_start < len(all_records[target_row - 1]):
-                start_time = all_records[target_row - 1][idx_start]
+    @staticmethod
+    def update_end_time(user_id, end_time, user_name=None):
+        """終了時刻を study_log シートに更新（動的カラムマッピング）"""
+        for row in GSheetService._find_latest_session(user_id, user_name, "STARTED"):
+            if "end_time" not in row:
+                return None
+            if str(row["end_time"]).strip() != "":
+                continue
 
+            GSheetService.update_fields(
+                "study_log",
+                row["_row"],
+                {"end_time": end_time, "status": "PENDING"},
+            )
             return {
-                "start_time": start_time,
-                "row_index": target_row,
-                "subject": subject,
+                "start_time": row.get("start_time", ""),
+                "row_index": row["_row"],
+                "subject": row.get("subject", ""),
             }
         return None
 
     @staticmethod
     def update_study_stats(row_index, duration, rank):
         """学習時間とランクを study_log シートに追記（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return False
-        try:
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_dur = col_map.get("duration_min")
-            idx_rank = col_map.get("rank_score")
-
-            if idx_dur is not None:
-                sheet.update_cell(row_index, idx_dur + 1, duration)
-            if idx_rank is not None:
-                sheet.update_cell(row_index, idx_rank + 1, rank)
-            return True
-        except Exception as e:
-            print(f"Stats Update Error: {e}")
-            return False
+        return GSheetService.update_fields(
+            "study_log", row_index, {"duration_min": duration, "rank_score": rank}
+        )
 
     @staticmethod
-    def update_study_details(row_index, comment, concentration):
-        """学習の成果と集中度を study_log シートに追記（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return False
-        try:
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_com = col_map.get("comment")
-            idx_conc = col_map.get("concentration")
-
-            if idx_com is not None:
-                sheet.update_cell(row_index, idx_com + 1, comment)
-            if idx_conc is not None:
-                sheet.update_cell(row_index, idx_conc + 1, concentration)
-            return True
-        except Exception as e:
-            print(f"Details Update Error: {e}")
-            return False
+    def update_study_details(row_index, comment, concentration, earned_exp=None):
+        """学習の成果と集中度（と承認時に払うEXP）を study_log シートに追記（動的カラムマッピング）"""
+        fields = {"comment": comment, "concentration": concentration}
+        if earned_exp is not None:
+            fields["earned_exp"] = earned_exp
+        return GSheetService.update_fields("study_log", row_index, fields)
 
     @staticmethod
     def get_pending_studies():
         """承認待ちの学習記録を取得（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return []
-
         pending = []
-        try:
-            records = sheet.get_all_values()
-            if not records:
-                return []
-
-            headers = records[0]
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_status = col_map.get("status")
-            idx_uid = col_map.get("user_id")
-            idx_name = col_map.get("display_name")
-            idx_date = col_map.get("date")
-            idx_start = col_map.get("start_time")
-            idx_end = col_map.get("end_time")
-
-            if idx_status is None:
-                return []
-
-            # ヘッダー飛ばす
-            for i, row in enumerate(records[1:], start=2):
-                if not row:
-                    continue
-
-                def get_val(idx):
-                    return (
-                        str(row[idx]).strip()
-                        if idx is not None and idx < len(row)
-                        else ""
-                    )
-
-                if get_val(idx_status) == "PENDING":
-                    pending.append(
-                        {
-                            "row_index": i,
-                            "user_id": get_val(idx_uid),
-                            "user_name": get_val(idx_name),
-                            "date": get_val(idx_date),
-                            "start_time": get_val(idx_start),
-                            "end_time": get_val(idx_end),
-                        }
-                    )
-        except Exception as e:
-            print(f"Pending Study Error: {e}")
+        for row in GSheetService.get_rows("study_log", status="PENDING"):
+
+            def get_val(key):
+                return str(row.get(key, "")).strip()
+
+            pending.append(
+                {
+                    "row_index": row["_row"],
+                    "user_id": get_val("user_id"),
+                    "user_name": get_val("display_name"),
+                    "date": get_val("date"),
+                    "start_time": get_val("start_time"),
+                    "end_time": get_val("end_time"),
+                }
+            )
         return pending
 
     @staticmethod
     def get_user_latest_pending_session(user_id, user_name=None):
         """ユーザーの最新のPENDING（コメント待ち）セッションを取得（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return None
-
-        all_records = sheet.get_all_values()
-        if not all_records:
-            return None
-
-        headers = all_records[0]
-        col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-        idx_status = col_map.get("status")
-        idx_uid = col_map.get("user_id")
-        idx_name = col_map.get("display_name")
-        idx_comment = col_map.get("comment")
-        idx_dur = col_map.get("duration_min")
-        idx_subj = col_map.get("subject")
-        idx_start = col_map.get("start_time")
-
-        if idx_status is None:
-            return None
-
-        # 後ろから検索
-        for i in range(len(all_records), 1, -1):
-            row = all_records[i - 1]
-            if not row:
+        for row in GSheetService._find_latest_session(user_id, user_name, "PENDING"):
+            if str(row.get("comment", "")).strip():
                 continue
 
-            def get_val(idx):
-                return (
-                    str(row[idx]).strip() if idx is not None and idx < len(row) else ""
-                )
-
-            is_match = False
-            if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                is_match = True
-            elif (
-                user_name
-                and idx_name is not None
-                and get_val(idx_name) == str(user_name)
-            ):
-                is_match = True
-
-            if is_match and get_val(idx_status) == "PENDING":
-                comment = get_val(idx_comment)
-                if not comment:
-                    dur_str = get_val(idx_dur)
-
-                    return {
-                        "row_index": i,
-                        "start_time": get_val(idx_start),
-                        "minutes": int(dur_str) if dur_str.isdigit() else 0,
-                        "subject": get_val(idx_subj),
-                        "state": "WAITING_COMMENT",
-                    }
+            dur_str = str(row.get("duration_min", "")).strip()
+            return {
+                "row_index": row["_row"],
+                "start_time": str(row.get("start_time", "")).strip(),
+                "minutes": int(dur_str) if dur_str.isdigit() else 0,
+                "subject": str(row.get("subject", "")).strip(),
+                "state": "WAITING_COMMENT",
+            }
         return None
 
     @staticmethod
     def approve_study(row_index):
         """学習記録を承認済みに更新（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
+        row = GSheetService.get_row("study_log", row_index)
+        if not row or "status" not in row:
+            return False
+        if row["status"] == "APPROVED":
             return False
+        if not GSheetService.update_fields(
+            "study_log", row_index, {"status": "APPROVED"}
+        ):
+            return False
+        # 承認後に EXP を払うので、ここで書き込みを確定させる
         try:
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-            idx_status = col_map.get("status")
-            if idx_status is None:
-                return False  # Status column not found
-
-            current_status = sheet.cell(row_index, idx_status + 1).value
-            if current_status == "APPROVED":
-                return False
-
-            sheet.update_cell(row_index, idx_status + 1, "APPROVED")
-            return True
-        except:
+            GSheetService.flush_writes()
+        except Exception:
             return False
+        return True
 
     @staticmethod
     def reject_study(row_index):
         """学習記録を却下（REJECTED）に更新（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
+        row = GSheetService.get_row("study_log", row_index)
+        if not row or "status" not in row:
             return False
-        try:
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-            idx_status = col_map.get("status")
-            if idx_status is None:
-                return False
-
-            current_status = sheet.cell(row_index, idx_status + 1).value
-            if current_status == "APPROVED":
-                return False
-
-            sheet.update_cell(row_index, idx_status + 1, "REJECTED")
-            return True
-        except:
+        if row["status"] == "APPROVED":
             return False
+        return GSheetService.update_fields(
+            "study_log", row_index, {"status": "REJECTED"}
+        )
 
     @staticmethod
     def check_timeout_sessions(timeout_minutes=90):
         """制限時間を超えた学習セッションを強制終了する（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return []
+        from services.session_timeouts import session_timeouts
 
         try:
-            all_records = sheet.get_all_values()
-            if not all_records:
-                return []
-
-            headers = all_records[0]
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_status = col_map.get("status")
-            idx_end = col_map.get("end_time")
-            idx_date = col_map.get("date")
-            idx_start = col_map.get("start_time")
-            idx_uid = col_map.get("user_id")
-            idx_subj = col_map.get("subject")
-
-            # 必須カラムチェック
-            if (
-                idx_status is None
-                or idx_end is None
-                or idx_date is None
-                or idx_start is None
-            ):
-                return []
-
+            # シート全体ではなく、進行中として把握している行だけを見る
+            rows = session_timeouts.active_rows()
             expired_sessions = []
 
             now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
 
-            for i in range(1, len(all_records)):
-                row = all_records[i]
-
-                # 安全なアクセス
-                def get_val(idx):
-                    return row[idx] if idx is not None and idx < len(row) else ""
-
-                status = get_val(idx_status)
-                end_time = get_val(idx_end)
+            # 期限切れの行の更新はまとめて1回で書き込む
+            with GSheetService.write_buffer():
+                for row in rows:
+                    # 必須カラムチェック
+                    if not all(k in row for k in ("end_time", "date", "start_time")):
+                        return []
 
-                if status == "STARTED" and end_time == "":
-                    date_str = get_val(idx_date)
-                    start_time_str = get_val(idx_start)
-
-                    try:
-                        start_dt = datetime.datetime.strptime(
-                            f"{date_str} {start_time_str}", "%Y-%m-%d %H:%M:%S"
-                        )
-                        start_dt = start_dt.replace(
-                            tzinfo=datetime.timezone(datetime.timedelta(hours=9))
-                        )
-
-                        duration = now - start_dt
-                        duration_minutes = int(duration.total_seconds() / 60)
-
-                        if duration_minutes >= timeout_minutes:
-                            force_end_dt = start_dt + datetime.timedelta(
-                                minutes=timeout_minutes
-                            )
-                            force_end_time_str = force_end_dt.strftime("%H:%M:%S")
-
-                            row_index = i + 1
-
-                            sheet.update_cell(
-                                row_index, idx_end + 1, force_end_time_str
-                            )
-                            sheet.update_cell(row_index, idx_status + 1, "PENDING")
-
-                            uid = get_val(idx_uid)
-                            subject = get_val(idx_subj)
-
-                            expired_sessions.append(
-                                {
-                                    "user_id": uid,
-                                    "row_index": row_index,
-                                    "minutes": timeout_minutes,
-                                    "subject": subject,
-                                    "start_time": start_time_str,
-                                }
-                            )
-                    except Exception as e:
-                        print(f"Date Parse Error: {e}")
+                    if row["end_time"] != "":
                         continue
 
+                    session = GSheetService._expire_session(row, now, timeout_minutes)
+                    if session:
+                        expired_sessions.append(session)
+
             return expired_sessions
 
         except Exception as e:
             print(f"Check Timeout Error: {e}")
             return []
+
+    @staticmethod
+    def _expire_session(row, now, timeout_minutes):
+        """制限時間を超えていれば終了時刻を入れて PENDING にする"""
+        date_str = row["date"]
+        start_time_str = row["start_time"]
+
+        try:
+            start_dt = datetime.datetime.strptime(
+                f"{date_str} {start_time_str}", "%Y-%m-%d %H:%M:%S"
+            )
+            start_dt = start_dt.replace(
+                tzinfo=datetime.timezone(datetime.timedelta(hours=9))
+            )
+
+            duration = now - start_dt
+            duration_minutes = int(duration.total_seconds() / 60)
+
+            if duration_minutes < timeout_minutes:
+                return None
+
+            force_end_dt = start_dt + datetime.timedelta(minutes=timeout_minutes)
+            force_end_time_str = force_end_dt.strftime("%H:%M:%S")
+
+            row_index = row["_row"]
+            GSheetService.update_fields(
+                "study_log",
+                row_index,
+                {"end_time": force_end_time_str, "status": "PENDING"},
+            )
+
+            return {
+                "user_id": row.get("user_id", ""),
+                "row_index": row_index,
+                "minutes": timeout_minutes,
+                "subject": row.get("subject", ""),
+                "start_time": start_time_str,
+            }
+        except Exception as e:
+            print(f"Date Parse Error: {e}")
+            return None
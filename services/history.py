@@ -1,44 +1,35 @@
 import datetime
 from services.gsheet import GSheetService
 from services.economy import EconomyService
+from services.study_rollup import study_rollup
+from services.leaderboard import weekly_exp_leaderboard
+from services.transaction_index import transaction_index
 
 
 class HistoryService:
+    @staticmethod
+    def _to_record(r, col_time):
+        # 想定カラム: tx_id, user_id, amount, tx_type, related_id, timestamp, user_name
+        amount = str(r.get("amount", ""))
+        return {
+            "tx_id": r.get("tx_id", ""),
+            "user_id": r.get("user_id", ""),
+            "amount": int(amount) if amount and amount.lstrip("-").isdigit() else 0,
+            "tx_type": r.get("tx_type", ""),
+            "related_id": r.get("related_id", ""),
+            "timestamp": r.get(col_time, ""),
+            "user_name": r.get("user_name", ""),
+        }
+
     @staticmethod
     def get_all_transactions():
         """全取引履歴を取得（Web表示用）"""
-        sheet = GSheetService.get_worksheet("transactions")
-        if not sheet:
-            return []
-
         try:
-            # get_all_records はヘッダー依存で不安定なため get_all_values を使用
-            # 想定カラム: tx_id, user_id, amount, tx_type, related_id, timestamp, user_name
-            rows = sheet.get_all_values()
-
-            records = []
-            # ヘッダー行判定 (1行目が "tx_id" ならヘッダーとみなす)
-            start_index = 0
-            if len(rows) > 0 and str(rows[0][0]) == "tx_id":
-                start_index = 1
-
-            for r in rows[start_index:]:
-                if len(r) < 6:
-                    continue
-
-                records.append(
-                    {
-                        "tx_id": r[0],
-                        "user_id": r[1],
-                        "amount": int(r[2])
-                        if r[2] and str(r[2]).lstrip("-").isdigit()
-                        else 0,
-                        "tx_type": r[3],
-                        "related_id": r[4],
-                        "timestamp": r[5],
-                        "user_name": r[6] if len(r) > 6 else "",
-                    }
-                )
+            col_time = GSheetService.resolve_column("transactions", "timestamp", "time")
+            records = [
+                HistoryService._to_record(r, col_time)
+                for r in GSheetService.get_rows("transactions")
+            ]
 
             # 新しい順にソート (timestamp降順)
             sorted_records = sorted(
@@ -49,241 +40,141 @@ class HistoryService:
             print(f"All History Error: {e}")
             return []
 
+    @staticmethod
+    def get_transactions_page(
+        cursor=None, limit=50, user_id=None, tx_type=None, date_from=None, date_to=None
+    ):
+        """
+        管理画面用：新しい順に1ページ分の取引と次ページのカーソルを取得。
+        時刻順インデックスから必要な件数だけ取り出すので、履歴の長さに依存しない。
+        """
+        try:
+            col_time = GSheetService.resolve_column("transactions", "timestamp", "time")
+            rows, next_cursor = transaction_index.page(
+                cursor=cursor,
+                limit=limit,
+                user_id=user_id,
+                tx_type=tx_type,
+                date_from=date_from,
+                date_to=date_to,
+            )
+            return [HistoryService._to_record(r, col_time) for r in rows], next_cursor
+        except Exception as e:
+            print(f"History Page Error: {e}")
+            return [], None
+
     @staticmethod
     def get_admin_history(limit=10):
         """管理用：最近の取引履歴を取得"""
-        all_tx = HistoryService.get_all_transactions()
-        return all_tx[:limit]
+        transactions, _ = HistoryService.get_transactions_page(limit=limit)
+        return transactions
 
     @staticmethod
-    def is_first_study_today(user_id):
-        """その日の最初の勉強かどうか判定"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return False
-
-        now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
-        today_str = now.strftime("%Y-%m-%d")
-
+    def _user_name(user_id):
         # Resolve User Name for fallback
-        user_name = None
         try:
             u_info = EconomyService.get_user_info(user_id)
             if u_info:
-                user_name = u_info.get("display_name")
+                return u_info.get("display_name")
         except:
             pass
+        return None
 
-        try:
-            records = sheet.get_all_values()
-            if not records:
-                return False
-
-            headers = records[0]
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_uid = col_map.get("user_id")
-            idx_name = col_map.get("display_name")
-            idx_date = col_map.get("date")
-            idx_status = col_map.get("status")
+    # その日最初の学習（5分以上）に付くボーナス
+    FIRST_STUDY_BONUS = 30
 
-            if idx_status is None or idx_date is None:
-                return False
-
-            count = 0
-            for row in records[1:]:
-
-                def get_val(idx):
-                    return (
-                        str(row[idx]).strip()
-                        if idx is not None and idx < len(row)
-                        else ""
-                    )
-
-                # ID Check
-                is_match = False
-                if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                    is_match = True
-                elif (
-                    user_name
-                    and idx_name is not None
-                    and get_val(idx_name) == str(user_name)
-                ):
-                    is_match = True
-
-                if not is_match:
-                    continue
-
-                if get_val(idx_date) == today_str:
-                    status = get_val(idx_status)
-                    if status not in ["CANCELLED", "REJECTED"]:
-                        count += 1
+    @staticmethod
+    def study_exp(minutes, is_first_today):
+        """学習で獲得するEXP（学習分数 + その日最初なら初回ボーナス）"""
+        if minutes >= 5 and is_first_today:
+            return minutes + HistoryService.FIRST_STUDY_BONUS
+        return minutes
 
-            # 今のセッションも含まれるため、1なら初回
-            return count == 1
+    @staticmethod
+    def study_exp_of(row):
+        """
+        study_log の行を承認したときに払うEXP。
+        完了時に保存した earned_exp を使い、なければ同じ規則で計算し直す
+        （その日のユーザーの学習のうち、取り消し・却下を除いて最初の行ならボーナス）。
+        """
+        earned = str(row.get("earned_exp", "")).strip()
+        if earned.isdigit():
+            return int(earned)
+        dur = str(row.get("duration_min", "")).strip()
+        minutes = int(dur) if dur.isdigit() else 0
+        rows = GSheetService.get_user_study_rows_on(
+            row.get("user_id"), row.get("display_name"), row.get("date")
+        )
+        counted = [
+            r["_row"]
+            for r in rows
+            if str(r.get("status", "")).strip() not in ["CANCELLED", "REJECTED"]
+        ]
+        is_first = not counted or min(counted) == row["_row"]
+        return HistoryService.study_exp(minutes, is_first)
 
-        except Exception as e:
-            print(f"First Study Check Error: {e}")
-            return False
+    @staticmethod
+    def is_first_study_today(user_id):
+        """その日の最初の勉強かどうか判定"""
+        # 今のセッションも含まれるため、1なら初回
+        return HistoryService.get_today_study_count(user_id) == 1
 
     @staticmethod
     def get_today_study_count(user_id):
         """今日の勉強回数を取得"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return 0
-
         now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
         today_str = now.strftime("%Y-%m-%d")
 
-        # Resolve User Name for fallback
-        user_name = None
-        try:
-            u_info = EconomyService.get_user_info(user_id)
-            if u_info:
-                user_name = u_info.get("display_name")
-        except:
-            pass
+        user_name = HistoryService._user_name(user_id)
 
         try:
-            records = sheet.get_all_values()
-            if not records:
-                return 0
-
-            headers = records[0]
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_uid = col_map.get("user_id")
-            idx_name = col_map.get("display_name")
-            idx_date = col_map.get("date")
-            idx_status = col_map.get("status")
-
-            if idx_status is None or idx_date is None:
-                return 0
-
             count = 0
-            for row in records[1:]:
-
-                def get_val(idx):
-                    return (
-                        str(row[idx]).strip()
-                        if idx is not None and idx < len(row)
-                        else ""
-                    )
-
-                # ID Check
-                is_match = False
-                if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                    is_match = True
-                elif (
-                    user_name
-                    and idx_name is not None
-                    and get_val(idx_name) == str(user_name)
-                ):
-                    is_match = True
-
-                if not is_match:
-                    continue
-
-                if get_val(idx_date) == today_str:
-                    status = get_val(idx_status)
-                    if status not in ["CANCELLED", "REJECTED"]:
-                        count += 1
+            rows = GSheetService.get_user_study_rows_on(user_id, user_name, today_str)
+            for row in rows:
+                status = str(row.get("status", "")).strip()
+                if status not in ["CANCELLED", "REJECTED"]:
+                    count += 1
             return count
         except Exception as e:
             print(f"Study Count Error: {e}")
             return 0
 
+    @staticmethod
+    def _daily_minutes(user_id, dates):
+        """日付ごとの {教科: 分}（承認済みの集計から引く）"""
+        user_name = HistoryService._user_name(user_id)
+        return study_rollup.days(user_id, user_name, dates)
+
     @staticmethod
     def get_user_study_stats(user_id):
         """ユーザーの学習履歴統計（週間・月間）※カレンダー基準"""
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            return {"weekly": 0, "monthly": 0, "total": 0}
-
-        now = datetime.datetime.now()
-        # 今週の月曜日 (0:00:00)
-        week_start = (now - datetime.timedelta(days=now.weekday())).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
-        # 今月の1日 (0:00:00)
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        today = datetime.datetime.now().date()
+        # 今週の月曜日
+        week_start = today - datetime.timedelta(days=today.weekday())
+        # 今月の1日
+        month_start = today.replace(day=1)
 
         stats = {"weekly": 0, "monthly": 0, "total": 0}
 
-        # Resolve User Name for fallback
-        user_name = None
-        try:
-            u_info = EconomyService.get_user_info(user_id)
-            if u_info:
-                user_name = u_info.get("display_name")
-        except:
-            pass
-
         try:
-            records = sheet.get_all_values()
-            if not records:
-                return stats
-
-            headers = records[0]
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_uid = col_map.get("user_id")
-            idx_name = col_map.get("display_name")
-            idx_date = col_map.get("date")
-            idx_status = col_map.get("status")
-            idx_dur = col_map.get("duration_min")
-
-            if idx_status is None or idx_date is None or idx_dur is None:
-                return stats
-
-            for row in records[1:]:
-
-                def get_val(idx):
-                    return (
-                        str(row[idx]).strip()
-                        if idx is not None and idx < len(row)
-                        else ""
-                    )
-
-                # ID Check
-                is_match = False
-                if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                    is_match = True
-                elif (
-                    user_name
-                    and idx_name is not None
-                    and get_val(idx_name) == str(user_name)
-                ):
-                    is_match = True
-
-                if not is_match:
-                    continue
-
-                if get_val(idx_status) != "APPROVED":
-                    continue  # 承認済みのみ
-
-                date_str = get_val(idx_date)
-
-                try:
-                    log_date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
-
-                    minutes = 0
-                    dur_val = get_val(idx_dur)
-                    if dur_val and dur_val.isdigit():
-                        minutes = int(dur_val)
-
-                    stats["total"] += minutes
-
-                    if log_date >= week_start:
-                        stats["weekly"] += minutes
-
-                    if log_date >= month_start:
-                        stats["monthly"] += minutes
-
-                except:
-                    continue
-
+            # 週・月の集計は最大31日分の日別バケットの合計で済む
+            start = min(week_start, month_start)
+            dates = [
+                start + datetime.timedelta(days=i)
+                for i in range((today - start).days + 1)
+            ]
+            for d, subjects in zip(
+                dates, HistoryService._daily_minutes(user_id, dates)
+            ):
+                minutes = sum(subjects.values())
+                if d >= week_start:
+                    stats["weekly"] += minutes
+                if d >= month_start:
+                    stats["monthly"] += minutes
+
+            stats["total"] = study_rollup.total(
+                user_id, HistoryService._user_name(user_id)
+            )
         except Exception as e:
             print(f"Study Stats Error: {e}")
 
@@ -297,113 +188,22 @@ class HistoryService:
         dates = [(now - datetime.timedelta(days=i)) for i in range(6, -1, -1)]
         weekdays = ["月", "火", "水", "木", "金", "土", "日"]
 
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            # シートがない場合でも空のデータを返す
-            return [
-                {
-                    "date": d.strftime("%Y-%m-%d"),
-                    "label": f"{d.month}/{d.day}({weekdays[d.weekday()]})",
-                    "minutes": 0,
-                    "subjects": {},
-                }
-                for d in dates
-            ]
-
-        # date_str keys: "YYYY-MM-DD"
-        # Value structure: {"total": 0, "subjects": {"math": 0, "eng": 0, ...}}
-        daily_map = {
-            d.strftime("%Y-%m-%d"): {"total": 0, "subjects": {}} for d in dates
-        }
-
-        # Resolve Name
-        user_name = None
-        try:
-            u = EconomyService.get_user_info(user_id)
-            if u:
-                user_name = u.get("display_name")
-        except:
-            pass
-
         try:
-            records = sheet.get_all_values()
-            if not records:
-                raise Exception("No records")
-
-            headers = records[0]
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_uid = col_map.get("user_id")
-            idx_name = col_map.get("display_name")
-            idx_date = col_map.get("date")
-            idx_status = col_map.get("status")
-            idx_dur = col_map.get("duration_min")
-            idx_subj = col_map.get("subject")
-
-            for row in records[1:]:
-
-                def get_val(idx):
-                    return (
-                        str(row[idx]).strip()
-                        if idx is not None and idx < len(row)
-                        else ""
-                    )
-
-                # ID Check
-                is_match = False
-                if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                    is_match = True
-                elif (
-                    user_name
-                    and idx_name is not None
-                    and get_val(idx_name) == str(user_name)
-                ):
-                    is_match = True
-
-                if not is_match:
-                    continue
-
-                if idx_status is not None and get_val(idx_status) != "APPROVED":
-                    continue
-
-                if idx_date is None:
-                    continue
-                date_str = get_val(idx_date)
-
-                if date_str in daily_map:
-                    # Subject
-                    subject = get_val(idx_subj) if idx_subj is not None else "その他"
-                    if not subject:
-                        subject = "その他"
-
-                    try:
-                        # Duration
-                        minutes = 0
-                        dur_val = get_val(idx_dur)
-                        if dur_val and dur_val.isdigit():
-                            minutes = int(dur_val)
-
-                        daily_map[date_str]["total"] += minutes
-                        if subject not in daily_map[date_str]["subjects"]:
-                            daily_map[date_str]["subjects"][subject] = 0
-                        daily_map[date_str]["subjects"][subject] += minutes
-                    except:
-                        pass
+            daily = HistoryService._daily_minutes(user_id, dates)
         except Exception as e:
             print(f"Daily Stats Error: {e}")
+            daily = [{} for _ in dates]
 
         # リスト形式に変換
         result = []
-        for d in dates:
-            d_str = d.strftime("%Y-%m-%d")
-            data = daily_map[d_str]
+        for d, subjects in zip(dates, daily):
             label = f"{d.month}/{d.day}({weekdays[d.weekday()]})"
             result.append(
                 {
-                    "date": d_str,
+                    "date": d.strftime("%Y-%m-%d"),
                     "label": label,
-                    "minutes": data["total"],
-                    "subjects": data["subjects"],
+                    "minutes": sum(subjects.values()),
+                    "subjects": subjects,
                 }
             )
         return result
@@ -414,123 +214,29 @@ class HistoryService:
         now = datetime.datetime.now()
         # 過去4週間 (28日間)
         # 4つの期間を作る: [3週間前, 2週間前, 1週間前, 今週]
-        weeks = []
-        for i in range(3, -1, -1):
-            # i=3: 21-27日前, i=0: 0-6日前
-            end_d = now - datetime.timedelta(days=i * 7)
-            start_d = end_d - datetime.timedelta(days=6)
-
-            # 日付比較用にdateオブジェクトにする
-            weeks.append(
-                {
-                    "start_date": start_d.date(),
-                    "end_date": end_d.date(),
-                    "label": f"{start_d.month}/{start_d.day}~",
-                    "total": 0,
-                    "subjects": {},
-                }
-            )
-
-        sheet = GSheetService.get_worksheet("study_log")
-        if not sheet:
-            # シートがない場合でも空のデータを返す
-            result = []
-            for w in weeks:
-                result.append({"label": w["label"], "minutes": 0, "subjects": {}})
-            return result
-
-        # Resolve Name
-        user_name = None
-        try:
-            u = EconomyService.get_user_info(user_id)
-            if u:
-                user_name = u.get("display_name")
-        except:
-            pass
+        start_d = (now - datetime.timedelta(days=27)).date()
+        dates = [start_d + datetime.timedelta(days=i) for i in range(28)]
 
         try:
-            records = sheet.get_all_values()
-            if not records:
-                raise Exception("No records")
-
-            headers = records[0]
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            idx_uid = col_map.get("user_id")
-            idx_name = col_map.get("display_name")
-            idx_date = col_map.get("date")
-            idx_status = col_map.get("status")
-            idx_dur = col_map.get("duration_min")
-            idx_subj = col_map.get("subject")
-
-            for row in records[1:]:
-
-                def get_val(idx):
-                    return (
-                        str(row[idx]).strip()
-                        if idx is not None and idx < len(row)
-                        else ""
-                    )
-
-                # ID Check
-                is_match = False
-                if idx_uid is not None and get_val(idx_uid) == str(user_id):
-                    is_match = True
-                elif (
-                    user_name
-                    and idx_name is not None
-                    and get_val(idx_name) == str(user_name)
-                ):
-                    is_match = True
-
-                if not is_match:
-                    continue
-
-                if idx_status is not None and get_val(idx_status) != "APPROVED":
-                    continue
-
-                if idx_date is None:
-                    continue
-                date_str = get_val(idx_date)
-
-                try:
-                    log_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-
-                    # どの週に該当するかチェック
-                    target_week = None
-                    for w in weeks:
-                        if w["start_date"] <= log_date <= w["end_date"]:
-                            target_week = w
-                            break
-
-                    if target_week:
-                        subject = (
-                            get_val(idx_subj) if idx_subj is not None else "その他"
-                        )
-                        if not subject:
-                            subject = "その他"
-
-                        # Duration
-                        minutes = 0
-                        dur_val = get_val(idx_dur)
-                        if dur_val and dur_val.isdigit():
-                            minutes = int(dur_val)
-
-                        target_week["total"] += minutes
-                        if subject not in target_week["subjects"]:
-                            target_week["subjects"][subject] = 0
-                        target_week["subjects"][subject] += minutes
-
-                except:
-                    pass
+            daily = HistoryService._daily_minutes(user_id, dates)
         except Exception as e:
             print(f"Monthly Stats Error: {e}")
+            daily = [{} for _ in dates]
 
-        # 結果整形
+        # 結果整形 (7日ごとにまとめる)
         result = []
-        for w in weeks:
+        for w in range(4):
+            week_start = dates[w * 7]
+            subjects = {}
+            for day in daily[w * 7 : w * 7 + 7]:
+                for subject, minutes in day.items():
+                    subjects[subject] = subjects.get(subject, 0) + minutes
             result.append(
-                {"label": w["label"], "minutes": w["total"], "subjects": w["subjects"]}
+                {
+                    "label": f"{week_start.month}/{week_start.day}~",
+                    "minutes": sum(subjects.values()),
+                    "subjects": subjects,
+                }
             )
 
         return result
@@ -538,32 +244,23 @@ class HistoryService:
     @staticmethod
     def get_user_job_history(user_id, limit=5):
         """ユーザーの完了したジョブ履歴"""
-        sheet = GSheetService.get_worksheet("jobs")
-        if not sheet:
-            return []
-
         jobs = []
         try:
-            rows = sheet.get_all_values()
-            if len(rows) > 1:
-                # Header: job_id, title, reward, status, client_id, worker_id, deadline
-                for r in rows[1:]:
-                    if len(r) < 6:
-                        continue
-
-                    # Check worker_id (F=5) and status (D=3)
-                    if str(r[5]) == user_id and str(r[3]) == "CLOSED":
-                        jobs.append(
-                            {
-                                "job_id": r[0],
-                                "title": r[1],
-                                "reward": r[2],
-                                "status": r[3],
-                                "client_id": r[4],
-                                "worker_id": r[5],
-                                "deadline": r[6] if len(r) > 6 else "",
-                            }
-                        )
+            rows = GSheetService.get_rows(
+                "jobs", worker_id=str(user_id), status="CLOSED"
+            )
+            for r in rows:
+                jobs.append(
+                    {
+                        "job_id": r.get("job_id", ""),
+                        "title": r.get("title", ""),
+                        "reward": r.get("reward", ""),
+                        "status": r.get("status", ""),
+                        "client_id": r.get("client_id", ""),
+                        "worker_id": r.get("worker_id", ""),
+                        "deadline": r.get("deadline", ""),
+                    }
+                )
 
             # Sort by job_id desc
             sorted_jobs = sorted(jobs, key=lambda x: x.get("job_id", ""), reverse=True)
@@ -575,20 +272,10 @@ class HistoryService:
     @staticmethod
     def get_user_job_count(user_id):
         """ユーザーの完了したジョブ総数"""
-        sheet = GSheetService.get_worksheet("jobs")
-        if not sheet:
-            return 0
-
         try:
-            rows = sheet.get_all_values()
-            count = 0
-            if len(rows) > 1:
-                for r in rows[1:]:
-                    if len(r) < 6:
-                        continue
-                    if str(r[5]) == user_id and str(r[3]) == "CLOSED":
-                        count += 1
-            return count
+            return len(
+                GSheetService.get_rows("jobs", worker_id=str(user_id), status="CLOSED")
+            )
         except Exception as e:
             print(f"Job Count Error: {e}")
             return 0
@@ -609,35 +296,9 @@ class HistoryService:
     @staticmethod
     def get_weekly_exp_ranking():
         """今週の獲得EXPランキング（USERのみ）"""
-        sheet = GSheetService.get_worksheet("transactions")
-        if not sheet:
-            return []
-
-        now = datetime.datetime.now()
-        week_start = now - datetime.timedelta(days=7)
-
-        user_exp = {}  # {user_id: total_exp}
-
         try:
-            records = sheet.get_all_records()
-            for tx in records:
-                # tx: tx_id, user_id, amount, tx_type, related_id, timestamp
-                if tx.get("tx_type") != "REWARD":
-                    continue
-
-                ts_str = str(tx.get("timestamp"))
-                try:
-                    # フォーマットは "YYYY-MM-DD HH:MM:SS"
-                    tx_date = datetime.datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                except:
-                    continue
-
-                if tx_date < week_start:
-                    continue
-
-                uid = str(tx.get("user_id"))
-                amount = int(tx.get("amount", 0))
-                user_exp[uid] = user_exp.get(uid, 0) + amount
+            # {user_id: total_exp} は add_exp のたびに更新される集計から引く
+            user_exp = weekly_exp_leaderboard.weekly_totals()
 
             # ユーザー情報と結合してフィルタリング
             all_users = EconomyService.get_all_users()
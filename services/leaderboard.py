@@ -0,0 +1,96 @@
+import datetime
+
+from services.table_index import TableIndex
+
+
+class WeeklyExpLeaderboard(TableIndex):
+    """
+    transactions シートの REWARD を日別・ユーザー別に積み上げた集計。
+    add_exp の追記は TableIndex の差分反映でそのまま加算されるので、
+    ランキングの計算で transactions シートを読み直すことはない。
+    集計期間 (WINDOW_DAYS) より前の日の分は持たずに捨てる。
+    """
+
+    table = "transactions"
+    WINDOW_DAYS = 7
+
+    def _clear(self):
+        # {日付: {user_id: 合計}}
+        self._daily = {}
+        # {日付: [(時刻, user_id, 額), ...]} 期間の境目の日だけ時刻まで見るために持つ
+        self._entries = {}
+        # 集計に残している最初の日
+        self._first_day = None
+
+    def _cutoff(self):
+        """集計に残す最初の日（これより前の日は捨てる）"""
+        now = datetime.datetime.now()
+        return (now - datetime.timedelta(days=self.WINDOW_DAYS)).date()
+
+    def _prune(self):
+        cutoff = self._cutoff()
+        if cutoff == self._first_day:
+            return cutoff
+        for day in [d for d in self._daily if d < cutoff]:
+            del self._daily[day]
+            self._entries.pop(day, None)
+        self._first_day = cutoff
+        return cutoff
+
+    @staticmethod
+    def _entry(row):
+        if str(row.get("tx_type", "")).strip() != "REWARD":
+            return None
+        ts_str = str(row.get("timestamp", row.get("time", "")))
+        try:
+            # フォーマットは "YYYY-MM-DD HH:MM:SS"
+            ts = datetime.datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
+            amount = int(row.get("amount") or 0)
+        except ValueError:
+            return None
+        return ts, str(row.get("user_id")), amount
+
+    def _apply_row(self, row, sign):
+        entry = self._entry(row)
+        if entry is None:
+            return
+        ts, uid, amount = entry
+        day = ts.date()
+        if day < self._prune():
+            return
+        totals = self._daily.setdefault(day, {})
+        totals[uid] = totals.get(uid, 0) + sign * amount
+        entries = self._entries.setdefault(day, [])
+        if sign > 0:
+            entries.append(entry)
+        elif entry in entries:
+            entries.remove(entry)
+
+    def _add(self, row):
+        self._apply_row(row, 1)
+
+    def _remove(self, row):
+        self._apply_row(row, -1)
+
+    def weekly_totals(self, now=None):
+        """直近7日間 (現在時刻から遡って) の獲得EXP {user_id: 合計}"""
+        self._ensure()
+        now = now or datetime.datetime.now()
+        week_start = now - datetime.timedelta(days=self.WINDOW_DAYS)
+
+        user_exp = {}
+        with self._lock:
+            self._prune()
+            # 境目の日は時刻で絞り込む
+            for ts, uid, amount in self._entries.get(week_start.date(), ()):
+                if ts >= week_start:
+                    user_exp[uid] = user_exp.get(uid, 0) + amount
+            # それ以降の日は日別の合計をそのまま足す
+            for i in range(1, (now.date() - week_start.date()).days + 1):
+                day = week_start.date() + datetime.timedelta(days=i)
+                for uid, amount in self._daily.get(day, {}).items():
+                    user_exp[uid] = user_exp.get(uid, 0) + amount
+        return user_exp
+
+
+weekly_exp_leaderboard = WeeklyExpLeaderboard()
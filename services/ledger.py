@@ -0,0 +1,112 @@
+import bisect
+
+from services.table_index import TableIndex
+
+
+def parse_int(value):
+    try:
+        return int(str(value).strip() or 0)
+    except ValueError:
+        return 0
+
+
+class Ledger(TableIndex):
+    """
+    transactions シート（追記のみの台帳）のユーザー別インデックス。
+    ユーザーごとに (行番号, 額) を行番号順に持ち、
+    チェックポイント以降の分 (tail) だけを合計できるようにする。
+    """
+
+    table = "transactions"
+
+    def _clear(self):
+        self._entries = {}  # {user_id: [(行番号, 額), ...]}
+        self._last_row = 1
+
+    def _add(self, row):
+        entries = self._entries.setdefault(str(row.get("user_id", "")), [])
+        bisect.insort(entries, (row["_row"], parse_int(row.get("amount"))))
+        self._last_row = max(self._last_row, row["_row"])
+
+    def _remove(self, row):
+        user_id = str(row.get("user_id", ""))
+        entries = self._entries.get(user_id)
+        entry = (row["_row"], parse_int(row.get("amount")))
+        if entries and entry in entries:
+            entries.remove(entry)
+            if not entries:
+                del self._entries[user_id]
+
+    def last_row(self):
+        """台帳の最後の行番号（空ならヘッダー行の 1）"""
+        self._ensure()
+        with self._lock:
+            return self._last_row
+
+    def tail(self, user_id, after_row):
+        """after_row より後の (合計, 件数, 最後の行番号)"""
+        self._ensure()
+        with self._lock:
+            entries = self._entries.get(str(user_id), [])
+            i = bisect.bisect_right(entries, (after_row, float("inf")))
+            tail = entries[i:]
+            last = tail[-1][0] if tail else after_row
+            return sum(amount for _, amount in tail), len(tail), last
+
+
+class BalanceCheckpoints(TableIndex):
+    """
+    balance_checkpoints シートのユーザー別インデックス。
+    各行は「台帳の ledger_row 行目までを反映した残高 balance」を表す。
+    reason が SEED / RESET の行は残高の起点で、AUTO の行は途中経過の記録。
+    """
+
+    table = "balance_checkpoints"
+
+    def _clear(self):
+        self._by_user = {}  # {user_id: [(ledger_row, 行番号, 残高, reason), ...]}
+
+    @staticmethod
+    def _entry(row):
+        return (
+            parse_int(row.get("ledger_row")),
+            row["_row"],
+            parse_int(row.get("balance")),
+            str(row.get("reason", "")),
+        )
+
+    def _add(self, row):
+        entries = self._by_user.setdefault(str(row.get("user_id", "")), [])
+        bisect.insort(entries, self._entry(row))
+
+    def _remove(self, row):
+        user_id = str(row.get("user_id", ""))
+        entries = self._by_user.get(user_id)
+        entry = self._entry(row)
+        if entries and entry in entries:
+            entries.remove(entry)
+            if not entries:
+                del self._by_user[user_id]
+
+    def latest(self, user_id):
+        """最新のチェックポイント (ledger_row, 残高)。なければ None"""
+        self._ensure()
+        with self._lock:
+            entries = self._by_user.get(str(user_id))
+            if not entries:
+                return None
+            ledger_row, _, balance, _ = entries[-1]
+            return ledger_row, balance
+
+    def all(self):
+        """{user_id: [(ledger_row, 残高, reason), ...]}（ledger_row 順）"""
+        self._ensure()
+        with self._lock:
+            return {
+                user_id: [(e[0], e[2], e[3]) for e in entries]
+                for user_id, entries in self._by_user.items()
+            }
+
+
+ledger = Ledger()
+balance_checkpoints = BalanceCheckpoints()
@@ -0,0 +1,211 @@
+import datetime
+import heapq
+import os
+import threading
+import time
+
+from services.gsheet import GSheetService
+from services.table_index import TableIndex
+from utils.process_lock import ProcessLock
+from utils.request_context import RequestContext
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+class SessionTimeouts(TableIndex):
+    """
+    進行中 (STARTED) の学習セッションの期限を持つ min-heap。
+    log_activity の追記で積まれ、終了・キャンセルでステータスが変わると外れる
+    （TableIndex の差分反映）。起動時は study_log から作り直して復元し、
+    以降は追記された行と進行中の行だけを読み直して差分で更新する。
+    バックグラウンドスレッドが次の期限ちょうどに起きてタイムアウト処理を行う。
+    同じホストの複数ワーカーのうち、ファイルロックを取れた1プロセスだけが処理する。
+    """
+
+    table = "study_log"
+    TIMEOUT_MINUTES = 90
+    # 期限がなくても外部の変更（シートの手編集・他ワーカー）を拾うために起きる間隔
+    IDLE_INTERVAL = 300
+
+    def __init__(self):
+        super().__init__()
+        self._cond = threading.Condition(self._lock)
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._process_lock = ProcessLock(
+            os.environ.get("SESSION_TIMEOUT_LOCK", "data/session_timeouts.lock")
+        )
+        self._on_expire = None
+
+    def _clear(self):
+        self._heap = []
+        # {行番号: 期限 (epoch 秒)}。heap からは遅延削除する
+        self._deadlines = {}
+        # 読み込み済みの最後の行（これより後を追記分として読む）
+        self._last_row = 1
+        self._refreshed_at = time.monotonic()
+
+    @staticmethod
+    def _start_of(row):
+        try:
+            start = datetime.datetime.strptime(
+                f"{row.get('date', '')} {row.get('start_time', '')}",
+                "%Y-%m-%d %H:%M:%S",
+            )
+        except ValueError:
+            return None
+        return start.replace(tzinfo=JST)
+
+    def _add(self, row):
+        self._last_row = max(self._last_row, row["_row"])
+        if str(row.get("status", "")).strip() != "STARTED":
+            return
+        if str(row.get("end_time", "")).strip():
+            return
+        start = self._start_of(row)
+        if start is None:
+            return
+        deadline = (
+            start + datetime.timedelta(minutes=self.TIMEOUT_MINUTES)
+        ).timestamp()
+        self._deadlines[row["_row"]] = deadline
+        heapq.heappush(self._heap, (deadline, row["_row"]))
+        # 待機中のスレッドに新しい期限を知らせる
+        if hasattr(self, "_cond"):
+            self._cond.notify_all()
+
+    def _remove(self, row):
+        self._deadlines.pop(row["_row"], None)
+
+    def _ensure(self):
+        """
+        最初（と行削除の後）だけ study_log 全体から作る。
+        以降は自プロセスの書き込み (apply) と _refresh の差分で更新する。
+        """
+        with self._lock:
+            if self._version is not None:
+                return
+        super()._ensure()
+
+    def apply(self, op, row_index, fields, before, after):
+        # シート全体の版数に関係なく差分を反映する（外部の変更は _refresh で拾う）
+        with self._lock:
+            if self._version is None:
+                return
+            super().apply(op, row_index, fields, self._version, self._version)
+
+    def _refresh(self):
+        """
+        前回以降に追記された行と、進行中として持っている行だけを読み直す
+        （他のワーカーで始まった・終わったセッションを、シート全体を読まずに拾う）。
+        """
+        self._ensure()
+        with self._lock:
+            after = self._last_row
+            active = list(self._deadlines)
+        rows = GSheetService.get_rows_after(self.table, after)
+        rows += GSheetService.get_rows_at(self.table, active)
+        with self._lock:
+            for row in rows:
+                old = self._rows.get(row["_row"])
+                if old is not None:
+                    self._remove(old)
+                self._insert(row)
+            self._refreshed_at = time.monotonic()
+
+    def _next_deadline(self):
+        """heap の先頭から外れた行を捨てて、次の期限を返す"""
+        while self._heap:
+            deadline, row_index = self._heap[0]
+            if self._deadlines.get(row_index) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def active_rows(self):
+        """進行中のセッションの行（期限の早い順）"""
+        self._ensure()
+        with self._lock:
+            rows = sorted(self._deadlines, key=self._deadlines.get)
+            return [self._copy(r) for r in rows]
+
+    def run_once(self, on_expire=None, timeout_minutes=None):
+        """
+        期限を過ぎたセッションを終了させ、on_expire(sessions) で事後処理する。
+        スレッドと cron のどちらから呼ばれても、同じセッションを2回処理しない。
+        """
+        on_expire = on_expire or self._on_expire
+        timeout_minutes = timeout_minutes or self.TIMEOUT_MINUTES
+
+        with self._run_lock:
+            # ロックを持つ1プロセスだけが処理する（スケジューラを止めている場合は
+            # cron を受けたプロセスがその間だけ持つ）
+            owned = self._process_lock.held
+            if not owned and not self._process_lock.acquire():
+                return []
+            try:
+                # 他のワーカーで終わったセッションを期限切れにしないよう、先に読み直す
+                self._refresh()
+                with RequestContext.scope(), GSheetService.write_buffer():
+                    sessions = GSheetService.check_timeout_sessions(
+                        timeout_minutes=timeout_minutes
+                    )
+                    if sessions and on_expire:
+                        # 通知と状態更新
+                        on_expire(sessions)
+                return sessions
+            finally:
+                if not owned and not (self._thread and self._thread.is_alive()):
+                    self._process_lock.release()
+
+    def start(self, on_expire):
+        """次の期限ちょうどに run_once を呼ぶバックグラウンドスレッドを起動"""
+        self._on_expire = on_expire
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    # 同じホストのワーカーのうち、ロックを取れた1つだけが期限を監視する
+                    if not self._process_lock.acquire():
+                        self._stop.wait(self.IDLE_INTERVAL)
+                        continue
+                    # 起動直後はここで study_log から heap を復元する
+                    self._ensure()
+                    if time.monotonic() - self._refreshed_at >= self.IDLE_INTERVAL:
+                        self._refresh()
+                    now = datetime.datetime.now(JST).timestamp()
+                    with self._lock:
+                        deadline = self._next_deadline()
+                    if deadline is not None and deadline <= now:
+                        self.run_once()
+                        # 書き込みに失敗した行で空回りしないよう少し待つ
+                        self._stop.wait(1)
+                        continue
+                    wait = self.IDLE_INTERVAL
+                    if deadline is not None:
+                        wait = min(wait, deadline - now)
+                    with self._cond:
+                        self._cond.wait(wait)
+                except Exception as e:
+                    print(f"Session Timeout Error: {e}")
+                    self._stop.wait(10)
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=run, name="session-timeouts", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._process_lock.release()
+
+
+session_timeouts = SessionTimeouts()
@@ -8,37 +8,28 @@ class ShopService:
     @staticmethod
     def create_request(user_id, item_key, cost, comment="", user_name=""):
         """購入リクエストを作成（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("shop_requests")
-        if not sheet:
-            return False
-
         try:
             req_id = f"req_{int(datetime.datetime.now().timestamp())}"
             now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            row_data = [""] * len(headers)
-
-            def set_val(key, val, alt_key=None):
-                idx = col_map.get(key)
-                if idx is None and alt_key:
-                    idx = col_map.get(alt_key)
-
-                if idx is not None:
-                    row_data[idx] = val
-
-            set_val("request_id", req_id, "id")
-            set_val("user_id", user_id)
-            set_val("display_name", user_name, "user_name")
-            set_val("item_key", item_key, "item")
-            set_val("cost", cost)
-            set_val("status", "PENDING")
-            set_val("timestamp", now_str, "time")
-            set_val("comment", comment)
-
-            sheet.append_row(row_data)
+            def col(key, alt_key):
+                return GSheetService.resolve_column("shop_requests", key, alt_key)
+
+            row_index = GSheetService.append(
+                "shop_requests",
+                {
+                    col("request_id", "id"): req_id,
+                    "user_id": user_id,
+                    col("display_name", "user_name"): user_name,
+                    col("item_key", "item"): item_key,
+                    "cost": cost,
+                    "status": "PENDING",
+                    col("timestamp", "time"): now_str,
+                    "comment": comment,
+                },
+            )
+            if not row_index:
+                return False
             return req_id
         except Exception as e:
             print(f"Shop Request Error: {e}")
@@ -47,70 +38,51 @@ class ShopService:
     @staticmethod
     def get_pending_requests():
         """承認待ちの購入リクエストを取得（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("shop_requests")
-        if not sheet:
-            return []
-
         pending = []
         try:
-            rows = sheet.get_all_values()
-            if len(rows) > 1:
-                headers = rows[0]
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-                idx_status = col_map.get("status")
-                if idx_status is None:
-                    return []
-
-                def get_val(r, key):
-                    idx = col_map.get(key)
-                    return r[idx] if idx is not None and idx < len(r) else ""
-
-                for r in rows[1:]:
-                    if get_val(r, "status") == "PENDING":
-                        # Convert to dict expected by caller
-                        row_dict = {k: get_val(r, k) for k in col_map.keys()}
-                        # Ensure 'time' exists if timestamp was used
-                        if "time" not in row_dict and "timestamp" in row_dict:
-                            row_dict["time"] = row_dict["timestamp"]
-                        pending.append(row_dict)
+            for r in GSheetService.get_rows("shop_requests", status="PENDING"):
+                # Convert to dict expected by caller
+                row_dict = {k: v for k, v in r.items() if k != "_row"}
+                # Ensure 'time' exists if timestamp was used
+                if "time" not in row_dict and "timestamp" in row_dict:
+                    row_dict["time"] = row_dict["timestamp"]
+                pending.append(row_dict)
         except Exception as e:
             print(f"Shop Pending Error: {e}")
         return pending
 
     @staticmethod
-    def approve_request(request_id):
-        """購入リクエストを承認（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("shop_requests")
-        if not sheet:
-            return False
-
-        try:
-            # request_id は文字列であることを保証する
-            cell = sheet.find(str(request_id))
-            if not cell:
-                return False
+    def _find_request(request_id):
+        # request_id は文字列であることを保証する
+        col_id = GSheetService.resolve_column("shop_requests", "request_id", "id")
+        return GSheetService.find_row("shop_requests", col_id, str(request_id))
 
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-            idx_status = col_map.get("status")
-            idx_item = col_map.get("item_key")
+    @staticmethod
+    def _close_request(request_id, status):
+        """PENDING のリクエストを指定ステータスにし、商品キーを返す"""
+        row = ShopService._find_request(request_id)
+        if not row or "status" not in row:
+            return False
 
-            if idx_status is None:
-                return False
+        # ステータスチェック (PENDING以外なら処理しない)
+        if row["status"] != "PENDING":
+            return False
 
-            # ステータスチェック (PENDING以外なら処理しない)
-            current_status = sheet.cell(cell.row, idx_status + 1).value
-            if current_status != "PENDING":
-                return False
+        if not GSheetService.update_fields(
+            "shop_requests", row["_row"], {"status": status}
+        ):
+            return False
+        # 却下では EXP を返すので、返す前に書き込みを確定させる
+        GSheetService.flush_writes()
 
-            sheet.update_cell(cell.row, idx_status + 1, "APPROVED")
+        # 商品キーを返す（アイテム名取得用）
+        return row.get("item_key")
 
-            # 商品キーを返す（アイテム名取得用）
-            item_key = None
-            if idx_item is not None:
-                item_key = sheet.cell(cell.row, idx_item + 1).value
-            return item_key
+    @staticmethod
+    def approve_request(request_id):
+        """購入リクエストを承認（動的カラムマッピング）"""
+        try:
+            return ShopService._close_request(request_id, "APPROVED")
         except Exception as e:
             print(f"Shop Approve Error: {e}")
             return False
@@ -118,36 +90,8 @@ class ShopService:
     @staticmethod
     def deny_request(request_id):
         """購入リクエストを却下（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("shop_requests")
-        if not sheet:
-            return False
-
         try:
-            # request_id は文字列であることを保証する
-            cell = sheet.find(str(request_id))
-            if not cell:
-                return False
-
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-            idx_status = col_map.get("status")
-            idx_item = col_map.get("item_key")
-
-            if idx_status is None:
-                return False
-
-            # ステータスチェック (PENDING以外なら処理しない)
-            current_status = sheet.cell(cell.row, idx_status + 1).value
-            if current_status != "PENDING":
-                return False
-
-            sheet.update_cell(cell.row, idx_status + 1, "DENIED")
-
-            # 商品キーを返す（アイテム名取得用）
-            item_key = None
-            if idx_item is not None:
-                item_key = sheet.cell(cell.row, idx_item + 1).value
-            return item_key
+            return ShopService._close_request(request_id, "DENIED")
         except Exception as e:
             print(f"Shop Deny Error: {e}")
             return False
@@ -156,58 +100,40 @@ class ShopService:
     @cached(shop_items_cache)
     def get_items():
         """スプレッドシートから商品リストを取得（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("shop_items")
-        if not sheet:
-            return {}
-
         try:
-            rows = sheet.get_all_values()
-            items = OrderedDict()
+            header = GSheetService.get_header("shop_items")
+            if "item_key" not in header or "name" not in header:
+                return {}
 
-            if len(rows) > 1:
-                headers = rows[0]
-                col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-                idx_key = col_map.get("item_key")
-                idx_name = col_map.get("name")
-                idx_cost = col_map.get("cost")
-                idx_active = col_map.get("is_active")
-                idx_desc = col_map.get("description")
-
-                if idx_key is None or idx_name is None:
-                    return {}
-
-                def get_val(r, idx):
-                    return r[idx] if idx is not None and idx < len(r) else ""
-
-                for r in rows[1:]:
-                    is_active = "TRUE"  # Default if missing
-                    if idx_active is not None:
-                        is_active = str(get_val(r, idx_active)).strip().upper()
-
-                    if is_active == "TRUE":
-                        key = get_val(r, idx_key)
-                        name = get_val(r, idx_name)
-
-                        # 名前が空の場合はスキップ (LINE Flex Messageでエラーになるため)
-                        if not name:
-                            continue
-
-                        cost = 999999
-                        cost_str = get_val(r, idx_cost) if idx_cost is not None else ""
-                        try:
-                            if cost_str:
-                                cost = int(cost_str)
-                        except:
-                            pass
-
-                        desc = get_val(r, idx_desc) if idx_desc is not None else ""
-
-                        items[key] = {
-                            "name": name,
-                            "cost": cost,
-                            "description": desc,
-                        }
+            items = OrderedDict()
+            for r in GSheetService.get_rows("shop_items"):
+                is_active = "TRUE"  # Default if missing
+                if "is_active" in r:
+                    is_active = str(r["is_active"]).strip().upper()
+
+                if is_active != "TRUE":
+                    continue
+
+                key = r["item_key"]
+                name = r["name"]
+
+                # 名前が空の場合はスキップ (LINE Flex Messageでエラーになるため)
+                if not name:
+                    continue
+
+                cost = 999999
+                cost_str = r.get("cost", "")
+                try:
+                    if cost_str:
+                        cost = int(cost_str)
+                except:
+                    pass
+
+                items[key] = {
+                    "name": name,
+                    "cost": cost,
+                    "description": r.get("description", ""),
+                }
             return items
         except Exception as e:
             print(f"【Error】商品リスト取得エラー: {e}")
@@ -216,30 +142,22 @@ class ShopService:
     @staticmethod
     def add_item(name, cost, description=""):
         """新しい商品をショップに追加（動的カラムマッピング）"""
-        sheet = GSheetService.get_worksheet("shop_items")
-        if not sheet:
-            return False, "シートエラー"
-
         try:
             item_key = f"item_{int(datetime.datetime.now().timestamp())}"
 
-            headers = sheet.row_values(1)
-            col_map = {str(h).strip(): i for i, h in enumerate(headers)}
-
-            row_data = [""] * len(headers)
-
-            def set_val(key, val):
-                idx = col_map.get(key)
-                if idx is not None:
-                    row_data[idx] = val
-
-            set_val("item_key", item_key)
-            set_val("name", name)
-            set_val("cost", cost)
-            set_val("description", description)
-            set_val("is_active", "TRUE")
-
-            sheet.append_row(row_data)
+            row_index = GSheetService.append(
+                "shop_items",
+                {
+                    "item_key": item_key,
+                    "name": name,
+                    "cost": cost,
+                    "description": description,
+                    "is_active": "TRUE",
+                },
+            )
+            if not row_index:
+                return False, "シートエラー"
+            shop_items_cache.clear()
             return True, item_key
         except Exception as e:
             print(f"Add Item Error: {e}")
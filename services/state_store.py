@@ -0,0 +1,258 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class StateEngine:
+    """会話状態の保存先の共通インターフェース（値は JSON にできるもの）"""
+
+    name = "base"
+
+    def get(self, namespace, key):
+        raise NotImplementedError
+
+    def set(self, namespace, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def add(self, namespace, key, value, ttl):
+        """キーがない（期限切れを含む）ときだけ保存して True を返す"""
+        raise NotImplementedError
+
+
+class MemoryStateEngine(StateEngine):
+    """
+    プロセス内の辞書に持つエンジン（ワーカー1つ向け）。
+    共有エンジンと同じ振る舞いになるよう、値は JSON で複製して出し入れする。
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def get(self, namespace, key):
+        with self._lock:
+            item = self._data.get((namespace, key))
+            if item is None:
+                return None
+            raw, expires_at = item
+            if expires_at and expires_at <= time.time():
+                del self._data[(namespace, key)]
+                return None
+        return json.loads(raw)
+
+    def set(self, namespace, key, value, ttl):
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + ttl if ttl else 0
+        with self._lock:
+            self._data[(namespace, key)] = (raw, expires_at)
+            if len(self._data) % 256 == 0:
+                self._purge()
+
+    def delete(self, namespace, key):
+        with self._lock:
+            return self._data.pop((namespace, key), None) is not None
+
+    def add(self, namespace, key, value, ttl):
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            item = self._data.get((namespace, key))
+            if item is not None and not (item[1] and item[1] <= now):
+                return False
+            self._data[(namespace, key)] = (raw, now + ttl if ttl else 0)
+            if len(self._data) % 256 == 0:
+                self._purge()
+            return True
+
+    def _purge(self):
+        now = time.time()
+        for k in [k for k, (_, e) in self._data.items() if e and e <= now]:
+            del self._data[k]
+
+
+class SQLiteStateEngine(StateEngine):
+    """
+    ローカルディスクの SQLite (WAL) に持つエンジン。
+    同じマシンの gunicorn ワーカー間で共有でき、再起動しても会話の途中から続けられる。
+    """
+
+    name = "sqlite"
+    PURGE_INTERVAL = 300
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        row = (
+            self._conn()
+            .execute(
+                "SELECT value, expires_at FROM state WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        if row[1] and row[1] <= time.time():
+            self.delete(namespace, key)
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl):
+        raw = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + ttl if ttl else 0
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) "
+            "VALUES (?, ?, ?, ?)",
+            (namespace, key, raw, expires_at),
+        )
+        self._purge(conn)
+
+    def delete(self, namespace, key):
+        cur = self._conn().execute(
+            "DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        return cur.rowcount > 0
+
+    def add(self, namespace, key, value, ttl):
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        conn = self._conn()
+        # 期限切れの行だけ上書きする（生きている行があれば何もしない）
+        cur = conn.execute(
+            "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(namespace, key) DO UPDATE SET "
+            "value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE state.expires_at > 0 AND state.expires_at <= ?",
+            (namespace, key, raw, now + ttl if ttl else 0, now),
+        )
+        self._purge(conn)
+        return cur.rowcount > 0
+
+    def _purge(self, conn):
+        now = time.time()
+        if now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        conn.execute(
+            "DELETE FROM state WHERE expires_at > 0 AND expires_at <= ?", (now,)
+        )
+
+
+_engines = {}
+_engine_lock = threading.Lock()
+
+
+def state_engine(backend=None):
+    """
+    保存先を取得（STATE_BACKEND=memory|sqlite）。
+    backend を指定すると、STATE_BACKEND に関係なくその保存先を使う。
+    """
+    backend = (backend or os.environ.get("STATE_BACKEND", "memory")).lower()
+    if backend != "sqlite":
+        backend = "memory"
+    engine = _engines.get(backend)
+    if engine is None:
+        with _engine_lock:
+            engine = _engines.get(backend)
+            if engine is None:
+                if backend == "sqlite":
+                    path = os.environ.get("STATE_DB_PATH", "data/state.db")
+                    engine = SQLiteStateEngine(path)
+                else:
+                    engine = MemoryStateEngine()
+                _engines[backend] = engine
+    return engine
+
+
+class StateMap:
+    """
+    名前空間つきの会話状態。辞書と同じように使える。
+    取り出した値は複製なので、中身を書き換えたら必ず代入し直すこと。
+        states = StateMap("study", ttl=3600)
+        states[user_id] = {"state": "WAITING_COMMENT"}
+    backend を指定すると STATE_BACKEND ではなくその保存先に置く。
+    """
+
+    def __init__(self, namespace, ttl=None, backend=None):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl if ttl is not None else int(os.environ.get("STATE_TTL", "86400"))
+
+    def get(self, key, default=None):
+        try:
+            value = state_engine(self.backend).get(self.namespace, str(key))
+        except Exception as e:
+            print(f"State Read Error ({self.namespace}): {e}")
+            return default
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        try:
+            state_engine(self.backend).set(self.namespace, str(key), value, self.ttl)
+        except Exception as e:
+            print(f"State Write Error ({self.namespace}): {e}")
+
+    def __delitem__(self, key):
+        if self.pop(key) is None:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def claim(self, key, value=True):
+        """
+        キーを初めて見たときだけ記録して True を返す（既にあれば False）。
+        確認と記録を1回の操作で行うので、複数スレッド・ワーカーでも1つだけが True になる。
+        保存先に書けなかった場合は処理を止めないよう True を返す。
+        """
+        try:
+            return state_engine(self.backend).add(
+                self.namespace, str(key), value, self.ttl
+            )
+        except Exception as e:
+            print(f"State Write Error ({self.namespace}): {e}")
+            return True
+
+    def pop(self, key, default=None):
+        value = self.get(key)
+        try:
+            state_engine(self.backend).delete(self.namespace, str(key))
+        except Exception as e:
+            print(f"State Delete Error ({self.namespace}): {e}")
+        return default if value is None else value
@@ -1,3 +1,4 @@
+import bisect
 import math
 
 
@@ -7,24 +8,63 @@ class SagaStats:
     STD_J1 = 45
     SAGANISHI_LIMIT = 240
 
+    # 偏差値の下限と相当する高校レベル（佐賀県モデル、bisect で引くため昇順）
+    SCHOOL_LEVELS = [
+        (38, "佐賀北稜高校"),
+        (40, "佐賀工業高校"),
+        (45, "佐賀商業高校"),
+        (50, "佐賀東高校"),
+        (55, "佐賀北高校"),
+        (60, "致遠館高校"),
+        (68, "佐賀西高校"),
+    ]
+    SCHOOL_LEVEL_BASE = "基礎固めが必要"
+    _SCHOOL_BOUNDS = [b for b, _ in SCHOOL_LEVELS]
+
+    # 累計学習時間（分）の下限とランク
+    RANK_TIERS = [
+        (0, "E"),
+        (300, "D"),
+        (1200, "C"),
+        (3600, "B"),
+        (7200, "A"),
+        (12000, "S"),
+    ]
+    _TIER_BOUNDS = [b for b, _ in RANK_TIERS]
+
+    # 期間（日数）ごとの (平均, 標準偏差, 0分のときの順位)
+    _periods = {}
+
+    @staticmethod
+    def _period(days):
+        period = SagaStats._periods.get(days)
+        if period is None:
+            # 期間に応じた平均と標準偏差を推定
+            # 平均は日数倍、標準偏差は√日数倍（独立試行を仮定）
+            mean = SagaStats.MEAN_J1 * days
+            std = SagaStats.STD_J1 * math.sqrt(days)
+            # ごぼう抜き計算の基準 (0分だった場合の順位)
+            zero_rank = SagaStats._rank_of((0 - mean) / std)
+            period = SagaStats._periods[days] = (mean, std, zero_rank)
+        return period
+
+    @staticmethod
+    def _rank_of(z_score):
+        # 上位%計算
+        p_value = 0.5 * (1 + math.erf(z_score / math.sqrt(2)))
+        return int(SagaStats.POPULATION_J1 * (1 - p_value))
+
     @staticmethod
     def get_school_level(deviation):
         """偏差値から相当する高校レベルを判定（佐賀県モデル）"""
-        if deviation >= 68:
-            return "佐賀西高校"
-        if deviation >= 60:
-            return "致遠館高校"
-        if deviation >= 55:
-            return "佐賀北高校"
-        if deviation >= 50:
-            return "佐賀東高校"
-        if deviation >= 45:
-            return "佐賀商業高校"
-        if deviation >= 40:
-            return "佐賀工業高校"
-        if deviation >= 38:
-            return "佐賀北稜高校"
-        return "基礎固めが必要"
+        i = bisect.bisect_right(SagaStats._SCHOOL_BOUNDS, deviation)
+        return SagaStats.SCHOOL_LEVELS[i - 1][1] if i else SagaStats.SCHOOL_LEVEL_BASE
+
+    @staticmethod
+    def rank_tier(total_minutes):
+        """累計学習時間からランク文字 (E〜S) を判定"""
+        i = bisect.bisect_right(SagaStats._TIER_BOUNDS, total_minutes)
+        return SagaStats.RANK_TIERS[max(i - 1, 0)][1]
 
     @staticmethod
     def calculate(study_minutes):
@@ -46,32 +86,70 @@ class SagaStats:
         if study_minutes <= 0:
             return None
 
-        # 期間に応じた平均と標準偏差を推定
-        # 平均は日数倍、標準偏差は√日数倍（独立試行を仮定）
-        mean = SagaStats.MEAN_J1 * days
-        std = SagaStats.STD_J1 * math.sqrt(days)
-
+        mean, std, zero_rank = SagaStats._period(days)
         z_score = (study_minutes - mean) / std
         deviation = z_score * 10 + 50
+        rank = max(SagaStats._rank_of(z_score), 1)
+        return SagaStats._result(deviation, rank, zero_rank)
 
-        # 上位%計算
-        p_value = 0.5 * (1 + math.erf(z_score / math.sqrt(2)))
-        top_percent = 1 - p_value
-
-        rank = int(SagaStats.POPULATION_J1 * top_percent)
-        if rank < 1:
-            rank = 1
-
-        # ごぼう抜き計算 (0分だった場合の順位との差)
-        zero_z = (0 - mean) / std
-        zero_p = 0.5 * (1 + math.erf(zero_z / math.sqrt(2)))
-        zero_rank = int(SagaStats.POPULATION_J1 * (1 - zero_p))
-        overtaken = zero_rank - rank
-
+    @staticmethod
+    def _result(deviation, rank, zero_rank, school_level=None):
         return {
             "rank": rank,
             "deviation": round(deviation, 1),
-            "school_level": SagaStats.get_school_level(deviation),
-            "overtaken": overtaken,
+            "school_level": school_level or SagaStats.get_school_level(deviation),
+            "overtaken": zero_rank - rank,
             "is_saganishi": rank <= SagaStats.SAGANISHI_LIMIT,
         }
+
+    @staticmethod
+    def _bisect_all(bounds, values):
+        """
+        values の各要素について bisect_right(bounds, v) を返す。
+        値を昇順に並べて境界を1回なめるだけなので、要素ごとに二分探索しない。
+        """
+        positions = [0] * len(values)
+        i = 0
+        for j in sorted(range(len(values)), key=values.__getitem__):
+            while i < len(bounds) and bounds[i] <= values[j]:
+                i += 1
+            positions[j] = i
+        return positions
+
+    @staticmethod
+    def calculate_batch(minutes_list, days=1, totals=None):
+        """
+        複数ユーザーの学習時間をまとめて計算する（ランキング用）。
+        calculate と同じ形の結果に累計時間 totals（省略時は minutes_list）の
+        ランク文字 tier を加え、入力と同じ順で返す。0分以下は None。
+        """
+        mean, std, zero_rank = SagaStats._period(days)
+        deviations = [(m - mean) / std * 10 + 50 for m in minutes_list]
+        levels = SagaStats._bisect_all(SagaStats._SCHOOL_BOUNDS, deviations)
+        tiers = SagaStats.rank_tiers(minutes_list if totals is None else totals)
+
+        ranks = {}  # 同じ学習時間の順位は1回だけ求める
+        results = []
+        for m, deviation, level, tier in zip(minutes_list, deviations, levels, tiers):
+            if m <= 0:
+                results.append(None)
+                continue
+            if m not in ranks:
+                ranks[m] = max(SagaStats._rank_of((m - mean) / std), 1)
+            school_level = (
+                SagaStats.SCHOOL_LEVELS[level - 1][1]
+                if level
+                else SagaStats.SCHOOL_LEVEL_BASE
+            )
+            result = SagaStats._result(deviation, ranks[m], zero_rank, school_level)
+            result["tier"] = tier
+            results.append(result)
+        return results
+
+    @staticmethod
+    def rank_tiers(total_minutes_list):
+        """複数ユーザーの累計学習時間からランク文字をまとめて判定"""
+        return [
+            SagaStats.RANK_TIERS[max(i - 1, 0)][1]
+            for i in SagaStats._bisect_all(SagaStats._TIER_BOUNDS, total_minutes_list)
+        ]
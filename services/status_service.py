@@ -1,7 +1,10 @@
+import functools
+import hashlib
 import urllib.parse
 import json
 from services.stats import SagaStats
 from utils.achievements import AchievementManager
+from utils.cache import flex_render_cache
 
 
 class StatusService:
@@ -17,113 +20,100 @@ class StatusService:
             return f"{hours}h"
         return f"{hours}h{minutes}m"
 
+    # ランクごとの表示情報
+    RANK_INFO = {
+        "S": {"name": "Rank S: 伝説の勇者", "color": "#9932CC", "img": "rank_s.png"},
+        "A": {"name": "Rank A: 黄金の騎士", "color": "#FFD700", "img": "rank_a.png"},
+        "B": {"name": "Rank B: 銀の熟練者", "color": "#C0C0C0", "img": "rank_b.png"},
+        "C": {"name": "Rank C: 銅の戦士", "color": "#CD7F32", "img": "rank_c.png"},
+        "D": {"name": "Rank D: 鉄の駆け出し", "color": "#708090", "img": "rank_d.png"},
+        "E": {"name": "Rank E: 見習い", "color": "#607D8B", "img": "rank_e.png"},
+    }
+
     @staticmethod
     def get_rank_info(total_minutes):
         """累計勉強時間からランク情報を取得"""
-        # ランク定義 (難易度調整版)
+        # ランク定義 (難易度調整版、SagaStats.RANK_TIERS)
         # E: 0-300 (5h)
         # D: 300-1200 (20h)
         # C: 1200-3600 (60h)
         # B: 3600-7200 (120h)
         # A: 7200-12000 (200h)
         # S: 12000+ (200h+)
-        if total_minutes >= 12000:
-            return {
-                "name": "Rank S: 伝説の勇者",
-                "color": "#9932CC",
-                "next": None,
-                "base": 12000,
-                "img": "rank_s.png",
-            }
-        elif total_minutes >= 7200:
-            return {
-                "name": "Rank A: 黄金の騎士",
-                "color": "#FFD700",
-                "next": 12000,
-                "base": 7200,
-                "img": "rank_a.png",
-            }
-        elif total_minutes >= 3600:
-            return {
-                "name": "Rank B: 銀の熟練者",
-                "color": "#C0C0C0",
-                "next": 7200,
-                "base": 3600,
-                "img": "rank_b.png",
-            }
-        elif total_minutes >= 1200:
-            return {
-                "name": "Rank C: 銅の戦士",
-                "color": "#CD7F32",
-                "next": 3600,
-                "base": 1200,
-                "img": "rank_c.png",
-            }
-        elif total_minutes >= 300:
-            return {
-                "name": "Rank D: 鉄の駆け出し",
-                "color": "#708090",
-                "next": 1200,
-                "base": 300,
-                "img": "rank_d.png",
-            }
-        else:
-            return {
-                "name": "Rank E: 見習い",
-                "color": "#607D8B",
-                "next": 300,
-                "base": 0,
-                "img": "rank_e.png",
-            }
+        return StatusService._rank_info(SagaStats.rank_tier(total_minutes))
+
+    @staticmethod
+    def get_rank_infos(total_minutes_list):
+        """複数ユーザーの累計勉強時間からランク情報をまとめて取得（ランキング用）"""
+        return [
+            StatusService._rank_info(rank_char)
+            for rank_char in SagaStats.rank_tiers(total_minutes_list)
+        ]
+
+    @staticmethod
+    def _rank_info(rank_char):
+        tiers = SagaStats.RANK_TIERS
+        i = [c for _, c in tiers].index(rank_char)
+        info = dict(StatusService.RANK_INFO[rank_char])
+        info["base"] = tiers[i][0]
+        info["next"] = tiers[i + 1][0] if i + 1 < len(tiers) else None
+        return info
 
     @staticmethod
     def get_rank_info_by_char(rank_char):
         """ランク文字(S,A,B,C,D,E)からランク情報を取得"""
         rank_char = str(rank_char).upper().strip()
-        if rank_char == "S":
-            return {
-                "name": "Rank S: 伝説の勇者",
-                "color": "#9932CC",
-                "img": "rank_s.png",
-            }
-        elif rank_char == "A":
-            return {
-                "name": "Rank A: 黄金の騎士",
-                "color": "#FFD700",
-                "img": "rank_a.png",
-            }
-        elif rank_char == "B":
-            return {
-                "name": "Rank B: 銀の熟練者",
-                "color": "#C0C0C0",
-                "img": "rank_b.png",
-            }
-        elif rank_char == "C":
-            return {
-                "name": "Rank C: 銅の戦士",
-                "color": "#CD7F32",
-                "img": "rank_c.png",
-            }
-        elif rank_char == "D":
-            return {
-                "name": "Rank D: 鉄の駆け出し",
-                "color": "#708090",
-                "img": "rank_d.png",
-            }
-        else:
-            return {
-                "name": "Rank E: 見習い",
-                "color": "#607D8B",
-                "img": "rank_e.png",
-            }
+        return dict(
+            StatusService.RANK_INFO.get(rank_char, StatusService.RANK_INFO["E"])
+        )
+
+    @staticmethod
+    def _digest(kind, *view_model):
+        """表示に使う入力一式のダイジェスト（描画キャッシュのキー）"""
+        raw = json.dumps(view_model, sort_keys=True, ensure_ascii=False, default=str)
+        return (kind, hashlib.sha1(raw.encode("utf-8")).hexdigest())
 
     @staticmethod
     def create_medal_home_gui(user_data, weekly_ranking=[]):
-        """勲章メインのホーム画面を生成"""
+        """
+        勲章メインのホーム画面を生成。
+        表示内容（ユーザー情報・ランキングの表示分・バッジ）が前回と同じならキャッシュを返す。
+        返り値は共有されるので書き換えないこと。
+        """
+        import os
+        from services.economy import EconomyService
+
+        app_url = os.environ.get("APP_URL", "https://your-app.herokuapp.com")
+        if app_url.endswith("/"):
+            app_url = app_url[:-1]
+
+        badges = EconomyService.get_user_badges(str(user_data.get("user_id")))
+        is_admin = EconomyService.is_admin(str(user_data.get("user_id")))
+
+        # ランキングで表示に使うのは上位3件と自分の行だけ
+        my_id = str(user_data.get("user_id"))
+        ranking_view = weekly_ranking[:3] + [
+            r for r in weekly_ranking if str(r["user_id"]) == my_id
+        ]
+        key = StatusService._digest(
+            "medal_home", user_data, ranking_view, badges, is_admin, app_url
+        )
+        return flex_render_cache.get_or_load(
+            key,
+            lambda: StatusService._build_medal_home_gui(
+                user_data, weekly_ranking, badges, is_admin, app_url
+            ),
+        )
+
+    @staticmethod
+    def _build_medal_home_gui(user_data, weekly_ranking, badges, is_admin, app_url):
         total_minutes = int(user_data.get("total_study_time", 0))
 
-        # 基本情報の計算（進捗バー計算用）
-        rank_data = StatusService.get_rank_info(total_minutes)
+        # 基本情報の計算（進捗バー計算用）。ランキングの各行の分もまとめて判定する
+        rank_data, *ranking_rank_infos = StatusService.get_rank_infos(
+            [total_minutes]
+            + [int(r.get("total_study_time", 0) or 0) for r in weekly_ranking]
+        )
 
         # usersシートのランク指定があれば、表示情報（名前・画像・色）を上書きする
         sheet_rank = user_data.get("rank")
@@ -133,11 +123,6 @@ class StatusService:
             rank_data["color"] = sheet_rank_info["color"]
             rank_data["img"] = sheet_rank_info["img"]
 
-        import os
-
-        app_url = os.environ.get("APP_URL", "https://your-app.herokuapp.com")
-        if app_url.endswith("/"):
-            app_url = app_url[:-1]
         img_url = f"{app_url}/static/medals/{rank_data['img']}"
 
         # 次のランクまでの計算
@@ -156,47 +141,10 @@ class StatusService:
         achievements_str = str(user_data.get("unlocked_achievements", ""))
         achievements_grid = AchievementManager.generate_flex_component(achievements_str)
 
-        # バッジ（勲章）の取得
-        from services.economy import EconomyService
-
-        badges = EconomyService.get_user_badges(str(user_data.get("user_id")))
-
-        badge_contents = []
-        if badges:
-            for b in badges:
-                badge_contents.append(
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "width": "60px",
-                        "alignItems": "center",
-                        "contents": [
-                            {
-                                "type": "box",
-                                "layout": "vertical",
-                                "width": "40px",
-                                "height": "40px",
-                                "backgroundColor": "#FFD700",  # Gold background for badges
-                                "cornerRadius": "50px",  # Circle
-                                "justifyContent": "center",
-                                "alignItems": "center",
-                                "contents": [
-                                    {"type": "text", "text": b["icon"], "size": "xl"}
-                                ],
-                            },
-                            {
-                                "type": "text",
-                                "text": b["name"],
-                                "size": "xxs",
-                                "color": "#aaaaaa",
-                                "align": "center",
-                                "margin": "xs",
-                                "wrap": True,
-                            },
-                        ],
-                        "margin": "xs",
-                    }
-                )
+        # バッジ（勲章）の表示（同じバッジの組み合わせなら使い回す）
+        badge_contents = StatusService._badge_row(
+            tuple((b["icon"], b["name"]) for b in badges)
+        )
 
         # ランキングセクションの構築
         ranking_contents = []
@@ -224,8 +172,7 @@ class StatusService:
                 if user_rank_char:
                     r_rank_info = StatusService.get_rank_info_by_char(user_rank_char)
                 else:
-                    r_total = int(r.get("total_study_time", 0))
-                    r_rank_info = StatusService.get_rank_info(r_total)
+                    r_rank_info = ranking_rank_infos[i]
 
                 # ランクに応じたアイコン (E~S) を使用
                 # すでに img プロパティが rank_a.png 等になっているが、
@@ -282,21 +229,21 @@ class StatusService:
                 )
 
             # 自分が3位以下の場合、自分の順位を表示
-            my_rank_data = next(
+            my_index = next(
                 (
-                    r
-                    for r in weekly_ranking
+                    i
+                    for i, r in enumerate(weekly_ranking)
                     if str(r["user_id"]) == str(user_data["user_id"])
                 ),
                 None,
             )
+            my_rank_data = weekly_ranking[my_index] if my_index is not None else None
             if my_rank_data and my_rank_data["rank"] > 3:
                 m_rank_char_val = my_rank_data.get("user_rank")
                 if m_rank_char_val:
                     m_rank_info = StatusService.get_rank_info_by_char(m_rank_char_val)
                 else:
-                    m_total = int(my_rank_data.get("total_study_time", 0))
-                    m_rank_info = StatusService.get_rank_info(m_total)
+                    m_rank_info = ranking_rank_infos[my_index]
                 
                 m_img_url = f"{app_url}/static/medals/{m_rank_info['img']}"
 
@@ -346,9 +293,6 @@ class StatusService:
                     }
                 )
 
-        # Admin check
-        is_admin = EconomyService.is_admin(str(user_data.get("user_id")))
-
         # フッターボタンの構築
         footer_contents = [
             {
@@ -580,6 +524,47 @@ class StatusService:
 
         return bubble
 
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _badge_row(badges):
+        """バッジ ((icon, name), ...) の表示部品（返り値は共有されるので書き換えないこと）"""
+        badge_contents = []
+        for icon, name in badges:
+            badge_contents.append(
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "width": "60px",
+                    "alignItems": "center",
+                    "contents": [
+                        {
+                            "type": "box",
+                            "layout": "vertical",
+                            "width": "40px",
+                            "height": "40px",
+                            "backgroundColor": "#FFD700",  # Gold background for badges
+                            "cornerRadius": "50px",  # Circle
+                            "justifyContent": "center",
+                            "alignItems": "center",
+                            "contents": [
+                                {"type": "text", "text": icon, "size": "xl"}
+                            ],
+                        },
+                        {
+                            "type": "text",
+                            "text": name,
+                            "size": "xxs",
+                            "color": "#aaaaaa",
+                            "align": "center",
+                            "margin": "xs",
+                            "wrap": True,
+                        },
+                    ],
+                    "margin": "xs",
+                }
+            )
+        return badge_contents
+
     @staticmethod
     def create_report_carousel(
         user_data, weekly_history, monthly_history, inventory_items
@@ -605,6 +590,21 @@ class StatusService:
     @staticmethod
     def _create_graph_bubble(
         title, user_data, history_data, inventory_items, is_weekly=True
+    ):
+        """グラフバブルを生成（入力が前回と同じならキャッシュを返す）"""
+        key = StatusService._digest(
+            "graph", title, user_data, history_data, inventory_items, is_weekly
+        )
+        return flex_render_cache.get_or_load(
+            key,
+            lambda: StatusService._build_graph_bubble(
+                title, user_data, history_data, inventory_items, is_weekly
+            ),
+        )
+
+    @staticmethod
+    def _build_graph_bubble(
+        title, user_data, history_data, inventory_items, is_weekly=True
     ):
         """グラフバブル生成の共通ロジック"""
 
@@ -0,0 +1,1045 @@
+import contextvars
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.request_context import RequestContext
+from utils.startup_profile import startup_profile
+
+# SQLite エンジンでテーブルを新規作成するときの既定カラム
+# (シートから取り込める場合はシートのヘッダーを優先する)
+TABLE_COLUMNS = {
+    "users": [
+        "user_id",
+        "display_name",
+        "current_exp",
+        "total_study_time",
+        "role",
+        "inventory_json",
+        "rank",
+        "avatar_url",
+        "achievements",
+    ],
+    "study_log": [
+        "user_id",
+        "display_name",
+        "date",
+        "start_time",
+        "end_time",
+        "status",
+        "subject",
+        "duration_min",
+        "rank_score",
+        "comment",
+        "concentration",
+        "memo",
+        "earned_exp",
+    ],
+    "transactions": [
+        "tx_id",
+        "user_id",
+        "amount",
+        "tx_type",
+        "related_id",
+        "timestamp",
+        "user_name",
+    ],
+    "jobs": [
+        "job_id",
+        "title",
+        "reward",
+        "status",
+        "client_id",
+        "worker_id",
+        "deadline",
+        "comment",
+        "finished_at",
+        "created_at",
+    ],
+    "shop_items": ["item_key", "name", "cost", "description", "is_active"],
+    "shop_requests": [
+        "request_id",
+        "user_id",
+        "display_name",
+        "item_key",
+        "cost",
+        "status",
+        "timestamp",
+        "comment",
+    ],
+    "missions": [
+        "mission_id",
+        "user_id",
+        "title",
+        "description",
+        "reward",
+        "status",
+        "created_at",
+        "completed_at",
+    ],
+    # 残高のチェックポイント（台帳の ledger_row 行目までを反映した残高）
+    # reason: SEED (current_exp からの移行) / RESET (リセット) / AUTO (定期)
+    "balance_checkpoints": ["user_id", "balance", "ledger_row", "reason", "created_at"],
+}
+
+# シートがなければヘッダー付きで作成するテーブル（後から追加したもの）
+AUTO_CREATED_TABLES = ("balance_checkpoints",)
+
+# 検索で多用するカラム（SQLite ではインデックスを張る）
+INDEXED_COLUMNS = ("user_id", "status", "date")
+
+# str.strip() が取り除く空白文字（全角スペースなどを含む）。
+# SQLite の検索でも TRIM(カラム, これ) で比べ、シートのエンジンと同じ行を返す
+_WHITESPACE = (
+    "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003"
+    "\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"
+)
+
+
+def _cell(value):
+    return "" if value is None else str(value)
+
+
+def _matches(row, filters):
+    for key, value in filters.items():
+        if str(row.get(key, "")).strip() != str(value):
+            return False
+    return True
+
+
+class StorageEngine:
+    """
+    テーブル指向のストレージAPI。
+    シート名をテーブル名、1行目をヘッダーとして扱い、
+    行は {ヘッダー名: 値} の辞書に "_row"（シート上の行番号）を加えた形で返す。
+    """
+
+    name = "base"
+
+    def get_header(self, table):
+        raise NotImplementedError
+
+    def get_rows(self, table, **filters):
+        """全条件に一致する行を行番号順に取得"""
+        raise NotImplementedError
+
+    def get_rows_any(self, table, **filters):
+        """いずれかの条件に一致する行を行番号順に取得（値が空の条件は無視）"""
+        raise NotImplementedError
+
+    def get_row(self, table, row_index):
+        raise NotImplementedError
+
+    def get_rows_after(self, table, row_index):
+        """row_index より後の行を、キャッシュを通さず最新の内容で取得"""
+        raise NotImplementedError
+
+    def get_rows_at(self, table, row_indexes):
+        """指定した行を、キャッシュを通さず最新の内容で取得（行番号順）"""
+        raise NotImplementedError
+
+    def find_row(self, table, column, value):
+        rows = self.get_rows(table, **{column: value})
+        return rows[0] if rows else None
+
+    def update_fields(self, table, row_index, fields):
+        """指定行の複数カラムを更新（ヘッダーにないカラムは無視）"""
+        raise NotImplementedError
+
+    def append(self, table, fields):
+        """行を追加し、追加した行番号を返す（失敗時は None）"""
+        raise NotImplementedError
+
+    def append_rows(self, table, rows):
+        """複数行を追加し、追加した行番号のリストを返す（失敗時は None）"""
+        indexes = []
+        for fields in rows:
+            row_index = self.append(table, fields)
+            if not row_index:
+                return None
+            indexes.append(row_index)
+        return indexes
+
+    def delete_row(self, table, row_index):
+        raise NotImplementedError
+
+    def version(self, table):
+        """テーブル内容の版数（内容が変わると増える）"""
+        return 0
+
+    def invalidate(self, table=None):
+        """読み込みキャッシュを破棄"""
+
+    @contextmanager
+    def buffered(self):
+        """with の間の update_fields をまとめて書き込む（エンジンが対応していれば）"""
+        yield
+
+    def flush(self):
+        """buffered() の中で溜まっている更新を今すぐ書き込む（失敗したら例外）"""
+
+
+class SheetSnapshot:
+    """
+    ワークシート全体のスナップショット。
+    get_all_values の結果をヘッダー名の辞書に変換して保持し、
+    内容が変わるたびに version を進める（索引などの再構築判定に使う）。
+    """
+
+    # 取り直しても版数が巻き戻らないよう、全スナップショットで通し番号を使う
+    _versions = itertools.count(1)
+
+    def __init__(self, values):
+        self.header = []
+        self.col_map = {}
+        self.rows = []
+        self.version = 0
+        self.digest = None
+        self.fetched_at = 0.0
+        self.load(values)
+
+    def load(self, values):
+        """シートから取得した値で置き換える（内容が同じなら version は変えない）"""
+        digest = hash(tuple(tuple(r) for r in values))
+        self.fetched_at = time.monotonic()
+        if digest == self.digest:
+            return
+        self.header = [str(h).strip() for h in values[0]] if values else []
+        self.col_map = {h: i for i, h in enumerate(self.header) if h}
+        self.rows = [
+            self.to_row(self.header, r, i) for i, r in enumerate(values[1:], start=2)
+        ]
+        self.digest = digest
+        self.version = next(SheetSnapshot._versions)
+
+    @staticmethod
+    def to_row(header, values, row_index):
+        row = {
+            h: (values[i] if i < len(values) else "") for i, h in enumerate(header) if h
+        }
+        row["_row"] = row_index
+        return row
+
+    def is_fresh(self, ttl):
+        return time.monotonic() - self.fetched_at < ttl
+
+    def get(self, row_index):
+        i = int(row_index) - 2
+        if 0 <= i < len(self.rows):
+            return self.rows[i]
+        return None
+
+    def _touch(self):
+        # 書き込みで内容が変わったので、次の再取得では必ず差分ありとみなす
+        self.digest = None
+        self.version = next(SheetSnapshot._versions)
+
+    def patch(self, row_index, fields):
+        row = self.get(row_index)
+        if row is None:
+            return False
+        for key, value in fields.items():
+            if key in self.col_map:
+                row[key] = _cell(value)
+        self._touch()
+        return True
+
+    def add(self, row_index, fields):
+        if int(row_index) != len(self.rows) + 2:
+            return False
+        row = {h: "" for h in self.col_map}
+        row.update({k: _cell(v) for k, v in fields.items() if k in self.col_map})
+        row["_row"] = int(row_index)
+        self.rows.append(row)
+        self._touch()
+        return True
+
+    def remove(self, row_index):
+        i = int(row_index) - 2
+        if not 0 <= i < len(self.rows):
+            return False
+        del self.rows[i]
+        for row in self.rows[i:]:
+            row["_row"] -= 1
+        self._touch()
+        return True
+
+
+class GSheetStorage(StorageEngine):
+    """
+    gspread で Google スプレッドシートを読み書きするエンジン。
+    読み込みはワークシートごとのスナップショットを ttl 秒間共有し、
+    このエンジン経由の書き込みはスナップショットをその場で書き換える。
+    """
+
+    name = "gsheet"
+
+    # buffered() の間に溜めるセル更新 {(table, row, col): value}
+    _buffer = contextvars.ContextVar("sheet_write_buffer", default=None)
+
+    def __init__(self, worksheet_getter, ttl=30.0, spreadsheet_getter=None):
+        self._get_worksheet = worksheet_getter
+        self._get_spreadsheet = spreadsheet_getter
+        self.ttl = ttl
+        self._snapshots = {}
+        self._load_locks = {}
+        self._lock = threading.RLock()
+
+    def snapshot(self, table):
+        """
+        TTL 内ならキャッシュ済みのスナップショット、期限切れなら再取得したものを返す。
+        リクエストコンテキスト内では、一度読んだワークシートは TTL に関係なく使い回す。
+        """
+        ctx = RequestContext.current()
+        snap = self._cached(table, ctx)
+        if snap is not None:
+            return snap
+        # 同じワークシートを複数のスレッドが同時に取りに行かないよう、
+        # 読み込み中のものがあれば終わるのを待ってその結果を使う
+        with self._loading(table):
+            snap = self._cached(table, ctx)
+            if snap is not None:
+                return snap
+            sheet = self._get_worksheet(table)
+            if not sheet:
+                return None
+            with startup_profile.timed(f"snapshot {table}"):
+                values = sheet.get_all_values()
+            with self._lock:
+                snap = self._snapshots.get(table)
+                if snap is None:
+                    snap = self._snapshots[table] = SheetSnapshot(values)
+                else:
+                    snap.load(values)
+        if ctx is not None:
+            ctx.snapshots.add(table)
+        return snap
+
+    def _cached(self, table, ctx):
+        with self._lock:
+            snap = self._snapshots.get(table)
+            if snap is not None and (
+                snap.is_fresh(self.ttl) or (ctx is not None and table in ctx.snapshots)
+            ):
+                if ctx is not None:
+                    ctx.snapshots.add(table)
+                return snap
+        return None
+
+    def _loading(self, table):
+        with self._lock:
+            return self._load_locks.setdefault(table, threading.Lock())
+
+    def invalidate(self, table=None):
+        """スナップショットを破棄（次回の読み込みで再取得する）"""
+        with self._lock:
+            if table is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(table, None)
+
+    def version(self, table):
+        snap = self.snapshot(table)
+        return snap.version if snap else 0
+
+    def _rows(self, table):
+        snap = self.snapshot(table)
+        if not snap:
+            return []
+        with self._lock:
+            # 呼び出し側で書き換えられてもキャッシュが壊れないよう複製を返す
+            return [dict(r) for r in snap.rows]
+
+    def get_header(self, table):
+        try:
+            snap = self.snapshot(table)
+        except Exception as e:
+            print(f"Header Read Error ({table}): {e}")
+            return []
+        return list(snap.header) if snap else []
+
+    def get_rows(self, table, **filters):
+        try:
+            rows = self._rows(table)
+        except Exception as e:
+            print(f"Rows Read Error ({table}): {e}")
+            return []
+        return [r for r in rows if _matches(r, filters)]
+
+    def get_rows_any(self, table, **filters):
+        filters = {k: v for k, v in filters.items() if v}
+        if not filters:
+            return []
+        try:
+            rows = self._rows(table)
+        except Exception as e:
+            print(f"Rows Read Error ({table}): {e}")
+            return []
+        return [r for r in rows if any(_matches(r, {k: v}) for k, v in filters.items())]
+
+    def get_row(self, table, row_index):
+        try:
+            snap = self.snapshot(table)
+        except Exception as e:
+            print(f"Row Read Error ({table}): {e}")
+            return None
+        if not snap:
+            return None
+        with self._lock:
+            row = snap.get(row_index)
+            return dict(row) if row else None
+
+    def _live_range(self, table):
+        """(ワークシート, ヘッダー, 最後の列の文字)。ヘッダーは手元のスナップショットのものを使う"""
+        from gspread.utils import rowcol_to_a1
+
+        sheet = self._get_worksheet(table)
+        with self._lock:
+            snap = self._snapshots.get(table)
+        header = list(snap.header) if snap else self.get_header(table)
+        if not sheet or not header:
+            return None, [], ""
+        return sheet, header, re.sub(r"\d", "", rowcol_to_a1(1, len(header)))
+
+    def get_rows_after(self, table, row_index):
+        sheet, header, end = self._live_range(table)
+        if not sheet:
+            return []
+        try:
+            values = sheet.get(f"A{int(row_index) + 1}:{end}")
+        except Exception as e:
+            print(f"Rows Read Error ({table}): {e}")
+            return []
+        return [
+            SheetSnapshot.to_row(header, v, i)
+            for i, v in enumerate(values, start=int(row_index) + 1)
+            if any(str(x).strip() for x in v)
+        ]
+
+    def get_rows_at(self, table, row_indexes):
+        row_indexes = sorted({int(r) for r in row_indexes})
+        sheet, header, end = self._live_range(table)
+        if not sheet or not row_indexes:
+            return []
+        try:
+            # 行ごとの範囲を1回の API 呼び出しで読む
+            results = sheet.batch_get([f"A{r}:{end}{r}" for r in row_indexes])
+        except Exception as e:
+            print(f"Rows Read Error ({table}): {e}")
+            return []
+        return [
+            SheetSnapshot.to_row(header, values[0] if values else [], r)
+            for r, values in zip(row_indexes, results)
+        ]
+
+    def update_fields(self, table, row_index, fields):
+        sheet = self._get_worksheet(table)
+        if not sheet:
+            return False
+        try:
+            snap = self.snapshot(table)
+            cells = {}
+            for key, value in fields.items():
+                idx = snap.col_map.get(key)
+                if idx is not None:
+                    cells[(table, int(row_index), idx + 1)] = value
+            if not cells:
+                return False
+
+            buffer = self._buffer.get()
+            if buffer is not None:
+                buffer.update(cells)
+            else:
+                self._write_cells(cells, sheets={table: sheet})
+            with self._lock:
+                snap.patch(row_index, fields)
+            return True
+        except Exception as e:
+            self.invalidate(table)
+            print(f"Update Error ({table}): {e}")
+            return False
+
+    def _write_cells(self, cells, sheets=None):
+        """
+        セル更新をまとめて送る。
+        1シートなら worksheet.batch_update、複数シートなら values_batch_update の1回で済ませる。
+        """
+        from gspread.utils import absolute_range_name, rowcol_to_a1
+
+        sheets = dict(sheets or {})
+        by_table = {}
+        for (table, row, col), value in cells.items():
+            by_table.setdefault(table, []).append(
+                {"range": rowcol_to_a1(row, col), "values": [[value]]}
+            )
+
+        doc = None
+        if len(by_table) > 1 and self._get_spreadsheet:
+            doc = self._get_spreadsheet()
+        if doc is not None:
+            data = []
+            for table, updates in by_table.items():
+                for u in updates:
+                    data.append(
+                        {
+                            "range": absolute_range_name(table, u["range"]),
+                            "values": u["values"],
+                        }
+                    )
+            doc.values_batch_update({"valueInputOption": "USER_ENTERED", "data": data})
+            return
+
+        for table, updates in by_table.items():
+            sheet = sheets.get(table) or self._get_worksheet(table)
+            if not sheet:
+                continue
+            sheet.batch_update(updates, value_input_option="USER_ENTERED")
+
+    @contextmanager
+    def buffered(self):
+        """
+        with の間の update_fields を溜めておき、抜けるときに1回の API 呼び出しで書き込む。
+        スナップショットは即座に書き換えるので、with の中の読み込みにも反映される。
+        """
+        if self._buffer.get() is not None:
+            yield
+            return
+        buffer = {}
+        token = self._buffer.set(buffer)
+        try:
+            yield
+        finally:
+            self._buffer.reset(token)
+            self._flush_cells(buffer)
+
+    def flush(self):
+        buffer = self._buffer.get()
+        if buffer:
+            self._flush_cells(buffer)
+
+    def _flush_cells(self, buffer):
+        """溜まっている更新を書き込む。失敗したら例外をそのまま呼び出し元に返す"""
+        if not buffer:
+            return
+        cells = dict(buffer)
+        buffer.clear()
+        try:
+            self._write_cells(cells)
+        except Exception as e:
+            # 送れなかった内容がスナップショットに残らないよう破棄する
+            for table in {t for t, _, _ in cells}:
+                self.invalidate(table)
+            print(f"Batch Update Error: {e}")
+            raise
+
+    def append(self, table, fields):
+        sheet = self._get_worksheet(table)
+        if not sheet:
+            return None
+        try:
+            snap = self.snapshot(table)
+            if not snap.header:
+                print(f"【Error】{table} のヘッダー情報が取得できません")
+                return None
+            row_data = [""] * len(snap.header)
+            for key, value in fields.items():
+                idx = snap.col_map.get(key)
+                if idx is not None:
+                    row_data[idx] = value
+
+            result = sheet.append_row(row_data)
+            row_index = self._appended_row(result) or len(sheet.col_values(1))
+            with self._lock:
+                if not snap.add(row_index, fields):
+                    # 他所で行が増えていた場合は取り直す
+                    self.invalidate(table)
+            return row_index
+        except Exception as e:
+            self.invalidate(table)
+            print(f"Append Error ({table}): {e}")
+            return None
+
+    def append_rows(self, table, rows):
+        """append_rows の1回の API 呼び出しで複数行を追加する"""
+        if not rows:
+            return []
+        sheet = self._get_worksheet(table)
+        if not sheet:
+            return None
+        try:
+            snap = self.snapshot(table)
+            if not snap.header:
+                print(f"【Error】{table} のヘッダー情報が取得できません")
+                return None
+            values = []
+            for fields in rows:
+                row_data = [""] * len(snap.header)
+                for key, value in fields.items():
+                    idx = snap.col_map.get(key)
+                    if idx is not None:
+                        row_data[idx] = value
+                values.append(row_data)
+
+            result = sheet.append_rows(values)
+            first = self._appended_row(result)
+            if not first:
+                first = len(sheet.col_values(1)) - len(rows) + 1
+            indexes = list(range(first, first + len(rows)))
+            with self._lock:
+                for row_index, fields in zip(indexes, rows):
+                    if not snap.add(row_index, fields):
+                        # 他所で行が増えていた場合は取り直す
+                        self.invalidate(table)
+                        break
+            return indexes
+        except Exception as e:
+            self.invalidate(table)
+            print(f"Append Error ({table}): {e}")
+            return None
+
+    @staticmethod
+    def _appended_row(result):
+        """append_row のレスポンス (updatedRange: 'sheet'!A5:J5) から行番号を取り出す"""
+        try:
+            updated_range = result["updates"]["updatedRange"]
+        except (KeyError, TypeError):
+            return None
+        m = re.search(r"![A-Z]+(\d+)", updated_range)
+        return int(m.group(1)) if m else None
+
+    def delete_row(self, table, row_index):
+        sheet = self._get_worksheet(table)
+        if not sheet:
+            return False
+        try:
+            # 溜めている更新は削除前の行番号なので、先に書き込んでおく
+            self._flush_cells(self._buffer.get())
+            sheet.delete_rows(row_index)
+            with self._lock:
+                snap = self._snapshots.get(table)
+                if snap is not None and not snap.remove(row_index):
+                    self.invalidate(table)
+            return True
+        except Exception as e:
+            self.invalidate(table)
+            print(f"Delete Error ({table}): {e}")
+            return False
+
+
+class SQLiteStorage(StorageEngine):
+    """
+    ローカルの SQLite にテーブルを持つエンジン。
+    _row 列にシートと同じ行番号を保持するので、row_index をそのまま使い回せる。
+    user_id / status / date にはインデックスを張る。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, seed=None, journal=False):
+        self.path = path
+        # seed(table) -> シートの全値 (ヘッダー行 + データ行)。初回のテーブル作成時に取り込む
+        self._seed = seed
+        # journal=True なら書き込みを _outbox に記録し、シートへの書き戻し対象にする
+        self.journal = journal
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._columns = {}
+
+    @staticmethod
+    def _q(name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    @staticmethod
+    def _rollback(conn):
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_sync_tables(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _create_sync_tables(conn):
+        # _outbox: シートへ未反映の変更 (op = "row": 行の追加/更新, "delete": 行削除)
+        # _sync_state: シート側の行数 (ヘッダー含む)。これを超える行は追記になる
+        # _lease: 複数プロセスから同時に書き戻さないための排他リース
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT, row_index INTEGER, op TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _sync_state (tbl TEXT PRIMARY KEY, sheet_rows INTEGER)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _lease (name TEXT PRIMARY KEY, owner TEXT, expires REAL)"
+        )
+        # _versions: テーブルごとの版数 (他プロセスの書き込みも検知できるよう DB に持つ)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _versions (tbl TEXT PRIMARY KEY, version INTEGER)"
+        )
+
+    def _journal(self, conn, table, row_index, op="row"):
+        conn.execute(
+            "INSERT INTO _versions (tbl, version) VALUES (?, 1) "
+            "ON CONFLICT(tbl) DO UPDATE SET version = version + 1",
+            (table,),
+        )
+        if self.journal:
+            conn.execute(
+                "INSERT INTO _outbox (tbl, row_index, op) VALUES (?, ?, ?)",
+                (table, int(row_index), op),
+            )
+
+    def _columns_of(self, table):
+        """テーブルのカラム一覧（未作成ならシート or 既定定義から作成）"""
+        cols = self._columns.get(table)
+        if cols is not None:
+            return cols
+
+        with self._lock:
+            conn = self._conn()
+            existing = [
+                r[1] for r in conn.execute(f"PRAGMA table_info({self._q(table)})")
+            ]
+            if not existing:
+                existing = self._create_table(conn, table)
+            cols = [c for c in existing if c != "_row"]
+            if cols:
+                # 以前の版で作ったテーブルにも検索用のインデックスを張っておく
+                self._create_indexes(conn, table, cols)
+                self._columns[table] = cols
+        return cols
+
+    def _create_indexes(self, conn, table, columns):
+        # 検索は前後の空白を除いた値で比べるので、その式にインデックスを張る
+        for col in INDEXED_COLUMNS:
+            if col in columns:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self._q(f'idx_{table}_{col}_trim')} "
+                    f"ON {self._q(table)} ({self._stripped(col)})"
+                )
+
+    @classmethod
+    def _stripped(cls, col):
+        """前後の空白を除いたカラムの値（シートのエンジンの _matches と同じ比べ方）"""
+        return f"TRIM({cls._q(col)}, '{_WHITESPACE}')"
+
+    def _create_table(self, conn, table):
+        values = None
+        if self._seed:
+            try:
+                values = self._seed(table)
+            except Exception as e:
+                print(f"Seed Error ({table}): {e}")
+
+        if values:
+            header = []
+            for h in values[0]:
+                h = str(h).strip()
+                if h and h not in header and h != "_row":
+                    header.append(h)
+            rows = values[1:]
+            raw_header = [str(h).strip() for h in values[0]]
+        else:
+            header = TABLE_COLUMNS.get(table, [])
+            rows = []
+            raw_header = header
+
+        if not header:
+            return []
+
+        col_defs = ", ".join(f"{self._q(c)} TEXT" for c in header)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._q(table)} "
+                f"(_row INTEGER PRIMARY KEY, {col_defs})"
+            )
+            self._create_indexes(conn, table, header)
+            if rows:
+                positions = {h: raw_header.index(h) for h in header}
+                placeholders = ", ".join("?" for _ in range(len(header) + 1))
+                cols_sql = ", ".join(self._q(c) for c in header)
+                conn.executemany(
+                    f"INSERT INTO {self._q(table)} (_row, {cols_sql}) "
+                    f"VALUES ({placeholders})",
+                    [
+                        [i]
+                        + [
+                            _cell(r[positions[h]]) if positions[h] < len(r) else ""
+                            for h in header
+                        ]
+                        for i, r in enumerate(rows, start=2)
+                    ],
+                )
+            if values:
+                conn.execute(
+                    "INSERT OR REPLACE INTO _sync_state (tbl, sheet_rows) VALUES (?, ?)",
+                    (table, len(values)),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            self._rollback(conn)
+            raise
+        return ["_row"] + header
+
+    def _select(self, table, where="", params=()):
+        cols = self._columns_of(table)
+        if not cols:
+            return []
+        cols_sql = ", ".join(self._q(c) for c in cols)
+        cur = self._conn().execute(
+            f"SELECT _row, {cols_sql} FROM {self._q(table)} {where} ORDER BY _row",
+            params,
+        )
+        rows = []
+        for rec in cur:
+            row = {c: _cell(v) for c, v in zip(cols, rec[1:])}
+            row["_row"] = rec[0]
+            rows.append(row)
+        return rows
+
+    def get_header(self, table):
+        return list(self._columns_of(table))
+
+    def version(self, table):
+        rec = (
+            self._conn()
+            .execute("SELECT version FROM _versions WHERE tbl = ?", (table,))
+            .fetchone()
+        )
+        return rec[0] if rec else 0
+
+    def get_rows(self, table, **filters):
+        cols = self._columns_of(table)
+        if any(k not in cols for k in filters):
+            return []
+        if not filters:
+            return self._select(table)
+        where = "WHERE " + " AND ".join(f"{self._stripped(k)} = ?" for k in filters)
+        return self._select(table, where, [str(v) for v in filters.values()])
+
+    def get_rows_any(self, table, **filters):
+        cols = self._columns_of(table)
+        filters = {k: v for k, v in filters.items() if v and k in cols}
+        if not filters:
+            return []
+        where = "WHERE " + " OR ".join(f"{self._stripped(k)} = ?" for k in filters)
+        return self._select(table, where, [str(v) for v in filters.values()])
+
+    def get_row(self, table, row_index):
+        rows = self._select(table, "WHERE _row = ?", (int(row_index),))
+        return rows[0] if rows else None
+
+    def get_rows_after(self, table, row_index):
+        return self._select(table, "WHERE _row > ?", (int(row_index),))
+
+    def get_rows_at(self, table, row_indexes):
+        row_indexes = sorted({int(r) for r in row_indexes})
+        if not row_indexes:
+            return []
+        marks = ", ".join("?" for _ in row_indexes)
+        return self._select(table, f"WHERE _row IN ({marks})", row_indexes)
+
+    def update_fields(self, table, row_index, fields):
+        cols = self._columns_of(table)
+        known = {k: v for k, v in fields.items() if k in cols}
+        if not known:
+            return False
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            sets = ", ".join(f"{self._q(k)} = ?" for k in known)
+            cur = conn.execute(
+                f"UPDATE {self._q(table)} SET {sets} WHERE _row = ?",
+                [_cell(v) for v in known.values()] + [int(row_index)],
+            )
+            if cur.rowcount:
+                self._journal(conn, table, row_index)
+            conn.execute("COMMIT")
+            return cur.rowcount > 0
+        except Exception as e:
+            self._rollback(conn)
+            print(f"Update Error ({table}): {e}")
+            return False
+
+    def append(self, table, fields):
+        cols = self._columns_of(table)
+        if not cols:
+            print(f"【Error】{table} のヘッダー情報が取得できません")
+            return None
+        known = {k: v for k, v in fields.items() if k in cols}
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row_index = conn.execute(
+                f"SELECT COALESCE(MAX(_row), 1) + 1 FROM {self._q(table)}"
+            ).fetchone()[0]
+            cols_sql = "".join(f", {self._q(k)}" for k in known)
+            placeholders = "".join(", ?" for _ in known)
+            conn.execute(
+                f"INSERT INTO {self._q(table)} (_row{cols_sql}) VALUES (?{placeholders})",
+                [row_index] + [_cell(v) for v in known.values()],
+            )
+            self._journal(conn, table, row_index)
+            conn.execute("COMMIT")
+            return row_index
+        except Exception as e:
+            self._rollback(conn)
+            print(f"Append Error ({table}): {e}")
+            return None
+
+    def append_rows(self, table, rows):
+        """複数行を1つのトランザクションで追加する"""
+        if not rows:
+            return []
+        cols = self._columns_of(table)
+        if not cols:
+            print(f"【Error】{table} のヘッダー情報が取得できません")
+            return None
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row_index = conn.execute(
+                f"SELECT COALESCE(MAX(_row), 1) FROM {self._q(table)}"
+            ).fetchone()[0]
+            indexes = []
+            for fields in rows:
+                row_index += 1
+                known = {k: v for k, v in fields.items() if k in cols}
+                cols_sql = "".join(f", {self._q(k)}" for k in known)
+                placeholders = "".join(", ?" for _ in known)
+                conn.execute(
+                    f"INSERT INTO {self._q(table)} (_row{cols_sql}) "
+                    f"VALUES (?{placeholders})",
+                    [row_index] + [_cell(v) for v in known.values()],
+                )
+                self._journal(conn, table, row_index)
+                indexes.append(row_index)
+            conn.execute("COMMIT")
+            return indexes
+        except Exception as e:
+            self._rollback(conn)
+            print(f"Append Error ({table}): {e}")
+            return None
+
+    def delete_row(self, table, row_index):
+        if not self._columns_of(table):
+            return False
+        conn = self._conn()
+        t = self._q(table)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(f"DELETE FROM {t} WHERE _row = ?", (int(row_index),))
+            if cur.rowcount:
+                # シートと同じく、後ろの行を1つずつ詰める（主キー衝突を避けるため符号反転を経由）
+                conn.execute(
+                    f"UPDATE {t} SET _row = -(_row - 1) WHERE _row > ?",
+                    (int(row_index),),
+                )
+                conn.execute(f"UPDATE {t} SET _row = -_row WHERE _row < 0")
+                if self.journal:
+                    # 未反映の行番号も削除後の番号に合わせる
+                    conn.execute(
+                        "DELETE FROM _outbox WHERE tbl = ? AND op = 'row' AND row_index = ?",
+                        (table, int(row_index)),
+                    )
+                    conn.execute(
+                        "UPDATE _outbox SET row_index = row_index - 1 "
+                        "WHERE tbl = ? AND op = 'row' AND row_index > ?",
+                        (table, int(row_index)),
+                    )
+                    self._journal(conn, table, row_index, "delete")
+            conn.execute("COMMIT")
+            return cur.rowcount > 0
+        except Exception as e:
+            self._rollback(conn)
+            print(f"Delete Error ({table}): {e}")
+            return False
+
+    # --- シートへの書き戻し用 ---
+
+    def pending_changes(self, table=None):
+        """未反映の変更を記録順に取得 [(id, table, row_index, op), ...]"""
+        sql = "SELECT id, tbl, row_index, op FROM _outbox"
+        params = ()
+        if table:
+            sql += " WHERE tbl = ?"
+            params = (table,)
+        return self._conn().execute(sql + " ORDER BY id", params).fetchall()
+
+    def clear_changes(self, table, max_id):
+        self._conn().execute(
+            "DELETE FROM _outbox WHERE tbl = ? AND id <= ?", (table, int(max_id))
+        )
+
+    def clear_change(self, change_id):
+        self._conn().execute("DELETE FROM _outbox WHERE id = ?", (int(change_id),))
+
+    def get_sheet_rows(self, table):
+        rec = (
+            self._conn()
+            .execute("SELECT sheet_rows FROM _sync_state WHERE tbl = ?", (table,))
+            .fetchone()
+        )
+        return rec[0] if rec else None
+
+    def set_sheet_rows(self, table, rows):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO _sync_state (tbl, sheet_rows) VALUES (?, ?)",
+            (table, int(rows)),
+        )
+
+    def max_row(self, table):
+        if not self._columns_of(table):
+            return 1
+        return (
+            self._conn()
+            .execute(f"SELECT COALESCE(MAX(_row), 1) FROM {self._q(table)}")
+            .fetchone()[0]
+        )
+
+    def acquire_lease(self, name, owner, ttl):
+        """期限切れか自分が持っているリースのみ取得できる"""
+        now = time.time()
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rec = conn.execute(
+                "SELECT owner, expires FROM _lease WHERE name = ?", (name,)
+            ).fetchone()
+            if rec and rec[0] != owner and rec[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO _lease (name, owner, expires) VALUES (?, ?, ?)",
+                (name, owner, now + ttl),
+            )
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            self._rollback(conn)
+            print(f"Lease Error ({name}): {e}")
+            return False
+
+    def release_lease(self, name, owner):
+        self._conn().execute(
+            "DELETE FROM _lease WHERE name = ? AND owner = ?", (name, owner)
+        )
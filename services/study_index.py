@@ -0,0 +1,86 @@
+from services.table_index import TableIndex
+
+
+class StudyLogIndex(TableIndex):
+    """
+    study_log シートのユーザー別インデックス。
+    ユーザー (user_id / 表示名) ごとに、行番号の一覧・ステータス別の行・日付別の行を持ち、
+    進行中 (STARTED) や最新の PENDING の行を履歴の長さに関係なく引けるようにする。
+    """
+
+    table = "study_log"
+
+    def _clear(self):
+        self._by_user = {}
+        self._by_status = {}
+        self._by_date = {}
+
+    @staticmethod
+    def _user_keys(row):
+        keys = []
+        uid = str(row.get("user_id", "")).strip()
+        name = str(row.get("display_name", "")).strip()
+        if uid:
+            keys.append(("id", uid))
+        if name:
+            keys.append(("name", name))
+        return keys
+
+    def _add(self, row):
+        status = str(row.get("status", "")).strip()
+        date = str(row.get("date", "")).strip()
+        for key in self._user_keys(row):
+            self._bucket_add(self._by_user, key, row["_row"])
+            self._bucket_add(self._by_status, (key, status), row["_row"])
+            self._bucket_add(self._by_date, (key, date), row["_row"])
+
+    def _remove(self, row):
+        status = str(row.get("status", "")).strip()
+        date = str(row.get("date", "")).strip()
+        for key in self._user_keys(row):
+            self._bucket_remove(self._by_user, key, row["_row"])
+            self._bucket_remove(self._by_status, (key, status), row["_row"])
+            self._bucket_remove(self._by_date, (key, date), row["_row"])
+
+    @staticmethod
+    def _lookup_keys(user_id, user_name):
+        keys = []
+        if user_id:
+            keys.append(("id", str(user_id)))
+        if user_name:
+            keys.append(("name", str(user_name)))
+        return keys
+
+    def _collect(self, buckets, user_id, user_name, suffix=None):
+        rows = set()
+        for key in self._lookup_keys(user_id, user_name):
+            rows.update(buckets.get(key if suffix is None else (key, suffix), ()))
+        return sorted(rows)
+
+    def user_rows(self, user_id, user_name=None):
+        """ユーザーの全行（user_id 一致、または表示名一致）を行番号順に返す"""
+        self._ensure()
+        with self._lock:
+            rows = self._collect(self._by_user, user_id, user_name)
+            return [self._copy(r) for r in rows]
+
+    def latest(self, user_id, user_name, status):
+        """指定ステータスの行を新しい順に返す（必要な分だけ取り出せるようジェネレータ）"""
+        self._ensure()
+        with self._lock:
+            rows = self._collect(self._by_status, user_id, user_name, status)
+        for row_index in reversed(rows):
+            with self._lock:
+                row = self._copy(row_index)
+            if row:
+                yield row
+
+    def rows_on(self, user_id, user_name, date):
+        """指定日の行を行番号順に返す"""
+        self._ensure()
+        with self._lock:
+            rows = self._collect(self._by_date, user_id, user_name, date)
+            return [self._copy(r) for r in rows]
+
+
+study_log_index = StudyLogIndex()
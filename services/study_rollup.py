@@ -0,0 +1,87 @@
+import datetime
+
+from services.table_index import TableIndex
+
+
+class StudyRollup(TableIndex):
+    """
+    承認済み (APPROVED) の学習時間の集計。
+    ユーザー × 日付 × 教科 の分数と、ユーザーごとの累計を持つ。
+    行が APPROVED になる/でなくなる変更は TableIndex の差分反映でそのまま加減算される。
+    """
+
+    table = "study_log"
+
+    def _clear(self):
+        self._days = {}
+        self._totals = {}
+
+    @staticmethod
+    def _user_key(row):
+        uid = str(row.get("user_id", "")).strip()
+        if uid:
+            return ("id", uid)
+        return ("name", str(row.get("display_name", "")).strip())
+
+    @staticmethod
+    def _entry(row):
+        """集計対象なら (日付, 教科, 分) を返す"""
+        if str(row.get("status", "")).strip() != "APPROVED":
+            return None
+        date_str = str(row.get("date", "")).strip()
+        try:
+            datetime.datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            return None
+        dur_val = str(row.get("duration_min", "")).strip()
+        minutes = int(dur_val) if dur_val.isdigit() else 0
+        subject = str(row.get("subject", "")).strip() or "その他"
+        return date_str, subject, minutes
+
+    def _apply_row(self, row, sign):
+        entry = self._entry(row)
+        if entry is None:
+            return
+        date_str, subject, minutes = entry
+        key = self._user_key(row)
+        subjects = self._days.setdefault(key, {}).setdefault(date_str, {})
+        subjects[subject] = subjects.get(subject, 0) + sign * minutes
+        self._totals[key] = self._totals.get(key, 0) + sign * minutes
+
+    def _add(self, row):
+        self._apply_row(row, 1)
+
+    def _remove(self, row):
+        self._apply_row(row, -1)
+
+    @staticmethod
+    def _lookup_keys(user_id, user_name):
+        keys = [("id", str(user_id))]
+        if user_name:
+            keys.append(("name", str(user_name)))
+        return keys
+
+    def total(self, user_id, user_name=None):
+        """累計の学習時間（分）"""
+        self._ensure()
+        with self._lock:
+            return sum(
+                self._totals.get(k, 0) for k in self._lookup_keys(user_id, user_name)
+            )
+
+    def _merged(self, keys, date_str):
+        merged = {}
+        for key in keys:
+            for subject, minutes in self._days.get(key, {}).get(date_str, {}).items():
+                merged[subject] = merged.get(subject, 0) + minutes
+        return {s: m for s, m in merged.items() if m}
+
+    def days(self, user_id, user_name, dates):
+        """日付 (date / datetime) ごとの教科別の学習時間 [{教科: 分}, ...]"""
+        self._ensure()
+        keys = self._lookup_keys(user_id, user_name)
+        with self._lock:
+            return [self._merged(keys, d.strftime("%Y-%m-%d")) for d in dates]
+
+
+study_rollup = StudyRollup()
@@ -0,0 +1,143 @@
+import os
+import threading
+import uuid
+
+from services.gsheet import GSheetService
+
+
+class SheetSyncService:
+    """
+    SQLite エンジンに溜まった変更 (_outbox) を Google スプレッドシートへ書き戻す。
+    変更はローカル書き込みと同じトランザクションで記録されるため、
+    プロセスが再起動しても未反映分は次回の同期で送られる。
+    """
+
+    LEASE_NAME = "sheet_sync"
+    LEASE_TTL = 120
+
+    _thread = None
+    _stop = threading.Event()
+    _lock = threading.Lock()
+    _owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    @classmethod
+    def _row_values(cls, storage, table, header, row_index):
+        row = storage.get_row(table, row_index) or {}
+        # USER_ENTERED で送るので、数値・日付は update_cell のときと同じ型で入る
+        return [str(row.get(h, "")) if h else "" for h in header]
+
+    @classmethod
+    def flush(cls):
+        """未反映の変更をテーブルごとにまとめてシートへ送る（送信した変更数を返す）"""
+        storage = GSheetService.storage()
+        if getattr(storage, "name", "") != "sqlite" or not storage.journal:
+            return 0
+
+        with cls._lock:
+            if not storage.acquire_lease(cls.LEASE_NAME, cls._owner, cls.LEASE_TTL):
+                return 0
+            try:
+                tables = []
+                for _, table, _, _ in storage.pending_changes():
+                    if table not in tables:
+                        tables.append(table)
+
+                sent = 0
+                for table in tables:
+                    try:
+                        sent += cls._flush_table(storage, table)
+                    except Exception as e:
+                        # 失敗した変更は _outbox に残し、次回に再送する
+                        print(f"Sheet Sync Error ({table}): {e}")
+                return sent
+            finally:
+                storage.release_lease(cls.LEASE_NAME, cls._owner)
+
+    @classmethod
+    def _flush_table(cls, storage, table):
+        from gspread.utils import rowcol_to_a1
+
+        changes = storage.pending_changes(table)
+        if not changes:
+            return 0
+
+        sheet = GSheetService.get_worksheet(table)
+        if not sheet:
+            return 0
+
+        header = [str(h).strip() for h in sheet.row_values(1)]
+        if not header:
+            print(f"【Error】{table} のヘッダー情報が取得できません")
+            return 0
+
+        sheet_rows = storage.get_sheet_rows(table)
+        if sheet_rows is None:
+            sheet_rows = len(sheet.col_values(1))
+
+        # 1. 行削除は記録順に適用する (シートにまだない行の削除は不要)
+        dirty = set()
+        for change_id, _, row_index, op in changes:
+            if op == "delete":
+                if row_index <= sheet_rows:
+                    sheet.delete_rows(row_index)
+                    sheet_rows -= 1
+                    storage.set_sheet_rows(table, sheet_rows)
+                # 再送で二重に削除しないよう、適用した削除はすぐに消す
+                storage.clear_change(change_id)
+            else:
+                dirty.add(row_index)
+
+        # 2. 既存行の更新は1回の batch_update にまとめる
+        updates = []
+        for row_index in sorted(r for r in dirty if r <= sheet_rows):
+            updates.append(
+                {
+                    "range": f"A{row_index}:{rowcol_to_a1(row_index, len(header))}",
+                    "values": [cls._row_values(storage, table, header, row_index)],
+                }
+            )
+        if updates:
+            sheet.batch_update(updates, value_input_option="USER_ENTERED")
+
+        # 3. シートの末尾より後ろの行は append_rows で連続して追記する
+        last_row = storage.max_row(table)
+        if any(r > sheet_rows for r in dirty) and last_row > sheet_rows:
+            new_rows = [
+                cls._row_values(storage, table, header, r)
+                for r in range(sheet_rows + 1, last_row + 1)
+            ]
+            sheet.append_rows(
+                new_rows,
+                value_input_option="USER_ENTERED",
+                table_range=f"A{sheet_rows + 1}",
+            )
+            sheet_rows = last_row
+
+        storage.set_sheet_rows(table, sheet_rows)
+        storage.clear_changes(table, changes[-1][0])
+        return len(changes)
+
+    @classmethod
+    def start(cls, interval=None):
+        """一定間隔で flush するバックグラウンドスレッドを起動"""
+        if interval is None:
+            interval = float(os.environ.get("SHEET_SYNC_INTERVAL", "30"))
+        if interval <= 0 or (cls._thread and cls._thread.is_alive()):
+            return
+
+        def run():
+            while not cls._stop.wait(interval):
+                try:
+                    cls.flush()
+                except Exception as e:
+                    print(f"Sheet Sync Error: {e}")
+
+        cls._stop.clear()
+        cls._thread = threading.Thread(target=run, name="sheet-sync", daemon=True)
+        cls._thread.start()
+
+    @classmethod
+    def stop(cls, flush=True):
+        cls._stop.set()
+        if flush:
+            cls.flush()
@@ -0,0 +1,99 @@
+import threading
+
+from services.gsheet import GSheetService
+
+
+class TableIndex:
+    """
+    テーブルの内容から作るメモリ上のインデックスの基底クラス。
+    GSheetService 経由の書き込みは apply() で差分反映し、
+    それ以外の変更（シートの手編集・他プロセスの書き込み）は
+    storage.version(table) の変化を見て次の参照時に作り直す。
+    """
+
+    table = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._header = []
+        self._rows = {}
+        self._clear()
+        GSheetService.register_index(self)
+
+    # --- サブクラスで実装 ---
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _add(self, row):
+        raise NotImplementedError
+
+    def _remove(self, row):
+        raise NotImplementedError
+
+    # --- 共通処理 ---
+
+    def _ensure(self):
+        """テーブルが変わっていれば作り直す"""
+        version = GSheetService.storage().version(self.table)
+        with self._lock:
+            if version == self._version:
+                return
+        rows = GSheetService.get_rows(self.table)
+        header = GSheetService.get_header(self.table)
+        with self._lock:
+            self._rows = {}
+            self._header = header
+            self._clear()
+            for row in rows:
+                self._insert(row)
+            self._version = version
+
+    def _insert(self, row):
+        self._rows[row["_row"]] = row
+        self._add(row)
+
+    def _copy(self, row_index):
+        row = self._rows.get(row_index)
+        return dict(row) if row else None
+
+    def apply(self, op, row_index, fields, before, after):
+        """GSheetService からの書き込み通知"""
+        with self._lock:
+            if self._version is None or self._version != before:
+                # 既に古いので次の参照時に作り直す
+                return
+            if op == "update":
+                row = self._rows.get(row_index)
+                if row is None:
+                    self._version = None
+                    return
+                self._remove(row)
+                row.update({k: str(v) for k, v in fields.items() if k in row})
+                self._add(row)
+            elif op == "append":
+                row = {h: "" for h in self._header if h}
+                row.update({k: str(v) for k, v in fields.items() if k in row})
+                row["_row"] = row_index
+                self._insert(row)
+            else:
+                # 行削除は後ろの行番号がずれるので作り直す
+                self._version = None
+                return
+            self._version = after
+
+    @staticmethod
+    def _bucket_add(buckets, key, row_index):
+        rows = buckets.setdefault(key, [])
+        rows.append(row_index)
+        if len(rows) > 1 and rows[-2] > row_index:
+            rows.sort()
+
+    @staticmethod
+    def _bucket_remove(buckets, key, row_index):
+        rows = buckets.get(key)
+        if rows and row_index in rows:
+            rows.remove(row_index)
+            if not rows:
+                del buckets[key]
@@ -0,0 +1,125 @@
+import bisect
+
+from services.table_index import TableIndex
+
+
+class TransactionIndex(TableIndex):
+    """
+    transactions シートの時刻順インデックス。
+    (timestamp, 行番号) の昇順リストを全体・ユーザー別・種類別に持ち、
+    新しい順のページをカーソルから limit 件だけ取り出せるようにする。
+    """
+
+    table = "transactions"
+
+    def _clear(self):
+        self._all = []
+        self._by_user = {}
+        self._by_type = {}
+        header = getattr(self, "_header", [])
+        self._col_time = (
+            "time" if "time" in header and "timestamp" not in header else "timestamp"
+        )
+
+    def _key(self, row):
+        return (str(row.get(self._col_time, "")), row["_row"])
+
+    def _buckets(self, row):
+        return (
+            (self._by_user, str(row.get("user_id", ""))),
+            (self._by_type, str(row.get("tx_type", ""))),
+        )
+
+    def _add(self, row):
+        key = self._key(row)
+        bisect.insort(self._all, key)
+        for buckets, name in self._buckets(row):
+            bisect.insort(buckets.setdefault(name, []), key)
+
+    @staticmethod
+    def _discard(keys, key):
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    def _remove(self, row):
+        key = self._key(row)
+        self._discard(self._all, key)
+        for buckets, name in self._buckets(row):
+            keys = buckets.get(name)
+            if keys:
+                self._discard(keys, key)
+                if not keys:
+                    del buckets[name]
+
+    @staticmethod
+    def encode_cursor(key):
+        return f"{key[1]}:{key[0]}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """カーソル文字列 → (timestamp, 行番号)。不正な値は None"""
+        row, _, timestamp = str(cursor or "").partition(":")
+        if not row.isdigit():
+            return None
+        return (timestamp, int(row))
+
+    def page(
+        self,
+        cursor=None,
+        limit=50,
+        user_id=None,
+        tx_type=None,
+        date_from=None,
+        date_to=None,
+    ):
+        """
+        新しい順に limit 件の取引（"_row" 付きの行）と次ページのカーソルを返す。
+        絞り込み（ユーザー・種類・日付 "YYYY-MM-DD" の範囲）は行を取り出す前に
+        インデックス上で行うので、コストは履歴の長さではなく limit で決まる。
+        """
+        self._ensure()
+        with self._lock:
+            # 候補の少ない方のリストを走査し、もう一方の条件は行で確認する
+            candidates = [self._all]
+            if user_id:
+                candidates.append(self._by_user.get(str(user_id), []))
+            if tx_type:
+                candidates.append(self._by_type.get(str(tx_type), []))
+            keys = min(candidates, key=len)
+
+            # 日付の範囲とカーソルをリスト上の位置に変換する
+            lo = bisect.bisect_left(keys, (date_from, 0)) if date_from else 0
+            hi = len(keys)
+            if date_to:
+                # "YYYY-MM-DD" の日の終わりまで含める
+                hi = bisect.bisect_left(keys, (f"{date_to}\uffff", 0))
+            after = self.decode_cursor(cursor)
+            if after is not None:
+                hi = min(hi, bisect.bisect_left(keys, after))
+
+            rows = []
+            next_cursor = None
+            i = hi - 1
+            while i >= lo:
+                key = keys[i]
+                row = self._rows.get(key[1])
+                i -= 1
+                if user_id and str(row.get("user_id", "")) != str(user_id):
+                    continue
+                if tx_type and str(row.get("tx_type", "")) != str(tx_type):
+                    continue
+                if len(rows) == limit:
+                    next_cursor = self.encode_cursor(self._key(rows[-1]))
+                    break
+                rows.append(self._copy(key[1]))
+            return rows, next_cursor
+
+    def types(self):
+        """記録されている取引種類の一覧"""
+        self._ensure()
+        with self._lock:
+            return sorted(t for t in self._by_type if t)
+
+
+transaction_index = TransactionIndex()
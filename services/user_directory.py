@@ -0,0 +1,67 @@
+from services.table_index import TableIndex
+
+
+class UserDirectory(TableIndex):
+    """
+    users シートのメモリ上のディレクトリ。
+    user_id / display_name / role から行を O(1) で引けるようにする。
+    """
+
+    table = "users"
+
+    def _clear(self):
+        self._by_id = {}
+        self._by_name = {}
+        self._by_role = {}
+
+    @staticmethod
+    def _keys(row):
+        return (
+            str(row.get("user_id", "")),
+            str(row.get("display_name", "")),
+            str(row.get("role", "")),
+        )
+
+    def _add(self, row):
+        uid, name, role = self._keys(row)
+        self._bucket_add(self._by_id, uid, row["_row"])
+        self._bucket_add(self._by_name, name, row["_row"])
+        self._bucket_add(self._by_role, role, row["_row"])
+
+    def _remove(self, row):
+        uid, name, role = self._keys(row)
+        self._bucket_remove(self._by_id, uid, row["_row"])
+        self._bucket_remove(self._by_name, name, row["_row"])
+        self._bucket_remove(self._by_role, role, row["_row"])
+
+    def get(self, user_id):
+        """user_id の行（"_row" 付き）を返す。重複時はシート上で先の行"""
+        self._ensure()
+        with self._lock:
+            rows = self._by_id.get(str(user_id))
+            return self._copy(rows[0]) if rows else None
+
+    def row_of(self, user_id):
+        """user_id のシート上の行番号"""
+        self._ensure()
+        with self._lock:
+            rows = self._by_id.get(str(user_id))
+            return rows[0] if rows else None
+
+    def find_by_name(self, display_name):
+        self._ensure()
+        with self._lock:
+            return [self._copy(r) for r in self._by_name.get(str(display_name), [])]
+
+    def with_role(self, role):
+        self._ensure()
+        with self._lock:
+            return [self._copy(r) for r in self._by_role.get(str(role), [])]
+
+    def all(self):
+        self._ensure()
+        with self._lock:
+            return [self._copy(r) for r in sorted(self._rows)]
+
+
+user_directory = UserDirectory()
@@ -0,0 +1,54 @@
+import os
+import threading
+
+from services.gsheet import GSheetService
+from services.job import JobService
+from services.shop import ShopService
+from services.user_directory import user_directory
+from utils.fanout import load_parallel
+from utils.startup_profile import startup_profile
+
+
+class WarmupService:
+    """
+    起動直後に裏のスレッドで、最初のリクエストで必要になるものを先に用意する。
+    - ハンドラのモジュールの読み込み
+    - シートへの接続（OAuth のトークン取得と open_by_key）
+    - よく読むデータ（ユーザー・商品・募集中のお手伝い）の読み込み
+    最初のリクエストはこれと並行して処理され、同じシートの読み込みは待ち合わせて1回で済む。
+    """
+
+    _thread = None
+
+    @classmethod
+    def start(cls, *preloads):
+        """preloads は先に呼んでおく関数（ハンドラの読み込みなど）"""
+        if cls._thread and cls._thread.is_alive():
+            return
+        cls._thread = threading.Thread(
+            target=cls.run, args=preloads, name="warmup", daemon=True
+        )
+        cls._thread.start()
+
+    @staticmethod
+    def run(*preloads):
+        with startup_profile.timed("warmup"):
+            for preload in preloads:
+                try:
+                    preload()
+                except Exception as e:
+                    print(f"Warmup Error: {e}")
+
+            # シートの認証情報がある場合だけ接続する（SQLite のみで動かす場合は不要）
+            if os.environ.get("GOOGLE_CREDENTIALS"):
+                GSheetService.get_spreadsheet()
+
+            load_parallel(
+                {
+                    "users": user_directory.all,
+                    "shop_items": ShopService.get_items,
+                    "open_jobs": JobService.get_open_jobs,
+                },
+                timeout=60,
+            )
+        startup_profile.mark("warmup done")
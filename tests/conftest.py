@@ -0,0 +1,281 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下を import できるようにする（python -m pytest でも pytest でも動くように）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot_instance / app の読み込みに必要な値（実際の LINE には送らない）
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "test-token")
+os.environ.setdefault("LINE_CHANNEL_SECRET", "test-secret")
+os.environ.setdefault("SESSION_TIMEOUT_SCHEDULER", "0")
+os.environ.setdefault("SHEET_SYNC_INTERVAL", "0")
+
+import gspread  # noqa: E402
+from flask import Flask  # noqa: E402
+from gspread.utils import a1_to_rowcol  # noqa: E402
+
+from services import state_store  # noqa: E402
+from services.gsheet import GSheetService  # noqa: E402
+from services.storage import AUTO_CREATED_TABLES, TABLE_COLUMNS  # noqa: E402
+from utils import cache  # noqa: E402
+from utils.keyed_executor import KeyedExecutor  # noqa: E402
+
+
+class FakeSheet:
+    """
+    gspread.Worksheet のうちストレージが使うメソッドだけを真似る。
+    values はシートの全セル（1行目がヘッダー）、calls は呼ばれた API の記録。
+    fail に例外を入れておくと、次の書き込みでそれを投げる。
+    """
+
+    def __init__(self, title, values, calls):
+        self.title = title
+        self.values = [[str(v) for v in row] for row in values]
+        self.calls = calls
+        self.fail = None
+
+    def _record(self, name, **kwargs):
+        self.calls.append((self.title, name, kwargs))
+
+    def _write(self, name, **kwargs):
+        self._record(name, **kwargs)
+        if self.fail is not None:
+            error, self.fail = self.fail, None
+            raise error
+
+    def _set(self, row, col, value):
+        while len(self.values) < row:
+            self.values.append([])
+        cells = self.values[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = str(value)
+
+    def add(self, **fields):
+        """API を通さずに行を足す（シートの手編集・他のプロセスの書き込みの代わり）"""
+        header = self.values[0]
+        self.values.append([str(fields.get(h, "")) for h in header])
+        return len(self.values)
+
+    def set(self, row_index, **fields):
+        """API を通さずにセルを書き換える"""
+        header = self.values[0]
+        for key, value in fields.items():
+            self._set(row_index, header.index(key) + 1, value)
+
+    # --- 読み込み ---
+
+    def get_all_values(self):
+        self._record("get_all_values")
+        return [list(row) for row in self.values]
+
+    def row_values(self, row):
+        self._record("row_values")
+        return list(self.values[row - 1]) if row <= len(self.values) else []
+
+    def col_values(self, col):
+        self._record("col_values")
+        return [row[col - 1] for row in self.values if len(row) >= col]
+
+    def get(self, range_name):
+        self._record("get", range=range_name)
+        row, _ = a1_to_rowcol(range_name.split(":")[0])
+        return [list(r) for r in self.values[row - 1 :]]
+
+    def batch_get(self, ranges):
+        self._record("batch_get", ranges=list(ranges))
+        results = []
+        for range_name in ranges:
+            row, _ = a1_to_rowcol(range_name.split(":")[0])
+            results.append(
+                [list(self.values[row - 1])] if row <= len(self.values) else []
+            )
+        return results
+
+    # --- 書き込み ---
+
+    def batch_update(self, updates, value_input_option=None):
+        self._write("batch_update", value_input_option=value_input_option)
+        for update in updates:
+            row, col = a1_to_rowcol(update["range"].split(":")[0])
+            for i, values in enumerate(update["values"]):
+                for j, value in enumerate(values):
+                    self._set(row + i, col + j, value)
+
+    def append_row(self, values, value_input_option=None):
+        self._write("append_row", value_input_option=value_input_option)
+        self.values.append([str(v) for v in values])
+        n = len(self.values)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{n}:Z{n}"}}
+
+    def append_rows(self, values, value_input_option=None, table_range=None):
+        self._write(
+            "append_rows",
+            value_input_option=value_input_option,
+            table_range=table_range,
+        )
+        first = len(self.values) + 1
+        for row in values:
+            self.values.append([str(v) for v in row])
+        last = len(self.values)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:Z{last}"}}
+
+    def delete_rows(self, index):
+        self._write("delete_rows")
+        del self.values[index - 1]
+
+
+class FakeDoc:
+    """gspread.Spreadsheet の代わり（worksheet / add_worksheet / values_batch_update）"""
+
+    def __init__(self, tables):
+        self.calls = []
+        self.sheets = {
+            name: FakeSheet(name, [header], self.calls)
+            for name, header in tables.items()
+        }
+        self.fail = None
+
+    def __getitem__(self, name):
+        return self.sheets[name]
+
+    def worksheet(self, name):
+        if name not in self.sheets:
+            raise gspread.WorksheetNotFound(name)
+        return self.sheets[name]
+
+    def add_worksheet(self, title, rows, cols):
+        self.sheets[title] = FakeSheet(title, [], self.calls)
+        return self.sheets[title]
+
+    def values_batch_update(self, body):
+        self.calls.append((None, "values_batch_update", {}))
+        if self.fail is not None:
+            error, self.fail = self.fail, None
+            raise error
+        for data in body["data"]:
+            name, range_name = data["range"].rsplit("!", 1)
+            sheet = self.sheets[name.strip("'")]
+            row, col = a1_to_rowcol(range_name.split(":")[0])
+            for j, value in enumerate(data["values"][0]):
+                sheet._set(row, col + j, value)
+
+    def api_calls(self, *names):
+        """記録された API 呼び出しの名前（names を指定するとそれだけ）"""
+        return [c[1] for c in self.calls if not names or c[1] in names]
+
+
+def _reset_indexes():
+    for indexes in GSheetService._indexes.values():
+        for index in indexes:
+            with index._lock:
+                index._version = None
+                index._rows = {}
+                index._header = []
+                index._clear()
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    """テストごとにストレージ・状態の保存先・インデックス・キャッシュを作り直す"""
+    monkeypatch.delenv("GOOGLE_CREDENTIALS", raising=False)
+    monkeypatch.setenv("STORAGE_BACKEND", "gsheet")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "storage.db"))
+    monkeypatch.setenv("STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setenv("SESSION_TIMEOUT_LOCK", str(tmp_path / "timeouts.lock"))
+    monkeypatch.setattr(GSheetService, "_storage", None)
+    monkeypatch.setattr(GSheetService, "_client", None)
+    monkeypatch.setattr(GSheetService, "_doc", None)
+    # テストの中で作ったインデックスは終わったら登録から外す
+    monkeypatch.setattr(
+        GSheetService,
+        "_indexes",
+        {table: list(indexes) for table, indexes in GSheetService._indexes.items()},
+    )
+    monkeypatch.setattr(state_store, "_engines", {})
+    _reset_indexes()
+    for name in dir(cache):
+        if isinstance(getattr(cache, name), cache.TTLCache):
+            getattr(cache, name).clear()
+    yield
+    _reset_indexes()
+
+
+@pytest.fixture
+def doc(monkeypatch):
+    """TABLE_COLUMNS のヘッダーだけが入った偽のスプレッドシートにつなぐ"""
+    fake = FakeDoc(
+        {
+            table: header
+            for table, header in TABLE_COLUMNS.items()
+            if table not in AUTO_CREATED_TABLES
+        }
+    )
+    monkeypatch.setattr(GSheetService, "_client", object())
+    monkeypatch.setattr(GSheetService, "_doc", fake)
+    return fake
+
+
+@pytest.fixture(params=["gsheet", "sqlite"])
+def backend(request, monkeypatch, doc):
+    """両方のストレージエンジンで同じテストを流す"""
+    monkeypatch.setenv("STORAGE_BACKEND", request.param)
+    return request.param
+
+
+class WebhookClient:
+    """/callback だけを持つテスト用のアプリ。処理されたイベントは handled に入る"""
+
+    def __init__(self, secret):
+        from blueprints import bot
+
+        self.secret = secret
+        self.handled = []
+        app = Flask(__name__)
+        app.register_blueprint(bot.bot_bp)
+        self._client = app.test_client()
+
+    def post(self, event_id, redelivery=False, secret=None):
+        body = json.dumps(
+            {
+                "destination": "Uxxx",
+                "events": [
+                    {
+                        "type": "postback",
+                        "mode": "active",
+                        "timestamp": 1,
+                        "source": {"type": "user", "userId": "U1"},
+                        "replyToken": "token",
+                        "postback": {"data": "action=noop"},
+                        "webhookEventId": event_id,
+                        "deliveryContext": {"isRedelivery": redelivery},
+                    }
+                ],
+            }
+        )
+        digest = hmac.new(
+            (secret or self.secret).encode(), body.encode(), hashlib.sha256
+        ).digest()
+        return self._client.post(
+            "/callback",
+            data=body,
+            headers={"X-Line-Signature": base64.b64encode(digest).decode()},
+        )
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    import bot_instance
+    from blueprints import bot
+
+    client = WebhookClient(bot_instance.LINE_SECRET)
+    monkeypatch.setattr(bot, "process_event", client.handled.append)
+    # キューに積まずにその場で処理させる
+    monkeypatch.setattr(bot, "webhook_executor", KeyedExecutor(max_workers=0))
+    return client
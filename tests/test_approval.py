@@ -0,0 +1,103 @@
+import pytest
+
+from services.approval import ApprovalService
+from services.economy import EconomyService
+from services.gsheet import GSheetService
+
+
+def seed_pending():
+    """ユーザー2人と承認待ち（勉強2件・お手伝い1件・ミッション1件）を用意する"""
+    for user_id in ("U1", "U2"):
+        GSheetService.append(
+            "users",
+            {
+                "user_id": user_id,
+                "display_name": user_id,
+                "current_exp": 0,
+                "inventory_json": "{}",
+            },
+        )
+    for user_id, end, minutes in (("U1", "11:00:00", 60), ("U2", "10:30:00", 30)):
+        GSheetService.append(
+            "study_log",
+            {
+                "user_id": user_id,
+                "display_name": user_id,
+                "date": "2026-10-18",
+                "start_time": "10:00:00",
+                "end_time": end,
+                "duration_min": minutes,
+                "status": "PENDING",
+            },
+        )
+    GSheetService.append(
+        "jobs", {"job_id": "J1", "reward": 50, "status": "REVIEW", "worker_id": "U2"}
+    )
+    GSheetService.append(
+        "missions",
+        {"mission_id": "M1", "user_id": "U1", "reward": 20, "status": "PENDING"},
+    )
+    return ApprovalService.get_all_pending()
+
+
+@pytest.fixture
+def pending(doc):
+    return seed_pending()
+
+
+def test_approve_many_pays_rewards_once(doc, pending):
+    assert sorted(p["type"] for p in pending) == ["job", "mission", "study", "study"]
+    doc.calls.clear()
+
+    results = ApprovalService.approve_many(pending)
+
+    assert all(r["ok"] for r in results)
+    # 勉強は初回ボーナス込み（1件ずつの承認と同じ額）
+    study = sorted(r["reward"] for r in results if r["type"] == "study")
+    assert study == [60, 90]
+    assert EconomyService.get_balance("U1") == 90 + 20
+    assert EconomyService.get_balance("U2") == 60 + 50
+    assert doc.api_calls("append_rows") == ["append_rows"]
+
+    again = ApprovalService.approve_many(pending)
+    assert not any(r["ok"] for r in again)
+    assert len(GSheetService.get_rows("transactions")) == 4
+
+
+def test_nothing_is_paid_when_the_status_write_fails(doc, pending):
+    doc.fail = RuntimeError("quota")
+
+    results = ApprovalService.approve_many(pending)
+
+    assert not any(r["ok"] for r in results)
+    assert GSheetService.get_rows("transactions") == []
+    assert len(GSheetService.get_rows("study_log", status="PENDING")) == 2
+
+
+def test_items_whose_status_write_fails_are_skipped_on_sqlite(monkeypatch, doc):
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    pending = seed_pending()
+    storage = GSheetService.storage()
+    update_fields = storage.update_fields
+    # jobs の更新だけ失敗させる（SQLite はその場で書き込み、失敗は False で返る）
+    monkeypatch.setattr(
+        storage,
+        "update_fields",
+        lambda table, row_index, fields: table != "jobs"
+        and update_fields(table, row_index, fields),
+    )
+
+    results = ApprovalService.approve_many(pending)
+
+    job = next(r for r in results if r["type"] == "job")
+    assert not job["ok"] and job["reason"]
+    assert all(r["ok"] for r in results if r["type"] != "job")
+    assert EconomyService.get_balance("U2") == 60
+    assert GSheetService.get_rows("jobs")[0]["status"] == "REVIEW"
+
+    # 書き込めるようになったら、残っていたお手伝いだけが払われる
+    monkeypatch.setattr(storage, "update_fields", update_fields)
+    again = ApprovalService.approve_many(pending)
+    assert [r["type"] for r in again if r["ok"]] == ["job"]
+    assert EconomyService.get_balance("U1") == 90 + 20
+    assert EconomyService.get_balance("U2") == 60 + 50
@@ -0,0 +1,78 @@
+import pytest
+
+from services.economy import EconomyService
+from services.gsheet import GSheetService
+from services.ledger import balance_checkpoints
+
+
+@pytest.fixture
+def users(backend, monkeypatch):
+    monkeypatch.setattr(EconomyService, "CHECKPOINT_INTERVAL", 3)
+    for user_id, exp in (("U1", 100), ("U2", 7)):
+        GSheetService.append(
+            "users",
+            {
+                "user_id": user_id,
+                "display_name": user_id,
+                "current_exp": exp,
+                "inventory_json": "{}",
+            },
+        )
+
+
+def test_balance_starts_from_current_exp(users):
+    assert EconomyService.get_balance("U1") == 100
+    assert EconomyService.add_exp("U1", 10, "T") == 110
+    assert EconomyService.add_exp("U1", -30, "BUY") == 80
+    assert EconomyService.get_balance("U1") == 80
+    assert balance_checkpoints.all()["U1"] == [(1, 100, "SEED")]
+
+
+def test_add_exp_many_appends_once_and_skips_unknown_users(users):
+    result = EconomyService.add_exp_many(
+        [("U1", 5, "a"), ("U2", 3, "b"), ("U1", 1, "c"), ("nobody", 1, "d")]
+    )
+
+    assert result == [105, 10, 106, False]
+    assert len(GSheetService.get_rows("transactions")) == 3
+
+
+def test_checkpoint_every_interval(users):
+    for amount in (1, 2, 3, 4):
+        EconomyService.add_exp("U1", amount, "T")
+
+    checkpoints = balance_checkpoints.all()["U1"]
+    assert [(balance, reason) for _, balance, reason in checkpoints] == [
+        (100, "SEED"),
+        (106, "AUTO"),
+    ]
+    assert EconomyService.get_balance("U1") == 110
+    assert EconomyService.verify_balances() == {
+        "balances": {"U1": 110},
+        "mismatches": [],
+    }
+
+
+def test_verify_reports_a_wrong_checkpoint(users):
+    for amount in (1, 2, 3):
+        EconomyService.add_exp("U1", amount, "T")
+    auto = GSheetService.get_rows("balance_checkpoints", reason="AUTO")[0]
+    GSheetService.update_fields("balance_checkpoints", auto["_row"], {"balance": 999})
+
+    mismatches = EconomyService.verify_balances()["mismatches"]
+
+    assert mismatches[0] == {
+        "user_id": "U1",
+        "ledger_row": 4,
+        "expected": 106,
+        "recorded": 999,
+    }
+
+
+def test_reset_starts_again_from_zero(users):
+    EconomyService.add_exp("U2", 3, "T")
+    assert EconomyService.reset_user("U2")
+    assert EconomyService.register_user("U2", "U2")
+
+    assert EconomyService.get_balance("U2") == 0
+    assert EconomyService.verify_balances()["mismatches"] == []
@@ -0,0 +1,158 @@
+import pytest
+from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage
+from linebot.models.error import Error
+
+from utils import line_dispatcher
+from utils.line_dispatcher import LineDispatcher
+
+
+def user(i):
+    return f"U{i:032x}"
+
+
+class FakeApi:
+    """LineBotApi の送信メソッドの代わり。fail に (status, headers) を積むと順に失敗する"""
+
+    def __init__(self):
+        self.headers = {"Authorization": "Bearer test"}
+        self.calls = []
+        self.fail = []
+
+    def _send(self, kind, to, messages, retry_key=None):
+        if retry_key:
+            self.headers["X-Line-Retry-Key"] = retry_key
+        self.calls.append((kind, to, [m.text for m in messages], retry_key))
+        if self.fail:
+            status, headers = self.fail.pop(0)
+            raise LineBotApiError(status, headers, error=Error(message="error"))
+
+    def push_message(self, to, messages, retry_key=None, notification_disabled=False):
+        self._send("push", to, messages, retry_key)
+
+    def multicast(self, to, messages, retry_key=None, notification_disabled=False):
+        self._send("multicast", list(to), messages, retry_key)
+
+    def reply_message(self, reply_token, messages, notification_disabled=False):
+        # Retry-Key が前の呼び出しから残っていると reply が断られる
+        assert "X-Line-Retry-Key" not in self.headers
+        self._send("reply", reply_token, messages)
+
+    def received(self, to):
+        """to に届いた内容を届いた順に"""
+        return [
+            text
+            for kind, target, texts, _ in self.calls
+            if target == to or (kind == "multicast" and to in target)
+            for text in texts
+        ]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waited = []
+    monkeypatch.setattr(line_dispatcher.time, "sleep", waited.append)
+    return waited
+
+
+@pytest.fixture
+def api():
+    return FakeApi()
+
+
+@pytest.fixture
+def dispatcher(api, sleeps):
+    dispatcher = LineDispatcher(api, window=0.05, max_retries=2, sync=False)
+    yield dispatcher
+    dispatcher.stop()
+
+
+def text(value):
+    return TextSendMessage(text=value)
+
+
+def test_same_content_is_sent_as_one_multicast(api, dispatcher):
+    for i in range(3):
+        dispatcher.push_message(user(i), text("hi"))
+    dispatcher.push_message("C" + "a" * 32, text("hi"))
+    dispatcher.reply_message("token", text("ok"))
+    assert dispatcher.flush()
+
+    kinds = [(kind, to) for kind, to, _, _ in api.calls]
+    assert kinds == [
+        ("reply", "token"),
+        ("push", "C" + "a" * 32),
+        ("multicast", [user(0), user(1), user(2)]),
+    ]
+    assert api.headers == {"Authorization": "Bearer test"}
+
+
+def test_each_recipient_keeps_its_order(api, dispatcher):
+    dispatcher.push_message(user(1), text("X"))
+    dispatcher.push_message(user(2), text("Y"))
+    dispatcher.push_message(user(2), text("X"))
+    dispatcher.push_message(user(1), text("Y"))
+    dispatcher.push_message(user(3), text("X"))
+    assert dispatcher.flush()
+
+    assert api.received(user(1)) == ["X", "Y"]
+    assert api.received(user(2)) == ["Y", "X"]
+    assert api.received(user(3)) == ["X"]
+    assert len(api.calls) == 3
+
+
+def test_invalid_ids_are_skipped_and_logged(api, dispatcher, capsys):
+    dispatcher.multicast([user(1), "U_virtual", ""], text("hi"))
+    assert dispatcher.flush()
+
+    assert [to for _, to, _, _ in api.calls] == [user(1)]
+    assert dispatcher.stats()["skipped"] == 2
+    assert "U_virtual" in capsys.readouterr().out
+
+
+def test_retry_uses_the_same_retry_key(api, dispatcher, sleeps):
+    api.fail = [(500, {}), (409, {})]
+    dispatcher.push_message(user(1), text("hi"))
+    assert dispatcher.flush()
+
+    keys = [key for _, _, _, key in api.calls]
+    assert len(keys) == 2 and keys[0] == keys[1]
+    assert dispatcher.stats()["failed"] == 0
+    assert len(sleeps) == 1
+
+
+def test_retry_after_is_honored(api, dispatcher, sleeps):
+    api.fail = [(429, {"Retry-After": "7"})]
+    dispatcher.push_message(user(1), text("hi"))
+    assert dispatcher.flush()
+
+    assert sleeps == [7.0]
+    assert len(api.calls) == 2
+
+
+def test_client_errors_are_not_retried(api, dispatcher):
+    api.fail = [(403, {})]
+    dispatcher.push_message(user(1), text("hi"))
+    assert dispatcher.flush()
+
+    assert len(api.calls) == 1
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_rejected_multicast_falls_back_to_push(api, dispatcher):
+    api.fail = [(400, {})]
+    dispatcher.multicast([user(1), user(2)], text("hi"))
+    assert dispatcher.flush()
+
+    assert [(kind, to) for kind, to, _, _ in api.calls] == [
+        ("multicast", [user(1), user(2)]),
+        ("push", user(1)),
+        ("push", user(2)),
+    ]
+
+
+def test_sync_mode_sends_immediately(api, sleeps):
+    dispatcher = LineDispatcher(api, sync=True)
+    dispatcher.push_message(user(1), text("hi"))
+
+    assert api.calls == [("push", user(1), ["hi"], api.calls[0][3])]
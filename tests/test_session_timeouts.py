@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+from services.gsheet import GSheetService
+from services.session_timeouts import JST, session_timeouts
+from utils.process_lock import ProcessLock
+
+
+@pytest.fixture
+def lock_path(monkeypatch, tmp_path):
+    path = str(tmp_path / "timeouts.lock")
+    monkeypatch.setattr(session_timeouts, "_process_lock", ProcessLock(path))
+    yield path
+    session_timeouts._process_lock.release()
+
+
+def started(doc, minutes_ago, user_id="U1"):
+    """他のワーカーが始めたセッションとしてシートに直接足す"""
+    start = datetime.datetime.now(JST) - datetime.timedelta(minutes=minutes_ago)
+    return doc["study_log"].add(
+        user_id=user_id,
+        display_name=user_id,
+        date=start.strftime("%Y-%m-%d"),
+        start_time=start.strftime("%H:%M:%S"),
+        status="STARTED",
+    )
+
+
+def test_expired_sessions_are_closed_once(doc, lock_path):
+    expired = started(doc, 100)
+    started(doc, 10, user_id="U2")
+    handled = []
+
+    sessions = session_timeouts.run_once(handled.extend)
+
+    assert [s["row_index"] for s in sessions] == [expired]
+    assert handled == sessions
+    assert GSheetService.get_row("study_log", expired)["status"] == "PENDING"
+    assert session_timeouts.run_once(handled.extend) == []
+    # cron から呼ばれた分のロックは処理が終わったら外す
+    assert not session_timeouts._process_lock.held
+
+
+def test_refresh_reads_only_new_and_active_rows(doc, lock_path):
+    finished = started(doc, 100)
+    assert [r["_row"] for r in session_timeouts.active_rows()] == [finished]
+
+    # 他のワーカーで1件終わり、1件始まった
+    doc["study_log"].set(finished, status="PENDING", end_time="12:00:00")
+    appended = started(doc, 100, user_id="U2")
+    doc.calls.clear()
+
+    sessions = session_timeouts.run_once(lambda sessions: None)
+
+    assert [s["row_index"] for s in sessions] == [appended]
+    assert doc.api_calls("get_all_values") == []
+    assert set(doc.api_calls("get", "batch_get")) == {"get", "batch_get"}
+
+
+def test_only_the_lock_holder_processes(doc, lock_path):
+    started(doc, 100)
+    other = ProcessLock(lock_path)
+    assert other.acquire()
+    try:
+        assert session_timeouts.run_once(lambda sessions: None) == []
+    finally:
+        other.release()
+
+    assert len(session_timeouts.run_once(lambda sessions: None)) == 1
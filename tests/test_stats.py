@@ -0,0 +1,36 @@
+from services.stats import SagaStats
+from services.status_service import StatusService
+
+
+def test_batch_matches_the_single_calculation():
+    minutes = [0, 45, 300, 45, -5, 10, 120, 1000]
+    for days, single in [
+        (1, SagaStats.calculate),
+        (7, SagaStats.calculate_weekly),
+        (30, SagaStats.calculate_monthly),
+    ]:
+        results = SagaStats.calculate_batch(minutes, days=days)
+        for m, result in zip(minutes, results):
+            expected = single(m)
+            if expected is None:
+                assert result is None
+            else:
+                assert result == dict(expected, tier=SagaStats.rank_tier(m))
+
+
+def test_batch_tier_uses_the_totals():
+    results = SagaStats.calculate_batch([60, 60], days=7, totals=[0, 12000])
+    assert [r["tier"] for r in results] == ["E", "S"]
+
+
+def test_rank_tiers_match_rank_tier_at_the_bounds():
+    totals = [12000, 0, 299, 300, 1199, 1200, 3600, 7199, 7200, 11999, -1]
+    assert SagaStats.rank_tiers(totals) == [SagaStats.rank_tier(t) for t in totals]
+    assert SagaStats.calculate_batch([]) == []
+
+
+def test_rank_infos_match_rank_info():
+    totals = [0, 300, 5000, 20000]
+    assert StatusService.get_rank_infos(totals) == [
+        StatusService.get_rank_info(t) for t in totals
+    ]
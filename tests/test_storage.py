@@ -0,0 +1,61 @@
+from services.gsheet import GSheetService
+from services.storage import SQLiteStorage
+
+
+def test_filters_ignore_surrounding_whitespace(backend):
+    GSheetService.append("study_log", {"user_id": "U1 ", "status": "PENDING"})
+    GSheetService.append("study_log", {"user_id": "　U1", "status": "PENDING\n"})
+    GSheetService.append("study_log", {"user_id": "U2", "status": "PENDING"})
+    GSheetService.append("study_log", {"user_id": "U1", "status": "APPROVED"})
+
+    rows = GSheetService.get_rows("study_log", user_id="U1", status="PENDING")
+    assert [r["_row"] for r in rows] == [2, 3]
+
+    rows = GSheetService.get_rows_any("study_log", user_id="U2", status="APPROVED")
+    assert [r["_row"] for r in rows] == [4, 5]
+
+
+def test_update_and_read_back(backend):
+    row_index = GSheetService.append("jobs", {"job_id": "J1", "status": "OPEN"})
+    assert GSheetService.update_fields("jobs", row_index, {"status": "REVIEW"})
+    assert GSheetService.get_row("jobs", row_index)["status"] == "REVIEW"
+    assert GSheetService.find_row("jobs", "job_id", "J1")["_row"] == row_index
+
+
+def test_rows_after_and_at_read_only_the_requested_rows(backend):
+    for i in range(4):
+        GSheetService.append("study_log", {"user_id": f"U{i}", "status": "STARTED"})
+
+    assert [r["user_id"] for r in GSheetService.get_rows_after("study_log", 3)] == [
+        "U2",
+        "U3",
+    ]
+    assert [r["_row"] for r in GSheetService.get_rows_at("study_log", [5, 2])] == [
+        2,
+        5,
+    ]
+
+
+def test_rows_after_sees_rows_written_by_others(doc):
+    GSheetService.get_rows("study_log")
+    doc["study_log"].add(user_id="U9", status="STARTED")
+
+    rows = GSheetService.get_rows_after("study_log", 1)
+    assert [r["user_id"] for r in rows] == ["U9"]
+    assert doc.api_calls("get_all_values") == ["get_all_values"]
+
+
+def test_sqlite_filters_use_the_trimmed_index(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "db.sqlite"))
+    storage.append("study_log", {"user_id": "U1"})
+
+    plan = (
+        storage._conn()
+        .execute(
+            "EXPLAIN QUERY PLAN SELECT _row FROM study_log WHERE "
+            f"{SQLiteStorage._stripped('user_id')} = ?",
+            ("U1",),
+        )
+        .fetchall()
+    )
+    assert "idx_study_log_user_id_trim" in str(plan)
@@ -0,0 +1,56 @@
+import pytest
+
+from services.gsheet import GSheetService
+from services.sync import SheetSyncService
+
+
+@pytest.fixture
+def journal(monkeypatch, doc):
+    """シートを初期データにした SQLite エンジン（変更を _outbox に記録する）"""
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("GOOGLE_CREDENTIALS", "test")
+    doc["users"].add(user_id="U1", display_name="A", current_exp="10")
+    storage = GSheetService.storage()
+    assert storage.journal
+    return storage
+
+
+def test_flush_sends_updates_and_appends_as_user_entered(doc, journal):
+    GSheetService.update_fields("users", 2, {"current_exp": 25})
+    GSheetService.append("users", {"user_id": "U2", "display_name": "B"})
+    doc.calls.clear()
+
+    assert SheetSyncService.flush() == 2
+
+    writes = [c for c in doc.calls if c[1] in ("batch_update", "append_rows")]
+    assert [c[1] for c in writes] == ["batch_update", "append_rows"]
+    assert all(c[2]["value_input_option"] == "USER_ENTERED" for c in writes)
+
+    header = doc["users"].values[0]
+    assert doc["users"].values[1][header.index("current_exp")] == "25"
+    assert doc["users"].values[2][header.index("user_id")] == "U2"
+    assert journal.pending_changes() == []
+    assert SheetSyncService.flush() == 0
+
+
+def test_failed_changes_stay_in_the_outbox(doc, journal):
+    GSheetService.update_fields("users", 2, {"display_name": "A2"})
+    doc["users"].fail = RuntimeError("quota")
+
+    assert SheetSyncService.flush() == 0
+    assert len(journal.pending_changes()) == 1
+
+    assert SheetSyncService.flush() == 1
+    header = doc["users"].values[0]
+    assert doc["users"].values[1][header.index("display_name")] == "A2"
+
+
+def test_deletes_are_applied_before_row_writes(doc, journal):
+    GSheetService.append("users", {"user_id": "U2", "display_name": "B"})
+    GSheetService.delete_row("users", 2)
+    GSheetService.append("users", {"user_id": "U3", "display_name": "C"})
+
+    SheetSyncService.flush()
+
+    assert [row[0] for row in doc["users"].values[1:]] == ["U2", "U3"]
+    assert journal.pending_changes() == []
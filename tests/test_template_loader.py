@@ -0,0 +1,39 @@
+import json
+
+from utils.template_loader import CompiledTemplate, load_template
+
+
+def test_placeholders_are_filled_in_place():
+    template = CompiledTemplate(
+        "t.json",
+        {"a": "${x}", "b": [{"c": "pre ${x} / ${y} post"}, 1, None], "d": True},
+    )
+
+    assert template.render({"x": 1, "y": "Y"}) == {
+        "a": "1",
+        "b": [{"c": "pre 1 / Y post"}, 1, None],
+        "d": True,
+    }
+    # 値が渡されなかった変数はそのまま残る
+    assert template.render({"x": 1})["b"][0]["c"] == "pre 1 / ${y} post"
+    assert template.variables == {"x", "y"}
+
+
+def test_non_finite_numbers_render():
+    data = json.loads('{"a": NaN, "b": [Infinity, -Infinity], "c": "${x}"}')
+    rendered = CompiledTemplate("t.json", data).render({"x": "v"})
+
+    assert rendered["a"] != rendered["a"]
+    assert rendered["b"] == [float("inf"), float("-inf")]
+    assert rendered["c"] == "v"
+
+
+def test_each_render_returns_a_new_object():
+    first = load_template("welcome_success.json", name="first-user")
+    first["type"] = "changed"
+    first["body"]["contents"].clear()
+
+    second = load_template("welcome_success.json", name="second-user")
+    assert second["type"] != "changed"
+    assert second["body"]["contents"]
+    assert "first-user" not in json.dumps(second, ensure_ascii=False)
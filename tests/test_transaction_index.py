@@ -0,0 +1,24 @@
+from services.gsheet import GSheetService
+from services.transaction_index import transaction_index
+
+
+def test_transaction_pages_are_newest_first(backend):
+    for i in range(5):
+        GSheetService.append(
+            "transactions",
+            {
+                "tx_id": f"T{i}",
+                "user_id": "U1" if i % 2 == 0 else "U2",
+                "amount": i,
+                "tx_type": "REWARD",
+                "timestamp": f"2026-10-0{i + 1} 12:00:00",
+            },
+        )
+
+    rows, cursor = transaction_index.page(limit=2)
+    assert [r["tx_id"] for r in rows] == ["T4", "T3"]
+    rows, cursor = transaction_index.page(cursor=cursor, limit=2)
+    assert [r["tx_id"] for r in rows] == ["T2", "T1"]
+
+    rows, _ = transaction_index.page(user_id="U1", date_to="2026-10-03")
+    assert [r["tx_id"] for r in rows] == ["T2", "T0"]
@@ -0,0 +1,30 @@
+from services.gsheet import GSheetService
+from services.user_directory import user_directory
+
+
+def test_writes_update_the_index_without_reloading(doc):
+    GSheetService.append("users", {"user_id": "U1", "display_name": "A"})
+    assert user_directory.get("U1")["display_name"] == "A"
+    loads = doc.api_calls("get_all_values")
+
+    row_index = GSheetService.append(
+        "users", {"user_id": "U2", "display_name": "B", "role": "ADMIN"}
+    )
+    GSheetService.update_fields("users", 2, {"display_name": "A2"})
+
+    assert user_directory.row_of("U2") == row_index
+    assert [u["user_id"] for u in user_directory.with_role("ADMIN")] == ["U2"]
+    assert [u["user_id"] for u in user_directory.find_by_name("A2")] == ["U1"]
+    assert user_directory.find_by_name("A") == []
+    assert doc.api_calls("get_all_values") == loads
+
+
+def test_delete_rebuilds_with_shifted_rows(backend):
+    for user_id in ("U1", "U2", "U3"):
+        GSheetService.append("users", {"user_id": user_id})
+    assert user_directory.row_of("U3") == 4
+
+    GSheetService.delete_row("users", 2)
+
+    assert user_directory.get("U1") is None
+    assert user_directory.row_of("U3") == 3
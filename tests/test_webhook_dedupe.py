@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from blueprints import bot
+from services import state_store
+from services.state_store import StateMap
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state_backend(request, monkeypatch):
+    monkeypatch.setenv("STATE_BACKEND", request.param)
+    return request.param
+
+
+def test_claim_is_true_only_once(state_backend):
+    events = StateMap("test_events", ttl=60)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(events.claim("E1")))
+        for _ in range(20)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(True) == 1
+    assert events.claim("E2")
+
+
+def test_redelivered_events_are_handled_once(webhook, state_backend, monkeypatch):
+    monkeypatch.setattr(bot, "received_events", StateMap("test_webhook", ttl=60))
+
+    assert webhook.post("E1").status_code == 200
+    assert webhook.post("E1", redelivery=True).status_code == 200
+    assert webhook.post("E2").status_code == 200
+
+    assert [e.webhook_event_id for e in webhook.handled] == ["E1", "E2"]
+
+
+def test_dedupe_survives_a_restart_by_default(webhook, monkeypatch):
+    # STATE_BACKEND が memory のままでも、受け取ったイベントは SQLite に残る
+    monkeypatch.setenv("STATE_BACKEND", "memory")
+    assert bot.received_events.backend == "sqlite"
+    assert webhook.post("E1").status_code == 200
+
+    # 再起動（または別のワーカー）: 保存先を開き直す
+    monkeypatch.setattr(state_store, "_engines", {})
+    assert webhook.post("E1", redelivery=True).status_code == 200
+
+    assert [e.webhook_event_id for e in webhook.handled] == ["E1"]
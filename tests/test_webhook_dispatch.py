@@ -0,0 +1,69 @@
+import threading
+
+from linebot.models import (
+    FollowEvent,
+    MessageEvent,
+    PostbackEvent,
+    StickerMessage,
+    TextMessage,
+)
+
+from blueprints import bot
+from utils.keyed_executor import KeyedExecutor
+
+
+def test_signed_events_are_handed_off(webhook):
+    assert webhook.post("E1").status_code == 200
+    assert [e.webhook_event_id for e in webhook.handled] == ["E1"]
+
+
+def test_bad_signature_is_rejected(webhook):
+    assert webhook.post("E1", secret="wrong").status_code == 400
+    assert webhook.handled == []
+
+
+def test_process_event_dispatch(monkeypatch):
+    monkeypatch.setattr(bot, "_event_handlers", {})
+    calls = []
+    bot.on(PostbackEvent)(lambda event: calls.append("postback"))
+    bot.on(MessageEvent, message=TextMessage)(lambda event: calls.append("text"))
+    bot.on(MessageEvent)(lambda event: calls.append("message"))
+
+    bot.process_event(PostbackEvent())
+    bot.process_event(MessageEvent(message=TextMessage(text="hi")))
+    bot.process_event(MessageEvent(message=StickerMessage()))
+    bot.process_event(FollowEvent())
+
+    assert calls == ["postback", "text", "message"]
+
+
+def test_handlers_are_registered():
+    assert bot._event_handlers[(PostbackEvent, None)] is bot.handle_postback
+    assert bot._event_handlers[(MessageEvent, TextMessage)] is bot.handle_message
+
+
+def test_same_key_runs_in_order_one_at_a_time():
+    executor = KeyedExecutor(max_workers=4)
+    done = threading.Event()
+    seen = []
+    running = []
+
+    def task(key, i):
+        running.append(key)
+        assert running.count(key) == 1
+        seen.append((key, i))
+        running.remove(key)
+        if len(seen) == 40:
+            done.set()
+
+    for i in range(20):
+        for key in ("U1", "U2"):
+            assert executor.submit(key, task, key, i)
+    assert done.wait(5)
+
+    for key in ("U1", "U2"):
+        assert [i for k, i in seen if k == key] == list(range(20))
+
+
+def test_full_queue_falls_back_to_the_caller():
+    assert not KeyedExecutor(max_workers=0).submit("U1", print)
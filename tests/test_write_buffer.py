@@ -0,0 +1,76 @@
+import pytest
+
+from services.gsheet import GSheetService
+from services.job import JobService
+
+
+def test_updates_are_sent_in_one_call(doc):
+    a = GSheetService.append("jobs", {"job_id": "J1", "status": "OPEN"})
+    b = GSheetService.append("jobs", {"job_id": "J2", "status": "OPEN"})
+    doc.calls.clear()
+
+    with GSheetService.write_buffer():
+        GSheetService.update_fields("jobs", a, {"status": "CLOSED"})
+        GSheetService.update_fields("jobs", b, {"status": "CLOSED"})
+        # 書き込む前でも読み込みには反映されている
+        assert GSheetService.get_row("jobs", a)["status"] == "CLOSED"
+        assert doc.api_calls("batch_update") == []
+
+    assert doc.api_calls("batch_update") == ["batch_update"]
+    assert doc.calls[-1][2]["value_input_option"] == "USER_ENTERED"
+    status = doc["jobs"].values[0].index("status")
+    assert [doc["jobs"].values[r - 1][status] for r in (a, b)] == [
+        "CLOSED",
+        "CLOSED",
+    ]
+
+
+def test_several_sheets_use_one_values_batch_update(doc):
+    job = GSheetService.append("jobs", {"job_id": "J1", "status": "OPEN"})
+    mission = GSheetService.append("missions", {"mission_id": "M1"})
+    doc.calls.clear()
+
+    with GSheetService.write_buffer():
+        GSheetService.update_fields("jobs", job, {"status": "CLOSED"})
+        GSheetService.update_fields("missions", mission, {"status": "COMPLETED"})
+
+    assert doc.api_calls("batch_update", "values_batch_update") == [
+        "values_batch_update"
+    ]
+
+
+def test_flush_writes_raises_and_drops_the_snapshot(doc):
+    row_index = GSheetService.append("jobs", {"job_id": "J1", "status": "OPEN"})
+    doc["jobs"].fail = RuntimeError("quota")
+
+    with pytest.raises(RuntimeError):
+        with GSheetService.write_buffer():
+            GSheetService.update_fields("jobs", row_index, {"status": "CLOSED"})
+            GSheetService.flush_writes()
+
+    # 送れなかった値は読み込みにも残らない
+    assert GSheetService.get_row("jobs", row_index)["status"] == "OPEN"
+
+
+def test_error_on_exit_is_raised(doc):
+    row_index = GSheetService.append("jobs", {"job_id": "J1", "status": "OPEN"})
+    doc["jobs"].fail = RuntimeError("quota")
+
+    with pytest.raises(RuntimeError):
+        with GSheetService.write_buffer():
+            GSheetService.update_fields("jobs", row_index, {"status": "CLOSED"})
+
+
+def test_guarded_approval_does_not_pay_when_the_write_fails(doc):
+    GSheetService.append("users", {"user_id": "U1", "display_name": "A"})
+    GSheetService.append(
+        "jobs", {"job_id": "J1", "reward": 50, "status": "REVIEW", "worker_id": "U1"}
+    )
+    doc["jobs"].fail = RuntimeError("quota")
+
+    with GSheetService.write_buffer():
+        ok, _ = JobService.approve_job("J1")
+
+    assert not ok
+    assert GSheetService.get_rows("transactions") == []
+    assert GSheetService.get_rows("jobs")[0]["status"] == "REVIEW"
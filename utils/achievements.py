@@ -1,6 +1,7 @@
 from enum import Enum
 from typing import List, Dict, Optional
 import datetime
+import functools
 
 
 class AchievementType(Enum):
@@ -139,7 +140,12 @@ class AchievementManager:
         unlocked_set = (
             set(str(unlocked_ids_str).split(",")) if unlocked_ids_str else set()
         )
+        # 獲得済みの組み合わせごとに1度だけ組み立てる（返り値は共有されるので書き換えないこと）
+        return AchievementManager._flex_grid(frozenset(unlocked_set))
 
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _flex_grid(unlocked_set):
         contents = []
         # 定義順にループして表示
         for ach_enum, ach_obj in ACHIEVEMENT_MASTER.items():
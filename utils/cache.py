@@ -1,64 +1,197 @@
+import threading
 import time
+from collections import OrderedDict
 from functools import wraps
 
+_MISSING = object()
 
-class SimpleCache:
-    def __init__(self, ttl=300):
-        self.ttl = ttl
-        self.cache = {}
 
-    def get(self, key):
-        if key in self.cache:
-            val, timestamp = self.cache[key]
-            if time.time() - timestamp < self.ttl:
-                return val
-            else:
-                del self.cache[key]
-        return None
+class _Flight:
+    """読み込み中の1件。同じキーを待つスレッドはこれの完了を待つ"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    LRU + TTL のキャッシュ（スレッドセーフ）。
+
+    - maxsize を超えたら最も使われていないものから捨てる
+    - 同じキーの読み込みは1回だけ走らせ、他のスレッドはその結果を待つ (single-flight)
+    - 期限切れから stale_ttl 秒までは古い値を返しつつ裏で読み直す (stale-while-revalidate)
+    - 空の結果 ([] / {} / None) も negative_ttl 秒だけキャッシュする
+    """
+
+    def __init__(self, ttl=300, maxsize=1024, stale_ttl=0, negative_ttl=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # {key: (値, 期限)}
+        self._flights = {}
+        self._generation = 0
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "loads": 0,
+            "load_errors": 0,
+        }
+
+    @staticmethod
+    def _is_negative(value):
+        return value is None or value == [] or value == {}
+
+    def _lookup(self, key, now):
+        """(値, 新鮮か) を返す。使えない場合は (_MISSING, False)"""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING, False
+        value, expires_at = entry
+        if now < expires_at:
+            self._data.move_to_end(key)
+            return value, True
+        if now < expires_at + self.stale_ttl:
+            return value, False
+        del self._data[key]
+        return _MISSING, False
+
+    def _store(self, key, value, now):
+        ttl = self.negative_ttl if self._is_negative(value) else self.ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (value, now + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, fresh = self._lookup(key, time.time())
+            if value is _MISSING or not fresh:
+                self._stats["misses"] += 1
+                return default
+            self._stats["hits"] += 1
+            return value
 
     def set(self, key, value):
-        self.cache[key] = (value, time.time())
+        with self._lock:
+            self._store(key, value, time.time())
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
 
     def clear(self):
-        self.cache = {}
+        with self._lock:
+            self._data.clear()
+            # 読み込み中の結果がクリア前の内容で上書きしないようにする
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._data))
+
+    def get_or_load(self, key, loader):
+        """キャッシュになければ loader() で読み込む（同じキーの読み込みは1回だけ）"""
+        with self._lock:
+            value, fresh = self._lookup(key, time.time())
+            if fresh:
+                self._stats["hits"] += 1
+                return value
+            if value is not _MISSING:
+                # 期限切れだが猶予内: 古い値を返し、裏で1回だけ読み直す
+                self._stats["stale_hits"] += 1
+                if key not in self._flights:
+                    flight = self._flights[key] = _Flight()
+                    threading.Thread(
+                        target=self._load,
+                        args=(key, loader, flight, self._generation),
+                        daemon=True,
+                    ).start()
+                return value
+
+            self._stats["misses"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+
+        if leader:
+            self._load(key, loader, flight, generation)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _load(self, key, loader, flight, generation):
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+        with self._lock:
+            self._stats["loads"] += 1
+            if flight.error is not None:
+                self._stats["load_errors"] += 1
+            elif generation == self._generation:
+                self._store(key, flight.value, time.time())
+            self._flights.pop(key, None)
+        flight.done.set()
+
+
+# 互換用の名前
+SimpleCache = TTLCache
 
 
 # グローバルキャッシュインスタンス
 # 商品リストはあまり変わらないので長め (10分) -> 変更頻度を考慮して1分に短縮
-shop_items_cache = SimpleCache(ttl=60)
+shop_items_cache = TTLCache(ttl=60, maxsize=16, stale_ttl=60)
 
 # ジョブリストはステータスが変わるので短め (1分)
-job_list_cache = SimpleCache(ttl=60)
+# ユーザー別の担当ジョブも入るので件数に上限を設ける
+job_list_cache = TTLCache(ttl=60, maxsize=512, negative_ttl=30)
+
+# ステータス画面などの描画結果 (入力のダイジェストがキーなので、内容が変われば別キーになる)
+flex_render_cache = TTLCache(ttl=600, maxsize=256)
 
 # ユーザーの状態管理 (5分)
-user_state_cache = SimpleCache(ttl=300)
+user_state_cache = TTLCache(ttl=300, maxsize=1024)
 
 
 def cached(cache_instance, key_func=None):
     """
     関数の結果をキャッシュするデコレータ
-    :param cache_instance: SimpleCacheのインスタンス
-    :param key_func: 引数からキャッシュキーを生成する関数 (省略時は引数なしとみなす)
+    :param cache_instance: TTLCacheのインスタンス
+    :param key_func: 引数からキャッシュキーを生成する関数 (省略時は関数名と引数から作る。
+        引数が hash できない場合はキャッシュせずに呼ぶので、必要なら key_func を渡す)
     """
 
     def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             if key_func:
                 key = key_func(*args, **kwargs)
+            elif args or kwargs:
+                key = (name, args, tuple(sorted(kwargs.items())))
             else:
                 # 引数がない場合は関数名を含めてユニークにする
-                key = f"{func.__module__}.{func.__name__}"
-
-            cached_val = cache_instance.get(key)
-            if cached_val is not None:
-                # print(f"Cache Hit: {func.__name__} key={key}")
-                return cached_val
-
-            # print(f"Cache Miss: {func.__name__} key={key}")
-            result = func(*args, **kwargs)
-            cache_instance.set(key, result)
-            return result
+                key = name
+            try:
+                hash(key)
+            except TypeError:
+                # dict / list など hash できない引数ではキャッシュせずにそのまま呼ぶ
+                return func(*args, **kwargs)
+            return cache_instance.get_or_load(key, lambda: func(*args, **kwargs))
 
         return wrapper
 
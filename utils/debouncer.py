@@ -1,31 +1,87 @@
+import os
+import threading
 import time
 
 
 class Debouncer:
-    _cache = {}
-    _ttl = 5.0  # 5秒間は同じ操作を無視
+    """
+    同じユーザーの同じ操作（連打）を一定時間無視する（UX のための間引き）。
+    LINE の再送の除外は blueprints/bot で webhookEventId を見て行う。
+
+    ロック中のキーは期限ごとのタイミングホイール（RESOLUTION 秒刻みのバケツの輪）に入れ、
+    呼ばれるたびに過ぎた分のバケツだけを捨てるので、期限切れの掃除は償却 O(1)。
+    保持数は MAX_ENTRIES を上限とし、超えたら期限の近いものから捨てる。
+    """
+
+    # 操作の種類ごとのロック秒数
+    TTLS = {"postback": 5.0, "message": 3.0}
+    DEFAULT_TTL = 5.0
+    RESOLUTION = 0.5
+    MAX_ENTRIES = int(os.environ.get("DEBOUNCE_MAX_ENTRIES", "10000"))
+
+    _lock = threading.Lock()
+    _expires = {}  # {(user_id, action_key): 期限}
+    _slots = None
+    _tick = None
+
+    @classmethod
+    def _init_wheel(cls, now):
+        max_ttl = max([cls.DEFAULT_TTL, *cls.TTLS.values()])
+        size = int(max_ttl / cls.RESOLUTION) + 2
+        cls._slots = [set() for _ in range(size)]
+        cls._tick = int(now / cls.RESOLUTION)
 
     @classmethod
-    def is_locked(cls, user_id, action_key):
+    def _advance(cls, now):
+        """現在時刻までのバケツを回し、期限切れのキーを捨てる"""
+        tick = int(now / cls.RESOLUTION)
+        size = len(cls._slots)
+        # 長く呼ばれなかった場合も一周分だけ見れば足りる
+        for t in range(max(cls._tick + 1, tick - size + 1), tick + 1):
+            slot = cls._slots[t % size]
+            for key in slot:
+                if cls._expires.get(key, now + 1) <= now:
+                    del cls._expires[key]
+            slot.clear()
+        cls._tick = max(cls._tick, tick)
+
+    @classmethod
+    def _evict(cls):
+        """上限を超えた分を、期限の近いバケツから捨てる"""
+        size = len(cls._slots)
+        for i in range(1, size + 1):
+            slot = cls._slots[(cls._tick + i) % size]
+            while slot and len(cls._expires) > cls.MAX_ENTRIES:
+                cls._expires.pop(slot.pop(), None)
+            if len(cls._expires) <= cls.MAX_ENTRIES:
+                return
+
+    @classmethod
+    def is_locked(cls, user_id, action_key, kind=None):
         """
         指定されたユーザーとアクションの組み合わせがロックされているか確認。
         ロックされていなければロックしてFalseを返す。
         ロックされていればTrueを返す。
+        kind ("postback" / "message") でロック秒数を切り替える。
         """
         now = time.time()
-        key = f"{user_id}:{action_key}"
-
-        # 期限切れのエントリを削除（簡易的なGC）
-        # 毎回全走査は重いので、対象キーだけチェックし、
-        # たまに全体を掃除するロジックが良いが、
-        # ここではシンプルに対象キーのTTLチェックのみ行う。
+        ttl = cls.TTLS.get(kind, cls.DEFAULT_TTL)
+        key = (user_id, action_key)
 
-        last_time = cls._cache.get(key)
+        with cls._lock:
+            if cls._slots is None:
+                cls._init_wheel(now)
+            cls._advance(now)
 
-        if last_time:
-            if now - last_time < cls._ttl:
+            expires_at = cls._expires.get(key)
+            if expires_at and expires_at > now:
                 return True  # ロック中
 
-        # 新しいタイムスタンプで更新
-        cls._cache[key] = now
-        return False
+            expires_at = now + ttl
+            cls._expires[key] = expires_at
+            # 期限のバケツ（切り上げ）に入れる
+            tick = -int(-expires_at // cls.RESOLUTION)
+            cls._slots[tick % len(cls._slots)].add(key)
+            if len(cls._expires) > cls.MAX_ENTRIES:
+                cls._evict()
+            return False
@@ -0,0 +1,69 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+# 互いに依存しない読み込みを並列に走らせるスレッドプール
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "8"))
+# 1つの読み込みを待つ秒数の既定値
+FANOUT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT", "10"))
+
+_pool = ThreadPoolExecutor(
+    max_workers=max(1, FANOUT_WORKERS), thread_name_prefix="fanout"
+)
+_local = threading.local()
+
+
+def _run(ctx, loader):
+    _local.inside = True
+    try:
+        # 呼び出し元の RequestContext などを引き継いで実行する
+        return ctx.run(loader)
+    finally:
+        _local.inside = False
+
+
+def load_parallel(loaders, defaults=None, timeout=None, timeouts=None):
+    """
+    {名前: 引数なしの関数} を並列に呼び、({名前: 結果}, {名前: 例外}) を返す。
+    - 所要時間は合計ではなく一番遅い呼び出しの分になる
+    - 失敗・タイムアウトした分は defaults の値（なければ None）にして残りは返す
+    - timeout は呼び出しごとの待ち時間（timeouts で名前ごとに上書きできる）
+    プールのスレッドの中から呼ばれた場合や FANOUT_WORKERS=0 のときは順番に呼ぶ。
+    """
+    defaults = defaults or {}
+    timeouts = timeouts or {}
+    timeout = FANOUT_TIMEOUT if timeout is None else timeout
+    results = {}
+    errors = {}
+
+    if FANOUT_WORKERS <= 0 or getattr(_local, "inside", False):
+        for name, loader in loaders.items():
+            try:
+                results[name] = loader()
+            except Exception as e:
+                print(f"Load Error ({name}): {e}")
+                errors[name] = e
+                results[name] = defaults.get(name)
+        return results, errors
+
+    started = time.monotonic()
+    futures = {
+        name: _pool.submit(_run, contextvars.copy_context(), loader)
+        for name, loader in loaders.items()
+    }
+    for name, future in futures.items():
+        deadline = started + timeouts.get(name, timeout)
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeout as e:
+            print(f"Load Timeout ({name})")
+            errors[name] = e
+            results[name] = defaults.get(name)
+        except Exception as e:
+            print(f"Load Error ({name}): {e}")
+            errors[name] = e
+            results[name] = defaults.get(name)
+    return results, errors
@@ -0,0 +1,63 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class KeyedExecutor:
+    """
+    キー（ユーザーIDなど）ごとに投入順を守りながら、スレッドプールで並列に処理する。
+    同じキーのタスクは同時に1つしか走らず、別のキーのタスクは並列に走る。
+    待ち件数が max_pending を超えたら submit は False を返す（呼び出し側で同期処理する）。
+    """
+
+    def __init__(self, max_workers=4, max_pending=1000, name="worker"):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix=name
+        )
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._pending = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        if self.max_workers <= 0:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                # 同じキーの処理中なので、その後ろに並べる
+                queue.append((fn, args, kwargs))
+                return True
+            self._queues[key] = deque([(fn, args, kwargs)])
+        self._pool.submit(self._run, key)
+        return True
+
+    def _run(self, key):
+        with self._lock:
+            fn, args, kwargs = self._queues[key][0]
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Worker Error ({key}): {e}")
+        finally:
+            with self._lock:
+                queue = self._queues[key]
+                queue.popleft()
+                self._pending -= 1
+                has_next = bool(queue)
+                if not has_next:
+                    del self._queues[key]
+            if has_next:
+                # 他のキーを待たせないよう、1件ずつプールに戻す
+                self._pool.submit(self._run, key)
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
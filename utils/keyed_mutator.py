@@ -0,0 +1,64 @@
+import threading
+
+
+class _Slot:
+    __slots__ = ("payload", "done", "result")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.done = False
+        self.result = None
+
+
+class KeyedMutator:
+    """
+    キー（user_id など）ごとに変更を直列化し、続けて届いた変更を1回の書き込みにまとめる。
+
+    submit したスレッドはキーのロックを待ち、ロックを取れたら
+    それまでに溜まった同じキーの変更をすべて applier(key, payloads) に渡す。
+    applier は payloads と同じ順の結果リストを返す。
+    後から来たスレッドは、自分の変更が先に処理済みならその結果を受け取って戻る。
+    別のキーの変更は並列に走る。
+    """
+
+    def __init__(self, applier):
+        self._applier = applier
+        self._lock = threading.Lock()
+        # {key: [キーのロック, 未処理の Slot リスト, 参照数]}
+        self._keys = {}
+
+    def submit(self, key, payload):
+        slot = _Slot(payload)
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                state = self._keys[key] = [threading.Lock(), [], 0]
+            state[1].append(slot)
+            state[2] += 1
+
+        key_lock, pending, _ = state
+        try:
+            with key_lock:
+                if not slot.done:
+                    with self._lock:
+                        batch = list(pending)
+                        pending.clear()
+                    self._run(key, batch)
+        finally:
+            with self._lock:
+                state[2] -= 1
+                if state[2] == 0:
+                    del self._keys[key]
+        return slot.result
+
+    def _run(self, key, batch):
+        try:
+            results = self._applier(key, [s.payload for s in batch])
+        except Exception as e:
+            print(f"Mutation Error ({key}): {e}")
+            results = None
+        if not results or len(results) != len(batch):
+            results = [False] * len(batch)
+        for slot, result in zip(batch, results):
+            slot.result = result
+            slot.done = True
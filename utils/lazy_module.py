@@ -0,0 +1,24 @@
+import importlib
+import threading
+
+from utils.startup_profile import startup_profile
+
+
+class LazyModule:
+    """最初に属性を参照したときに import するモジュールの代理"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    with startup_profile.timed(f"import {self._name}"):
+                        self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
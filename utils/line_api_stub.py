@@ -0,0 +1,120 @@
+"""
+LINE Messaging API の送信系 (reply / push / multicast) だけを真似るローカルサーバー。
+LINE_API_ENDPOINT=http://127.0.0.1:8089 で起動すれば、実際に送らずに送信の流れを試せる。
+
+    # サーバーとして起動（429 / 500 を 5% ずつ返す）
+    python -m utils.line_api_stub --port 8089 --rate-limit 0.05 --error 0.05
+
+    # スループット計測（スタブを立てて LineDispatcher で N 件 push する）
+    python -m utils.line_api_stub --bench 2000 --users 300
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+from flask import Flask, jsonify, request
+
+
+def create_app(rate_limit=0.0, error=0.0, latency=0.0):
+    app = Flask(__name__)
+    lock = threading.Lock()
+    stats = {"requests": 0, "delivered": 0, "rejected": 0, "retry_keys": set()}
+
+    def handle(path):
+        time.sleep(latency)
+        body = request.get_json(force=True)
+        roll = random.random()
+        with lock:
+            stats["requests"] += 1
+            if roll < rate_limit:
+                stats["rejected"] += 1
+                return (
+                    jsonify({"message": "The API rate limit has been exceeded."}),
+                    429,
+                )
+            if roll < rate_limit + error:
+                stats["rejected"] += 1
+                return jsonify({"message": "Internal error"}), 500
+
+            retry_key = request.headers.get("X-Line-Retry-Key")
+            if retry_key:
+                if retry_key in stats["retry_keys"]:
+                    return jsonify({"message": "duplicate retry key"}), 409
+                stats["retry_keys"].add(retry_key)
+
+            if path == "multicast":
+                if len(body.get("to", [])) > 500:
+                    return jsonify({"message": "too many recipients"}), 400
+                stats["delivered"] += len(body["to"])
+            else:
+                stats["delivered"] += 1
+        return jsonify({}), 200
+
+    @app.route("/v2/bot/message/<path>", methods=["POST"])
+    def message(path):
+        if path not in ("reply", "push", "multicast"):
+            return jsonify({"message": "Not found"}), 404
+        return handle(path)
+
+    @app.route("/stats")
+    def get_stats():
+        with lock:
+            return jsonify({k: v for k, v in stats.items() if k != "retry_keys"})
+
+    app.stats = stats
+    return app
+
+
+def bench(count, users, port, **options):
+    """スタブを立て、count 件の push（宛先 users 人・内容 10 種類）を送り切る時間を測る"""
+    from werkzeug.serving import make_server
+    from linebot import LineBotApi
+    from linebot.models import TextSendMessage
+
+    from utils.line_dispatcher import LineDispatcher
+
+    app = create_app(**options)
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    api = LineBotApi("stub", endpoint=f"http://127.0.0.1:{port}")
+    dispatcher = LineDispatcher(api)
+    user_ids = [f"U{i:032x}" for i in range(users)]
+
+    started = time.monotonic()
+    for i in range(count):
+        dispatcher.push_message(
+            user_ids[i % users], TextSendMessage(text=f"お知らせ {i % 10}")
+        )
+    dispatcher.flush(timeout=600)
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    result = dict(dispatcher.stats(), seconds=round(elapsed, 2))
+    result["delivered"] = app.stats["delivered"]
+    print(json.dumps(result, ensure_ascii=False))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LINE Messaging API stub")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="429 を返す割合")
+    parser.add_argument("--error", type=float, default=0.0, help="500 を返す割合")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答までの秒数")
+    parser.add_argument("--bench", type=int, default=0, help="計測で送る push の件数")
+    parser.add_argument("--users", type=int, default=100, help="計測の宛先の人数")
+    args = parser.parse_args()
+
+    options = {
+        "rate_limit": args.rate_limit,
+        "error": args.error,
+        "latency": args.latency,
+    }
+    if args.bench:
+        bench(args.bench, args.users, args.port, **options)
+    else:
+        create_app(**options).run(port=args.port, threaded=True)
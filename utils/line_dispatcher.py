@@ -0,0 +1,327 @@
+import datetime
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import requests
+from linebot.exceptions import LineBotApiError
+
+# LINE のユーザー / グループ / トークルーム ID (仮想ユーザーなどは送れないので除く)
+_LINE_ID = re.compile(r"^[UCR][0-9a-f]{32}$")
+
+
+class TokenBucket:
+    """1秒あたり rate 回、最大 capacity 回まで溜められるトークンバケット"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンが1つ取れるまで待つ"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class LineDispatcher:
+    """
+    LINE への送信 (reply / push / multicast) を裏のスレッドでまとめて送る。
+
+    - 同じ内容の push・multicast は少しの間 (window 秒) 溜めて、宛先をまとめた
+      multicast (最大500人) にする。同じ宛先への通知は受け付けた順に届ける
+    - API の呼び出しはトークンバケットで LINE のレート制限内に抑える
+    - 429 / 5xx / 通信エラーは間隔を倍々に空けて（Retry-After があればそれ以上）
+      再送する（X-Line-Retry-Key で二重送信を防ぐ）
+    呼び出し側には例外を投げないので、送信の失敗でハンドラの処理は止まらない。
+    SDK の retry_key は api のヘッダーを書き換えるので、api は送信専用の
+    LineBotApi を渡す。
+    """
+
+    MULTICAST_LIMIT = 500
+
+    def __init__(self, api, rate=None, max_retries=None, window=None, sync=None):
+        self.api = api
+        self.rate = rate or float(os.environ.get("LINE_API_RATE", "100"))
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.environ.get("LINE_API_MAX_RETRIES", "4"))
+        )
+        self.window = (
+            window
+            if window is not None
+            else float(os.environ.get("LINE_DISPATCH_WINDOW", "0.2"))
+        )
+        self.sync = (
+            sync if sync is not None else os.environ.get("LINE_DISPATCH_ASYNC") == "0"
+        )
+        self._bucket = TokenBucket(self.rate)
+        self._cond = threading.Condition()
+        # api のヘッダー (X-Line-Retry-Key) を1回の呼び出しの間だけ使う
+        self._api_lock = threading.Lock()
+        self._replies = deque()
+        # 送る順の [(messages, notification_disabled, [宛先, ...]), ...]
+        self._groups = []
+        # {内容のキー: まだ宛先を足せるグループの位置}
+        self._open = {}
+        # {宛先: その宛先が入っている最後のグループの位置}
+        self._last = {}
+        self._busy = False
+        self._thread = None
+        self._stop = False
+        self._stats = {
+            "requested": 0,
+            "api_calls": 0,
+            "retries": 0,
+            "failed": 0,
+            "skipped": 0,
+        }
+
+    # --- 受付 ---
+
+    @staticmethod
+    def _as_list(messages):
+        return list(messages) if isinstance(messages, (list, tuple)) else [messages]
+
+    def reply_message(self, reply_token, messages, notification_disabled=False):
+        messages = self._as_list(messages)
+        if self.sync:
+            self._send_reply(reply_token, messages, notification_disabled)
+            return
+        with self._cond:
+            self._stats["requested"] += 1
+            self._replies.append((reply_token, messages, notification_disabled))
+            self._wake()
+
+    def push_message(self, to, messages, notification_disabled=False):
+        self.multicast([to], messages, notification_disabled)
+
+    def multicast(self, to, messages, notification_disabled=False):
+        messages = self._as_list(messages)
+        recipients = [str(u) for u in to if _LINE_ID.match(str(u))]
+        skipped = [str(u) for u in to if not _LINE_ID.match(str(u))]
+        if skipped:
+            print(f"Line Dispatch Skipped: {skipped}")
+            with self._cond:
+                self._stats["skipped"] += len(skipped)
+        if not recipients:
+            return
+        if self.sync:
+            self._send_group(messages, notification_disabled, recipients)
+            return
+
+        key = json.dumps(
+            [[m.as_json_dict() for m in messages], notification_disabled],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        with self._cond:
+            self._stats["requested"] += len(recipients)
+            for to in recipients:
+                index = self._open.get(key)
+                # その宛先に後から受け付けた通知が先に届かないよう、
+                # より後ろのグループに入っている宛先は新しいグループに回す
+                if index is None or self._last.get(to, -1) > index:
+                    index = self._open[key] = len(self._groups)
+                    self._groups.append((messages, notification_disabled, []))
+                self._groups[index][2].append(to)
+                self._last[to] = index
+            self._wake()
+
+    def _wake(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(
+                target=self._run, name="line-dispatcher", daemon=True
+            )
+            self._thread.start()
+        self._cond.notify_all()
+
+    def flush(self, timeout=10):
+        """溜まっている分を送り終えるまで待つ（送り終えたら True）"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._replies or self._groups or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=10):
+        self.flush(timeout)
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats)
+
+    # --- 送信スレッド ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._replies or self._groups or self._stop):
+                    self._cond.wait()
+                if self._stop and not (self._replies or self._groups):
+                    return
+                if not self._replies:
+                    # 同じ内容の push が続けて来るのを少し待ってまとめる
+                    deadline = time.monotonic() + self.window
+                    while not self._stop and time.monotonic() < deadline:
+                        self._cond.wait(deadline - time.monotonic())
+                replies, self._replies = self._replies, deque()
+                groups, self._groups = self._groups, []
+                self._open, self._last = {}, {}
+                self._busy = True
+            try:
+                # reply トークンは期限が短いので先に送る
+                for reply in replies:
+                    self._send_reply(*reply)
+                for messages, notification_disabled, recipients in groups:
+                    self._send_group(messages, notification_disabled, recipients)
+            except Exception as e:
+                print(f"Line Dispatch Error: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _send_reply(self, reply_token, messages, notification_disabled):
+        self._call(
+            "reply",
+            lambda retry_key: self.api.reply_message(
+                reply_token, messages, notification_disabled=notification_disabled
+            ),
+            retry_key=False,
+        )
+
+    def _send_group(self, messages, notification_disabled, recipients):
+        # multicast はユーザー宛てのみ。グループ・トークルームは1件ずつ push する
+        # 同じ人に同じ内容を2回送る場合は、別の multicast に分ける
+        rounds = []
+        seen = {}
+        for to in recipients:
+            if not to.startswith("U"):
+                self._push(to, messages, notification_disabled)
+                continue
+            n = seen[to] = seen.get(to, -1) + 1
+            if n == len(rounds):
+                rounds.append([])
+            rounds[n].append(to)
+        chunks = [
+            users[i : i + self.MULTICAST_LIMIT]
+            for users in rounds
+            for i in range(0, len(users), self.MULTICAST_LIMIT)
+        ]
+        for chunk in chunks:
+            if len(chunk) == 1:
+                self._push(chunk[0], messages, notification_disabled)
+                continue
+            status = self._call(
+                "multicast",
+                lambda retry_key: self.api.multicast(
+                    chunk,
+                    messages,
+                    retry_key=retry_key,
+                    notification_disabled=notification_disabled,
+                ),
+            )
+            if status == 400:
+                # 宛先の1人が原因で全員に届かないのを避けるため1人ずつ送り直す
+                for user_id in chunk:
+                    self._push(user_id, messages, notification_disabled)
+
+    def _push(self, to, messages, notification_disabled):
+        self._call(
+            "push",
+            lambda retry_key: self.api.push_message(
+                to,
+                messages,
+                retry_key=retry_key,
+                notification_disabled=notification_disabled,
+            ),
+        )
+
+    @staticmethod
+    def _retry_after(error):
+        """429 / 503 の Retry-After ヘッダー（秒数か日時）を秒にする。なければ None"""
+        headers = {k.lower(): v for k, v in (error.headers or {}).items()}
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        now = datetime.datetime.now(at.tzinfo or datetime.timezone.utc)
+        return max(0.0, (at - now).total_seconds())
+
+    def _call(self, name, send, retry_key=True):
+        """
+        send(retry_key) で API を呼ぶ。成功なら 200、失敗ならそのステータス
+        （通信エラーは None）を返す。再送しても同じ Retry-Key を使う。
+        """
+        key = str(uuid.uuid4()) if retry_key else None
+        status = None
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._cond:
+                    self._stats["retries"] += 1
+                # 0.5, 1, 2, 4 ... 秒 + ゆらぎ。Retry-After の指定があればそれ以上待つ
+                delay = 0.5 * 2 ** (attempt - 1) * (1 + random.random() / 2)
+                time.sleep(max(delay, retry_after or 0))
+            self._bucket.acquire()
+            with self._cond:
+                self._stats["api_calls"] += 1
+            try:
+                with self._api_lock:
+                    try:
+                        send(key)
+                    finally:
+                        # SDK が api.headers に残す Retry-Key を次の呼び出しに持ち越さない
+                        self.api.headers.pop("X-Line-Retry-Key", None)
+                return 200
+            except LineBotApiError as e:
+                status = e.status_code
+                if status == 409 and retry_key:
+                    # 同じ Retry-Key のリクエストは受け付け済み
+                    return 200
+                if status != 429 and status < 500:
+                    break
+                retry_after = self._retry_after(e)
+            except requests.RequestException as e:
+                status = None
+                retry_after = None
+                print(f"Line API Connection Error: {e}")
+        with self._cond:
+            self._stats["failed"] += 1
+        print(f"Line API Error ({name}): status={status}")
+        return status
@@ -0,0 +1,45 @@
+import fcntl
+import os
+import threading
+
+
+class ProcessLock:
+    """
+    同じホストの複数プロセス（gunicorn のワーカーなど）のうち1つだけが持てるロック。
+    ファイルの flock を使うので、ストレージや状態の保存先の設定に関係なく効き、
+    持っていたプロセスが落ちれば自動で外れる。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """待たずに取りに行き、取れたら（既に持っていても）True"""
+        with self._lock:
+            if self._fd is not None:
+                return True
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is None:
+                return
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,35 @@
+import contextvars
+from contextlib import contextmanager
+
+
+class RequestContext:
+    """
+    1つの Webhook イベント / HTTP リクエストの間だけ有効なデータコンテキスト。
+    一度読んだワークシートのスナップショットを覚えておき、
+    同じリクエスト内で同じデータを何度も読みに行かないようにする。
+    """
+
+    _current = contextvars.ContextVar("request_context", default=None)
+
+    def __init__(self):
+        # このリクエスト内で一度読み込んだワークシート
+        self.snapshots = set()
+
+    @classmethod
+    def current(cls):
+        return cls._current.get()
+
+    @classmethod
+    @contextmanager
+    def scope(cls):
+        """with RequestContext.scope(): の間、コンテキストを有効にする（入れ子は外側を共有）"""
+        ctx = cls._current.get()
+        if ctx is not None:
+            yield ctx
+            return
+        ctx = cls()
+        token = cls._current.set(ctx)
+        try:
+            yield ctx
+        finally:
+            cls._current.reset(token)
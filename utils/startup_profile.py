@@ -0,0 +1,139 @@
+import importlib.abc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# STARTUP_PROFILE=1 のとき、モジュールごとの import 時間も記録する
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE") == "1"
+
+
+class _TimedLoader:
+    """exec_module の時間を測るローダーの代理（それ以外は元のローダーに任せる）"""
+
+    def __init__(self, loader, timer):
+        self._loader = loader
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def exec_module(self, module):
+        with self._timer.measure(module.__name__):
+            self._loader.exec_module(module)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    import されたモジュールごとに (配下の import を含む時間, 自身だけの時間) を記録する。
+    python -X importtime の cumulative / self と同じ考え方。
+    """
+
+    def __init__(self):
+        self.modules = {}  # {モジュール名: [累計秒, 自身の秒]}
+        self._local = threading.local()
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if (
+            loader is not None
+            and hasattr(loader, "exec_module")
+            and spec.origin not in ("built-in", "frozen")
+        ):
+            spec.loader = _TimedLoader(loader, self)
+        return spec
+
+    @contextmanager
+    def measure(self, name):
+        stack = self._local.__dict__.setdefault("stack", [])
+        entry = [0.0]  # 配下の import にかかった秒
+        stack.append(entry)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            self.modules[name] = [elapsed, elapsed - entry[0]]
+
+
+class StartupProfile:
+    """
+    起動からの経過を記録する。
+    - mark(name): その時点までの秒数（同じ名前は最初の1回だけ）
+    - timed(name): 処理にかかった秒数（同じ名前は最初の1回だけ。シートへの接続など）
+    /debug/startup で確認できる。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._marks = {}  # {名前: 起動からの秒}
+        self._timings = {}  # {名前: (開始時の起動からの秒, かかった秒)}
+        self._import_timer = None
+
+    def install_import_timer(self):
+        if self._import_timer is None:
+            self._import_timer = _ImportTimer()
+            sys.meta_path.insert(0, self._import_timer)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def mark(self, name):
+        if name in self._marks:
+            return
+        with self._lock:
+            self._marks.setdefault(name, self.elapsed())
+
+    @contextmanager
+    def timed(self, name):
+        if name in self._timings:
+            yield
+            return
+        started = self.elapsed()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._timings.setdefault(name, (started, self.elapsed() - started))
+
+    def report(self, limit=30):
+        with self._lock:
+            result = {
+                "uptime": round(self.elapsed(), 3),
+                "marks": {k: round(v, 3) for k, v in self._marks.items()},
+                "timings": {
+                    name: {"at": round(at, 3), "seconds": round(seconds, 3)}
+                    for name, (at, seconds) in sorted(
+                        self._timings.items(), key=lambda item: item[1][0]
+                    )
+                },
+            }
+        if self._import_timer is not None:
+            modules = sorted(
+                self._import_timer.modules.items(),
+                key=lambda item: item[1][0],
+                reverse=True,
+            )
+            result["imports"] = [
+                {"module": name, "cumulative": round(cum, 4), "self": round(own, 4)}
+                for name, (cum, own) in modules[:limit]
+            ]
+        return result
+
+
+startup_profile = StartupProfile()
+if STARTUP_PROFILE:
+    startup_profile.install_import_timer()
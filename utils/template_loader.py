@@ -1,42 +1,148 @@
 import json
 import os
+import re
+import threading
 
 TEMPLATE_DIR = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), "templates", "bot"
 )
 
+# 開発時はファイルの更新を検知して読み直す
+HOT_RELOAD = os.environ.get(
+    "TEMPLATE_HOT_RELOAD", os.environ.get("FLASK_DEBUG", "0")
+) in ("1", "true", "True")
+
+_PLACEHOLDER = re.compile(r"\$\{([^}]+)\}")
+
+
+class CompiledTemplate:
+    """
+    パース済みのテンプレート。
+    ${var} を含む文字列の位置 (dict のキー / list の添字の並び) と、
+    その文字列を固定部分と変数に分けたものを (path, parts) の組として持つ。
+    描画ではパース済みの JSON の dict / list だけをコピーし、各位置に文字列を埋め込む
+    （JSON を毎回パースし直すより速く、呼び出し側で書き換えてよい新しいオブジェクトを返す）。
+    """
+
+    def __init__(self, filename, data, mtime=None):
+        self.filename = filename
+        self.mtime = mtime
+        self.data = data
+        self.slots = []
+        self._collect(data, ())
+        self.variables = frozenset(
+            part for _, parts in self.slots for part in parts[1::2]
+        )
+
+    def _collect(self, node, path):
+        """${var} を含む文字列の位置と、その分割結果を slots に集める"""
+        if isinstance(node, dict):
+            for k, v in node.items():
+                self._collect(v, path + (k,))
+        elif isinstance(node, list):
+            for i, v in enumerate(node):
+                self._collect(v, path + (i,))
+        elif isinstance(node, str) and "${" in node:
+            # "a${x}b${y}" -> ["a", "x", "b", "y", ""] (奇数番目が変数名)
+            parts = _PLACEHOLDER.split(node)
+            if len(parts) > 1:
+                self.slots.append((path, parts))
+
+    def render(self, values):
+        def fill(parts):
+            out = []
+            for i, part in enumerate(parts):
+                if i % 2 == 0:
+                    out.append(part)
+                elif part in values:
+                    out.append(str(values[part]))
+                else:
+                    # 値が渡されなかった変数はそのまま残す
+                    out.append(f"${{{part}}}")
+            return "".join(out)
+
+        result = _copy(self.data)
+        for path, parts in self.slots:
+            if not path:
+                return fill(parts)
+            container = result
+            for key in path[:-1]:
+                container = container[key]
+            container[path[-1]] = fill(parts)
+        return result
+
+    def check(self, values):
+        """(不足している変数, 使われていない変数) を返す"""
+        names = set(values)
+        return self.variables - names, names - self.variables
+
+
+def _copy(node):
+    """dict / list だけを作り直す（文字列・数値などの値は共有してよい）"""
+    if isinstance(node, dict):
+        return {k: _copy(v) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_copy(v) for v in node]
+    return node
+
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def _compile(filename):
+    path = os.path.join(TEMPLATE_DIR, filename)
+    mtime = os.path.getmtime(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return CompiledTemplate(filename, data, mtime)
+
+
+def get_template(filename):
+    """コンパイル済みのテンプレートを取得（初回のみファイルを読む）"""
+    template = _templates.get(filename)
+    if template is not None and HOT_RELOAD:
+        path = os.path.join(TEMPLATE_DIR, filename)
+        if os.path.getmtime(path) != template.mtime:
+            template = None
+    if template is None:
+        template = _compile(filename)
+        with _lock:
+            _templates[filename] = template
+    return template
+
+
+def preload_templates():
+    """テンプレートディレクトリの JSON をまとめてコンパイルしておく"""
+    count = 0
+    for filename in sorted(os.listdir(TEMPLATE_DIR)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            get_template(filename)
+            count += 1
+        except Exception as e:
+            print(f"Error loading template {filename}: {e}")
+    return count
+
 
 def load_template(filename, **kwargs):
     """
     Loads a JSON template file and substitutes variables.
     Variables in the JSON should be in the format ${variable_name}.
     """
-    path = os.path.join(TEMPLATE_DIR, filename)
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return _recursive_replace(data, kwargs)
+        template = get_template(filename)
+        if HOT_RELOAD:
+            missing, unused = template.check(kwargs)
+            if missing:
+                print(f"Template {filename}: missing variables {sorted(missing)}")
+            if unused:
+                print(f"Template {filename}: unused variables {sorted(unused)}")
+        return template.render(kwargs)
     except FileNotFoundError:
         print(f"Template file not found: {filename}")
         return None
     except Exception as e:
         print(f"Error loading template {filename}: {e}")
         return None
-
-
-def _recursive_replace(data, replacements):
-    if isinstance(data, dict):
-        return {k: _recursive_replace(v, replacements) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [_recursive_replace(i, replacements) for i in data]
-    elif isinstance(data, str):
-        # Simple replacement of ${key} markers
-        # We iterate over replacements to ensure we catch all provided keys
-        result = data
-        for k, v in replacements.items():
-            placeholder = f"${{{k}}}"
-            if placeholder in result:
-                result = result.replace(placeholder, str(v))
-        return result
-    else:
-        return data